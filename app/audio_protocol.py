@@ -0,0 +1,84 @@
+"""Binary audio framing for the /ws/{user_id} WebSocket.
+
+Clients that connect with ``?protocol=binary`` exchange raw PCM in binary
+WebSocket frames instead of base64 strings inside JSON. Control and transcript
+messages stay JSON text frames in both modes.
+
+Every binary frame starts with a fixed 12-byte little-endian header followed by
+the 16-bit mono PCM payload:
+
+    offset  size  field
+    0       1     protocol version (PROTOCOL_VERSION)
+    1       1     frame type (FRAME_AUDIO)
+    2       2     generation, audio from server to client only, else 0
+    4       4     sequence number, per direction, wraps at 2**32
+    8       4     sample rate in Hz
+
+The header size is a multiple of 4 so the payload can be viewed directly as an
+Int16Array on the browser side.
+
+The generation counts the model's interruptions on a connection (wrapping at
+2**16). When the model is interrupted the server drops the audio it still has
+queued and sends a ``{"flush": true, "generation": n}`` JSON message; the
+client then clears its playback buffer and ignores any frame of an older
+generation that still arrives. Clients that ignore the field keep working.
+"""
+
+import struct
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+
+PROTOCOL_VERSION = 1
+
+FRAME_AUDIO = 1
+
+HEADER = struct.Struct("<BBHII")
+HEADER_SIZE = HEADER.size
+
+# Sample rates used by the browser recorder and the Live API output
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+# Declared uplink rates outside this range are rejected by decode_frame
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 96000
+
+
+def encode_audio_frame(seq, sample_rate, pcm, generation=0):
+    """Prepends the binary header to a chunk of PCM audio."""
+    return HEADER.pack(PROTOCOL_VERSION, FRAME_AUDIO, generation & 0xFFFF, seq & 0xFFFFFFFF, sample_rate) + pcm
+
+
+def decode_frame(data):
+    """Splits a binary frame into (frame_type, seq, sample_rate, payload)."""
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"Binary frame too short: {len(data)} bytes")
+    version, frame_type, _reserved, seq, sample_rate = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary protocol version: {version}")
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"Unsupported sample rate: {sample_rate} Hz")
+    return frame_type, seq, sample_rate, data[HEADER_SIZE:]
+
+
+def frame_generation(data):
+    """Reads the generation field of a binary frame header."""
+    return HEADER.unpack_from(data)[2]
+
+
+def next_generation(generation):
+    return (generation + 1) & 0xFFFF
+
+
+def is_older_generation(generation, current):
+    """True if generation precedes current, allowing for the 16-bit wraparound."""
+    return 0 < (current - generation) & 0xFFFF < 0x8000
+
+
+def sample_rate_from_mime_type(mime_type, default=OUTPUT_SAMPLE_RATE):
+    """Reads the rate parameter of an "audio/pcm;rate=24000" mime type."""
+    for param in mime_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key == "rate" and value.isdigit():
+            return int(value)
+    return default
@@ -0,0 +1,95 @@
+"""Side-by-side latency of the "retrieve" and "synthesize" query modes.
+
+Runs the same questions through KnowledgeBaseManager.query in both modes and
+prints per-mode latency percentiles, with questions answered from BM25 alone
+(no embedding call) broken out from hybrid ones. The answer cache is disabled,
+so every question is retrieved. Questions default to the numbered
+***question*** headings of fsm-faq.md. Needs GOOGLE_API_KEY, like the app.
+
+    python bench_rag_modes.py --faq ../fsm-faq.md --limit 20
+"""
+
+import argparse
+import re
+import statistics
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from rag_agent.answer_cache import AnswerCache
+from rag_agent.knowledge_base import (
+    KnowledgeBaseManager,
+    QUERY_MODE_RETRIEVE,
+    QUERY_MODE_SYNTHESIZE,
+)
+
+QUESTION_PATTERN = re.compile(r"^\s*\d+\.\s*\*\*\*(.+?)\*\*\*", re.MULTILINE)
+
+
+def load_questions(faq_path, limit):
+    with open(faq_path, encoding="utf-8") as f:
+        questions = [q.strip() for q in QUESTION_PATTERN.findall(f.read())]
+    return questions[:limit]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def time_mode(knowledge_base, questions, mode):
+    """Returns the latencies in ms and, for each, the QUERY_SOURCE_* that answered it."""
+    latencies = []
+    sources = []
+    knowledge_base.on_query = lambda _mode, source, _seconds: sources.append(source)
+    for question in questions:
+        start = time.perf_counter()
+        knowledge_base.query(question, mode=mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+    knowledge_base.on_query = None
+    return latencies, sources
+
+
+def print_row(label, latencies):
+    print(
+        f"{label:<22}"
+        f"{len(latencies):>6}"
+        f"{statistics.mean(latencies):>10.1f}"
+        f"{percentile(latencies, 50):>10.1f}"
+        f"{percentile(latencies, 95):>10.1f}"
+        f"{max(latencies):>10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faq", default="fsm-faq.md", help="FAQ file used to build the index and pick questions")
+    parser.add_argument("--limit", type=int, default=20, help="number of questions to run per mode")
+    args = parser.parse_args()
+
+    questions = load_questions(args.faq, args.limit)
+    if not questions:
+        raise SystemExit(f"No questions found in {args.faq}")
+
+    # No answer cache: repeated questions would otherwise be answered from it
+    knowledge_base = KnowledgeBaseManager(answer_cache=AnswerCache(max_entries=0))
+    knowledge_base.build_index(args.faq)
+    # Warm up the retriever, the synthesizer and the HTTP clients
+    knowledge_base.query(questions[0], mode=QUERY_MODE_SYNTHESIZE)
+
+    results = {}
+    for mode in (QUERY_MODE_RETRIEVE, QUERY_MODE_SYNTHESIZE):
+        results[mode] = time_mode(knowledge_base, questions, mode)
+
+    print(f"{len(questions)} questions per mode, latency in ms")
+    print(f"{'mode':<22}{'n':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for mode, (latencies, sources) in results.items():
+        print_row(mode, latencies)
+        for source in sorted(set(sources)):
+            print_row(f"  {source}", [ms for ms, s in zip(latencies, sources) if s == source])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Offline stand-in for the Gemini Live model, for load tests.
+
+FakeLiveModel is an ADK model whose live connection replays a scripted
+conversation instead of calling Gemini, so the real Runner, LiveRequestQueue,
+tool dispatch and the /ws/{user_id} handlers all run unchanged. Start the app
+with FAKE_LIVE_SCRIPT set to use it:
+
+    FAKE_LIVE_SCRIPT=default uvicorn main:app          # built-in DEFAULT_SCRIPT
+    FAKE_LIVE_SCRIPT=my_script.json uvicorn main:app
+
+A script is JSON with these keys (all optional, see DEFAULT_SCRIPT):
+
+    turn_after_audio_ms  user audio that starts a turn; a text message or an
+                         activity end starts one too. Once the client sends
+                         activity signals only an activity end does, as
+                         with Gemini's automatic activity detection disabled
+    tool_latency_ms      how long the fake_lookup tool takes
+    connect_ms           how long opening a live connection takes, like the
+                         WebSocket handshake and setup of a real one
+    seed                 seed for the timing jitter
+    turns                list of turns, used in rotation; each is a list of
+                         steps run in order
+
+Steps are objects with a "type" and an optional "delay_ms" wait before it:
+
+    {"type": "input_transcript", "text": "..."}     user speech transcript
+    {"type": "output_transcript", "text": "..."}    agent speech transcript
+    {"type": "text", "text": "..."}                 agent text
+    {"type": "audio", "chunks": 25, "chunk_ms": 40,
+     "interval_ms": 40, "jitter_ms": 5}             24 kHz PCM chunks
+    {"type": "tool_call", "name": "fake_lookup",
+     "args": {"query": "..."}}                      waits for the tool result
+    {"type": "interrupt"}                           the model was interrupted
+    {"type": "turn_complete"}
+"""
+
+import asyncio
+import contextlib
+import copy
+import json
+import math
+import random
+import struct
+from typing import AsyncGenerator
+
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools import FunctionTool
+from google.genai import types
+
+from audio_protocol import INPUT_SAMPLE_RATE, OUTPUT_SAMPLE_RATE
+
+FAKE_MODEL_NAME = "fake-live"
+
+DEFAULT_SCRIPT = {
+    "turn_after_audio_ms": 1000,
+    "connect_ms": 300,
+    "tool_latency_ms": 50,
+    "seed": 0,
+    "turns": [
+        [
+            {"type": "input_transcript", "text": "Ինչպե՞ս դիմել Հաշտարարին"},
+            {"type": "tool_call", "name": "fake_lookup", "args": {"query": "դիմել Հաշտարարին"}, "delay_ms": 50},
+            {"type": "output_transcript", "text": "Կարող եք դիմել առցանց կամ այցելել գրասենյակ։", "delay_ms": 150},
+            {"type": "audio", "chunks": 50, "chunk_ms": 40, "interval_ms": 40, "jitter_ms": 5},
+            {"type": "turn_complete"},
+        ],
+        [
+            {"type": "input_transcript", "text": "Շնորհակալություն"},
+            {"type": "output_transcript", "text": "Խնդրեմ։", "delay_ms": 200},
+            {"type": "audio", "chunks": 10, "chunk_ms": 40, "interval_ms": 40, "jitter_ms": 5},
+            {"type": "interrupt"},
+        ],
+    ],
+}
+
+
+def load_script(name):
+    """Returns DEFAULT_SCRIPT for "default", else the JSON script at the given path."""
+    if name == "default":
+        return copy.deepcopy(DEFAULT_SCRIPT)
+    with open(name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _pcm_chunk(chunk_ms, sample_rate=OUTPUT_SAMPLE_RATE):
+    """A quiet 440 Hz tone, so the client player has something to play."""
+    samples = sample_rate * chunk_ms // 1000
+    return struct.pack(
+        f"<{samples}h",
+        *(int(2000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(samples)),
+    )
+
+
+class FakeLiveConnection(BaseLlmConnection):
+    """Plays the script's turns in rotation, one per user turn."""
+
+    def __init__(self, script):
+        self.script = script
+        self._turns = script.get("turns") or DEFAULT_SCRIPT["turns"]
+        self._turn_after_bytes = script.get("turn_after_audio_ms", 1000) * INPUT_SAMPLE_RATE * 2 // 1000
+        self._random = random.Random(script.get("seed", 0))
+        self._audio_bytes = 0
+        self._manual_activity = False
+        self._next_turn = 0
+        self._triggers = asyncio.Queue()
+        self._tool_responses = asyncio.Queue()
+        self._chunks = {}
+        self.closed = False
+
+    async def send_history(self, history):
+        pass
+
+    async def send_content(self, content):
+        parts = content.parts or []
+        if any(part.function_response for part in parts):
+            await self._tool_responses.put(content)
+        elif any(part.text for part in parts):
+            self._trigger()
+
+    async def send_realtime(self, blob):
+        if isinstance(blob, types.ActivityStart):
+            self._manual_activity = True
+        elif isinstance(blob, types.ActivityEnd):
+            self._trigger()
+        elif isinstance(blob, types.Blob) and blob.data and not self._manual_activity:
+            self._audio_bytes += len(blob.data)
+            if self._audio_bytes >= self._turn_after_bytes:
+                self._trigger()
+
+    def _trigger(self):
+        self._audio_bytes = 0
+        self._triggers.put_nowait(True)
+
+    async def receive(self) -> AsyncGenerator[LlmResponse, None]:
+        while True:
+            if not await self._triggers.get():
+                return
+            steps = self._turns[self._next_turn % len(self._turns)]
+            self._next_turn += 1
+            for step in steps:
+                async for response in self._play(step):
+                    yield response
+
+    async def _play(self, step):
+        if step.get("delay_ms"):
+            await asyncio.sleep(step["delay_ms"] / 1000)
+        kind = step["type"]
+        if kind == "input_transcript":
+            yield LlmResponse(input_transcription=types.Transcription(text=step["text"], finished=True))
+        elif kind == "output_transcript":
+            yield LlmResponse(output_transcription=types.Transcription(text=step["text"], finished=True))
+        elif kind == "text":
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part.from_text(text=step["text"])]), partial=True)
+        elif kind == "audio":
+            chunk_ms = step.get("chunk_ms", 40)
+            if chunk_ms not in self._chunks:
+                self._chunks[chunk_ms] = _pcm_chunk(chunk_ms)
+            interval = step.get("interval_ms", chunk_ms) / 1000
+            jitter = step.get("jitter_ms", 0) / 1000
+            for _ in range(step.get("chunks", 1)):
+                blob = types.Blob(data=self._chunks[chunk_ms], mime_type=f"audio/pcm;rate={OUTPUT_SAMPLE_RATE}")
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(inline_data=blob)]))
+                await asyncio.sleep(max(0.0, interval + self._random.uniform(-jitter, jitter)))
+        elif kind == "tool_call":
+            call = types.FunctionCall(name=step["name"], args=step.get("args", {}))
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            # The flow runs the tool and sends its result back through send_content
+            await self._tool_responses.get()
+        elif kind == "interrupt":
+            yield LlmResponse(interrupted=True)
+        elif kind == "turn_complete":
+            yield LlmResponse(turn_complete=True)
+        else:
+            raise ValueError(f"Unknown fake live step type: {kind}")
+
+    async def close(self):
+        self.closed = True
+        self._triggers.put_nowait(False)
+
+
+class FakeLiveModel(BaseLlm):
+    """ADK model whose live connections replay a script instead of calling Gemini."""
+
+    model: str = FAKE_MODEL_NAME
+    script: dict = DEFAULT_SCRIPT
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [FAKE_MODEL_NAME]
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        raise NotImplementedError("FakeLiveModel only supports live connections")
+        yield
+
+    @contextlib.asynccontextmanager
+    async def connect(self, llm_request) -> AsyncGenerator[BaseLlmConnection, None]:
+        await asyncio.sleep(self.script.get("connect_ms", 0) / 1000)
+        connection = FakeLiveConnection(self.script)
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+
+def create_fake_agent(name, script):
+    """Creates an agent with the given name that talks to a FakeLiveModel."""
+    tool_latency = script.get("tool_latency_ms", 50) / 1000
+
+    async def fake_lookup(query: str) -> str:
+        """Looks up the knowledge base (fake, for load tests)."""
+        await asyncio.sleep(tool_latency)
+        return f"Fake knowledge-base answer for: {query}"
+
+    return Agent(
+        name=name,
+        model=FakeLiveModel(script=script),
+        description="Scripted stand-in for a live agent, for load tests.",
+        instruction="Scripted stand-in for a live agent.",
+        tools=[FunctionTool(fake_lookup)],
+    )
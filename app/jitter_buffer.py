@@ -0,0 +1,89 @@
+"""Uplink jitter buffer: re-times client audio into evenly paced frames.
+
+Browsers send microphone audio from a timer (every 200 ms in app.js) and the
+network bunches and delays those messages further. UplinkJitterBuffer holds
+`depth_ms` of audio and releases it in `frame_ms` frames at real-time pace,
+so what follows it (the VAD and the model) sees a steady stream. When the
+buffer runs dry it waits to refill to `depth_ms` before releasing again.
+Audio that arrives faster than real time, such as a burst after a stall, is
+held only up to `max_extra_frames` frames beyond `depth_ms`; the oldest
+audio is dropped past that, so neither memory nor latency can grow. Frames
+keep the sample rate the client declared; if it changes, audio still held
+at the old rate is forwarded at once and framing restarts at the new one.
+
+The buffer adds `depth_ms` of latency to every utterance, so it is off unless
+UPLINK_JITTER_MS is set; the Live API itself accepts audio in bursts.
+"""
+
+import asyncio
+
+from audio_protocol import INPUT_SAMPLE_RATE
+from metrics import UPLINK_JITTER_DROPPED_SECONDS, UPLINK_UNDERRUNS
+
+DEFAULT_FRAME_MS = 40
+# Frames the buffer may hold beyond its depth before the oldest audio is dropped
+DEFAULT_MAX_EXTRA_FRAMES = 5
+
+
+class UplinkJitterBuffer:
+    """Buffers PCM pushed by the receiver and calls `forward(pcm, sample_rate)` at real-time pace."""
+
+    def __init__(
+        self,
+        forward,
+        depth_ms,
+        frame_ms=DEFAULT_FRAME_MS,
+        sample_rate=INPUT_SAMPLE_RATE,
+        max_extra_frames=DEFAULT_MAX_EXTRA_FRAMES,
+    ):
+        self.forward = forward
+        self.frame_ms = frame_ms
+        self.depth_ms = depth_ms
+        self.max_extra_frames = max_extra_frames
+        self.frame_seconds = frame_ms / 1000
+        self.underruns = 0
+        self.dropped_bytes = 0
+        self._buffer = bytearray()
+        self._data = asyncio.Event()
+        self._set_sample_rate(sample_rate)
+
+    def _set_sample_rate(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * self.frame_ms // 1000 * 2
+        self.depth_bytes = sample_rate * self.depth_ms // 1000 * 2
+        self.max_bytes = max(self.depth_bytes, self.frame_bytes) + self.max_extra_frames * self.frame_bytes
+        self.bytes_per_second = sample_rate * 2
+
+    def push(self, pcm, sample_rate=None):
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            # Frames are sized for one rate, so the old audio goes out unpaced
+            if self._buffer:
+                self.forward(bytes(self._buffer), self.sample_rate)
+                self._buffer.clear()
+            self._set_sample_rate(sample_rate)
+        self._buffer += pcm
+        excess = len(self._buffer) - self.max_bytes
+        if excess > 0:
+            # Whole 16-bit samples, oldest first
+            excess += excess % 2
+            del self._buffer[:excess]
+            self.dropped_bytes += excess
+            UPLINK_JITTER_DROPPED_SECONDS.inc(excess / self.bytes_per_second)
+        self._data.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Refill to the target depth before releasing anything
+            while len(self._buffer) < max(self.depth_bytes, self.frame_bytes):
+                self._data.clear()
+                await self._data.wait()
+            next_release = loop.time()
+            while len(self._buffer) >= self.frame_bytes:
+                frame = bytes(self._buffer[:self.frame_bytes])
+                del self._buffer[:self.frame_bytes]
+                self.forward(frame, self.sample_rate)
+                next_release += self.frame_seconds
+                await asyncio.sleep(max(0.0, next_release - loop.time()))
+            self.underruns += 1
+            UPLINK_UNDERRUNS.inc()
@@ -0,0 +1,304 @@
+"""Pre-warmed upstream live connections, so a new call does not wait for one.
+
+Opening a Gemini Live connection (WebSocket handshake plus session setup)
+sits on the critical path of every call: ADK opens it when the session's
+live events are first read. LiveConnectionPool keeps a few connections open
+and idle ahead of time and hands one to the next call that needs the same
+setup.
+
+Connections are only interchangeable if they were opened with the same
+model, live config (which includes the response modality), system
+instruction and tools; conversation history is sent after connecting, so it
+does not matter. The pool therefore learns each agent's connect request from
+its first call, which is cold, and keys warm connections by a fingerprint of
+that request. Each key keeps up to `size` connections warm. A warm
+connection older than `idle_seconds` or whose socket has closed is replaced,
+and a key nobody has used for `key_ttl_seconds` stops being refilled.
+
+Wrap an agent with `pool.wrap(agent)`; it works with the fake live backend
+(see fake_live.py) as well as with Gemini.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.llm_response import LlmResponse
+
+from metrics import LIVE_POOL_EVICTIONS, LIVE_POOL_READY, UPSTREAM_CONNECT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+# Warm connections are replaced before the upstream gives up on them
+DEFAULT_IDLE_SECONDS = 60.0
+DEFAULT_KEY_TTL_SECONDS = 10 * 60
+DEFAULT_MAX_KEYS = 8
+DEFAULT_CHECK_INTERVAL_SECONDS = 5.0
+# Wait after a failed warm-up before the key is tried again
+RETRY_SECONDS = 10.0
+
+SOURCE_WARM = "warm"
+SOURCE_COLD = "cold"
+
+EVICT_EXPIRED = "expired"
+EVICT_UNHEALTHY = "unhealthy"
+EVICT_UNUSED = "unused"
+
+
+def request_fingerprint(agent_name, llm_request):
+    """Identifies the connection setup of a request, or None if it cannot be pooled."""
+    live_config = llm_request.live_connect_config
+    if live_config is None:
+        return None
+    if live_config.session_resumption and live_config.session_resumption.handle:
+        # Reconnects resume one particular upstream session
+        return None
+    config = llm_request.config
+    parts = [
+        agent_name,
+        llm_request.model or "",
+        live_config.model_dump_json(exclude={"http_options", "system_instruction", "tools"}, exclude_none=True),
+        str(config.system_instruction) if config else "",
+    ]
+    for tool in (config.tools or []) if config else []:
+        parts.append(tool.model_dump_json(exclude_none=True) if hasattr(tool, "model_dump_json") else repr(tool))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def connect_template(llm_request):
+    """A copy of the parts of a request that connect() reads; it may modify them."""
+    return llm_request.model_copy(update={
+        "contents": [],
+        "config": llm_request.config.model_copy(deep=True) if llm_request.config else None,
+        "live_connect_config": llm_request.live_connect_config.model_copy(deep=True),
+        "tools_dict": {},
+    })
+
+
+def request_modality(llm_request):
+    modalities = llm_request.live_connect_config.response_modalities or []
+    return ",".join(str(getattr(modality, "value", modality)) for modality in modalities) or "default"
+
+
+def connection_open(connection):
+    """Best-effort check that an idle upstream connection is still usable."""
+    # GeminiLlmConnection -> google.genai AsyncSession -> websockets connection
+    websocket = getattr(getattr(connection, "_gemini_session", None), "_ws", None)
+    if websocket is not None:
+        return getattr(websocket, "close_code", None) is None
+    return not getattr(connection, "closed", False)
+
+
+class _Warm:
+    """One pre-opened connection, held open by its own task until released."""
+
+    __slots__ = ("connection", "created", "released", "task")
+
+    def __init__(self):
+        self.connection = None
+        self.created = None
+        self.released = asyncio.Event()
+        self.task = None
+
+
+class _Key:
+    """The learned connect request of one agent/modality and its warm connections."""
+
+    __slots__ = ("agent", "modality", "llm", "template", "ready", "connecting", "last_used", "retry_at")
+
+    def __init__(self, agent, modality, llm, template):
+        self.agent = agent
+        self.modality = modality
+        self.llm = llm
+        self.template = template
+        self.ready = deque()
+        self.connecting = 0
+        self.last_used = time.monotonic()
+        self.retry_at = 0.0
+
+
+class LiveConnectionPool:
+    """Per agent and modality pools of idle upstream live connections."""
+
+    def __init__(
+        self,
+        size=DEFAULT_POOL_SIZE,
+        idle_seconds=DEFAULT_IDLE_SECONDS,
+        key_ttl_seconds=DEFAULT_KEY_TTL_SECONDS,
+        max_keys=DEFAULT_MAX_KEYS,
+    ):
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.key_ttl_seconds = key_ttl_seconds
+        self.max_keys = max_keys
+        # fingerprint -> _Key, least recently used first
+        self._keys = OrderedDict()
+
+    def wrap(self, agent):
+        """Routes the agent's live connections through the pool."""
+        inner = agent.canonical_model
+        agent.model = PooledLlm(model=inner.model, inner=inner, pool=self, agent_name=agent.name)
+        return agent
+
+    def stats(self):
+        return {
+            f"{key.agent}/{key.modality}": {"ready": len(key.ready), "connecting": key.connecting}
+            for key in self._keys.values()
+        }
+
+    @contextlib.asynccontextmanager
+    async def connect(self, agent_name, llm, llm_request) -> AsyncGenerator[BaseLlmConnection, None]:
+        """Yields a warm connection for the request if one is ready, else opens one."""
+        fingerprint = request_fingerprint(agent_name, llm_request)
+        key = self._learn(fingerprint, agent_name, llm, llm_request) if fingerprint else None
+        modality = key.modality if key else "default"
+        start = time.perf_counter()
+        warm = self._take(key) if key else None
+        if key is not None:
+            self._refill(key)
+
+        if warm is None:
+            async with llm.connect(llm_request) as connection:
+                UPSTREAM_CONNECT_SECONDS.observe(time.perf_counter() - start, agent=agent_name, modality=modality, source=SOURCE_COLD)
+                yield connection
+            return
+
+        UPSTREAM_CONNECT_SECONDS.observe(time.perf_counter() - start, agent=agent_name, modality=modality, source=SOURCE_WARM)
+        try:
+            yield warm.connection
+        finally:
+            # The holding task closes it
+            warm.released.set()
+
+    def _learn(self, fingerprint, agent_name, llm, llm_request):
+        key = self._keys.get(fingerprint)
+        if key is None:
+            # Copied before the model's connect() adds to the request
+            key = _Key(agent_name, request_modality(llm_request), llm, connect_template(llm_request))
+            self._keys[fingerprint] = key
+            logger.info(f"Keeping {self.size} live connections warm for {agent_name} ({key.modality})")
+            while len(self._keys) > self.max_keys:
+                _, oldest = self._keys.popitem(last=False)
+                self._drain(oldest, EVICT_UNUSED)
+        key.last_used = time.monotonic()
+        self._keys.move_to_end(fingerprint)
+        return key
+
+    def _take(self, key):
+        while key.ready:
+            warm = key.ready.popleft()
+            self._publish(key)
+            if self._usable(warm):
+                return warm
+        return None
+
+    def _usable(self, warm):
+        if time.monotonic() - warm.created > self.idle_seconds:
+            self._evict(warm, EVICT_EXPIRED)
+            return False
+        if not connection_open(warm.connection):
+            self._evict(warm, EVICT_UNHEALTHY)
+            return False
+        return True
+
+    def _evict(self, warm, reason):
+        LIVE_POOL_EVICTIONS.inc(reason=reason)
+        warm.released.set()
+
+    def _refill(self, key):
+        if time.monotonic() < key.retry_at:
+            return
+        while len(key.ready) + key.connecting < self.size:
+            key.connecting += 1
+            warm = _Warm()
+            warm.task = asyncio.ensure_future(self._hold(key, warm))
+
+    async def _hold(self, key, warm):
+        """Opens a connection, parks it in the pool and closes it once released."""
+        try:
+            async with key.llm.connect(connect_template(key.template)) as connection:
+                warm.connection = connection
+                warm.created = time.monotonic()
+                key.connecting -= 1
+                key.ready.append(warm)
+                self._publish(key)
+                try:
+                    await warm.released.wait()
+                finally:
+                    if warm in key.ready:
+                        key.ready.remove(warm)
+                        self._publish(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if warm.connection is None:
+                logger.warning(f"Failed to warm a live connection for {key.agent} ({key.modality}): {e}")
+                key.retry_at = time.monotonic() + RETRY_SECONDS
+            else:
+                logger.info(f"Error closing a pooled live connection for {key.agent}: {e}")
+        finally:
+            if warm.connection is None:
+                key.connecting -= 1
+
+    def _drain(self, key, reason):
+        while key.ready:
+            self._evict(key.ready.popleft(), reason)
+        self._publish(key)
+
+    def _publish(self, key):
+        LIVE_POOL_READY.set(len(key.ready), agent=key.agent, modality=key.modality)
+
+    def check(self):
+        """Replaces expired and closed connections and forgets keys nobody uses."""
+        now = time.monotonic()
+        for fingerprint, key in list(self._keys.items()):
+            if now - key.last_used > self.key_ttl_seconds:
+                del self._keys[fingerprint]
+                self._drain(key, EVICT_UNUSED)
+                logger.info(f"Stopped keeping live connections warm for {key.agent} ({key.modality})")
+                continue
+            for warm in list(key.ready):
+                if not self._usable(warm):
+                    key.ready.remove(warm)
+            self._publish(key)
+            self._refill(key)
+
+    async def run_checks(self, interval=DEFAULT_CHECK_INTERVAL_SECONDS):
+        """Health-checks and refills the pool until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Live pool check failed: {e}")
+
+    def close(self):
+        """Closes every warm connection."""
+        for key in self._keys.values():
+            self._drain(key, EVICT_UNUSED)
+        self._keys.clear()
+
+
+class PooledLlm(BaseLlm):
+    """ADK model that takes live connections from a LiveConnectionPool.
+
+    Everything else is delegated to the wrapped model.
+    """
+
+    inner: BaseLlm
+    pool: Any
+    agent_name: str
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            yield response
+
+    def connect(self, llm_request):
+        return self.pool.connect(self.agent_name, self.inner, llm_request)
@@ -0,0 +1,290 @@
+"""Load generator for the /ws/{user_id} endpoint.
+
+Opens N concurrent WebSocket clients in binary audio mode. Each client streams
+16 kHz PCM in real-time frames for the whole call, like an open microphone:
+it speaks an utterance, stays silent while it waits for the agent's turn to
+complete or be interrupted and for a pause after it, and repeats until the run
+ends (--no-silence sends only the utterances). Run it
+against the app started with the fake live backend (see fake_live.py) to
+measure the server without spending Gemini quota:
+
+    FAKE_LIVE_SCRIPT=default uvicorn main:app --port 8000
+    python loadgen.py --clients 50 --duration 60 --server-pid <uvicorn pid>
+
+Reports:
+    connect-to-first-audio
+                        opening the WebSocket to the call's first agent audio
+                        frame, which includes the upstream live connection
+                        setup (see LIVE_POOL_SIZE) and the first utterance
+    first-byte latency  end of the user's utterance to the first agent audio frame
+                        (with the server VAD on, this includes its hangover)
+    frame jitter        |arrival gap - audio duration of the previous frame| per
+                        downlink frame within a turn
+    throughput          audio frames and bytes per second in each direction
+    barge-in            on each flush, the agent audio a client-side player
+                        would still have had buffered (what the flush cut
+                        off), and frames of an interrupted generation that
+                        arrived after its flush and had to be dropped
+    CPU per session     server CPU time / run time / clients (Linux, needs
+                        --server-pid), and the load generator's own CPU
+
+With --slow-clients N, the first N clients stall for --slow-read-ms before
+reading each message, like callers on a bad mobile link; their measurements
+are kept out of the report, which then shows how much the slow clients cost
+everyone else.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import time
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from audio_protocol import (
+    FRAME_AUDIO,
+    INPUT_SAMPLE_RATE,
+    PROTOCOL_BINARY,
+    decode_frame,
+    encode_audio_frame,
+    frame_generation,
+    is_older_generation,
+)
+
+# Seconds to wait for a turn to finish before counting it as timed out
+TURN_TIMEOUT = 30.0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def speech_frame(frame_ms):
+    """A 220 Hz tone frame standing in for microphone audio."""
+    samples = INPUT_SAMPLE_RATE * frame_ms // 1000
+    return struct.pack(
+        f"<{samples}h",
+        *(int(3000 * math.sin(2 * math.pi * 220 * i / INPUT_SAMPLE_RATE)) for i in range(samples)),
+    )
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU seconds of a process, from /proc; None where unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class Stats:
+    """Measurements collected by all clients."""
+
+    def __init__(self):
+        self.first_byte_ms = []
+        self.first_audio_ms = []
+        self.jitter_ms = []
+        self.flushed_ms = []
+        self.stale_frames = 0
+        self.turns = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.disconnected = 0
+        self.frames_down = 0
+        self.bytes_down = 0
+        self.frames_up = 0
+        self.bytes_up = 0
+
+
+class Client:
+    def __init__(self, user_id, args, stats, slow=False):
+        self.user_id = user_id
+        self.args = args
+        self.stats = stats
+        self.slow = slow
+        self.utterance_end = None
+        self.last_frame = None
+        # When the WebSocket was opened, until the call's first agent audio frame
+        self.connect_start = None
+        self.turn_done = asyncio.Event()
+        self.speaking = asyncio.Event()
+        self.generation = 0
+        # When a real-time player would finish playing the audio received so far
+        self.playout_end = 0.0
+
+    async def run(self, deadline):
+        uri = f"{self.args.url}/ws/{self.user_id}?is_audio=true&protocol={PROTOCOL_BINARY}"
+        try:
+            self.connect_start = time.perf_counter()
+            async with connect(uri, max_size=None) as websocket:
+                receiver = asyncio.create_task(self._receive(websocket))
+                microphone = asyncio.create_task(self._microphone(websocket))
+                try:
+                    while time.perf_counter() < deadline:
+                        self.turn_done.clear()
+                        self.utterance_end = None
+                        self.last_frame = None
+                        self.speaking.set()
+                        await asyncio.sleep(self.args.utterance_ms / 1000)
+                        self.speaking.clear()
+                        self.utterance_end = time.perf_counter()
+                        try:
+                            await asyncio.wait_for(self.turn_done.wait(), TURN_TIMEOUT)
+                            self.stats.turns += 1
+                        except asyncio.TimeoutError:
+                            self.stats.timeouts += 1
+                        await asyncio.sleep(self.args.think_ms / 1000)
+                finally:
+                    receiver.cancel()
+                    microphone.cancel()
+        except ConnectionClosed as e:
+            # The server closes clients that cannot keep up
+            self.stats.disconnected += 1
+            print(f"Client {self.user_id} disconnected by the server: {e}")
+        except Exception as e:
+            self.stats.errors += 1
+            print(f"Client {self.user_id} failed: {e}")
+
+    async def _microphone(self, websocket):
+        """Sends a frame every frame_ms: speech while speaking, else silence."""
+        speech = speech_frame(self.args.frame_ms)
+        silence = bytes(len(speech))
+        seq = 0
+        next_send = time.perf_counter()
+        while True:
+            if self.args.no_silence and not self.speaking.is_set():
+                await self.speaking.wait()
+                next_send = time.perf_counter()
+            frame = speech if self.speaking.is_set() else silence
+            await websocket.send(encode_audio_frame(seq, INPUT_SAMPLE_RATE, frame))
+            seq += 1
+            self.stats.frames_up += 1
+            self.stats.bytes_up += len(frame)
+            # Pace frames in real time, without drifting
+            next_send += self.args.frame_ms / 1000
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            if self.slow:
+                await asyncio.sleep(self.args.slow_read_ms / 1000)
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                frame_type, _seq, sample_rate, pcm = decode_frame(message)
+                if frame_type != FRAME_AUDIO:
+                    continue
+                if is_older_generation(frame_generation(message), self.generation):
+                    self.stats.stale_frames += 1
+                    continue
+                self.stats.frames_down += 1
+                self.stats.bytes_down += len(pcm)
+                if self.connect_start is not None:
+                    self.stats.first_audio_ms.append((now - self.connect_start) * 1000)
+                    self.connect_start = None
+                if self.last_frame is None:
+                    if self.utterance_end is not None:
+                        self.stats.first_byte_ms.append((now - self.utterance_end) * 1000)
+                else:
+                    previous_time, previous_duration = self.last_frame
+                    self.stats.jitter_ms.append(abs(now - previous_time - previous_duration) * 1000)
+                self.last_frame = (now, len(pcm) / 2 / sample_rate)
+                self.playout_end = max(self.playout_end, now) + self.last_frame[1]
+                continue
+            data = json.loads(message)
+            if "ping" in data:
+                await websocket.send(json.dumps({"pong": data["ping"]}))
+                continue
+            if data.get("flush"):
+                self.generation = data["generation"]
+                self.stats.flushed_ms.append(max(0.0, self.playout_end - now) * 1000)
+                self.playout_end = now
+                continue
+            if data.get("turn_complete") or data.get("interrupted"):
+                self.last_frame = None
+                self.turn_done.set()
+
+
+def print_distribution(label, values, unit="ms"):
+    if not values:
+        print(f"{label:<24}n/a")
+        return
+    print(
+        f"{label:<24}p50 {percentile(values, 50):8.1f}  p95 {percentile(values, 95):8.1f}"
+        f"  p99 {percentile(values, 99):8.1f}  max {max(values):8.1f} {unit}  (n={len(values)})"
+    )
+
+
+async def run(args):
+    stats = Stats()
+    # Slow clients record into their own Stats, so they do not skew the report
+    slow_stats = Stats()
+    clients = [
+        Client(args.user_id_base + i, args, slow_stats if i < args.slow_clients else stats, slow=i < args.slow_clients)
+        for i in range(args.clients)
+    ]
+    server_cpu_start = process_cpu_seconds(args.server_pid) if args.server_pid else None
+    own_cpu_start = time.process_time()
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    async def start_client(i, client):
+        # Stagger connections so they do not all speak at once
+        await asyncio.sleep(i * args.ramp_ms / 1000)
+        await client.run(deadline)
+
+    await asyncio.gather(*(start_client(i, client) for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.clients} clients, {elapsed:.1f}s, {stats.turns} turns, {stats.timeouts} timeouts, {stats.errors} errors")
+    if args.slow_clients:
+        print(
+            f"{args.slow_clients} slow clients (not in the figures below), {slow_stats.turns} turns,"
+            f" {slow_stats.disconnected} disconnected by the server"
+        )
+    print_distribution("connect-to-first-audio", stats.first_audio_ms)
+    print_distribution("first-byte latency", stats.first_byte_ms)
+    print_distribution("frame jitter", stats.jitter_ms)
+    print_distribution("audio cut by flush", stats.flushed_ms)
+    print(f"{'stale frames dropped':<22}{stats.stale_frames:8d}")
+    print(
+        f"{'downlink':<22}{stats.frames_down / elapsed:8.1f} frames/s  {stats.bytes_down / elapsed / 1024:8.1f} KiB/s"
+    )
+    print(
+        f"{'uplink':<22}{stats.frames_up / elapsed:8.1f} frames/s  {stats.bytes_up / elapsed / 1024:8.1f} KiB/s"
+    )
+    if server_cpu_start is not None:
+        server_cpu = process_cpu_seconds(args.server_pid) - server_cpu_start
+        print(
+            f"{'server CPU':<22}{server_cpu / elapsed * 100:8.1f} % of a core,"
+            f" {server_cpu / elapsed / args.clients * 100:6.2f} % per session"
+        )
+    print(f"{'load generator CPU':<22}{(time.process_time() - own_cpu_start) / elapsed * 100:8.1f} % of a core")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:8000", help="server base URL")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent WebSocket clients")
+    parser.add_argument("--duration", type=float, default=30, help="run time in seconds")
+    parser.add_argument("--utterance-ms", type=int, default=1000, help="audio sent per user turn")
+    parser.add_argument("--frame-ms", type=int, default=20, help="uplink frame size")
+    parser.add_argument("--think-ms", type=int, default=500, help="pause between turns")
+    parser.add_argument("--ramp-ms", type=int, default=50, help="delay between client connections")
+    parser.add_argument("--user-id-base", type=int, default=100000, help="first user id")
+    parser.add_argument("--server-pid", type=int, help="uvicorn process id, for CPU per session")
+    parser.add_argument("--no-silence", action="store_true", help="send audio only while speaking")
+    parser.add_argument("--slow-clients", type=int, default=0, help="clients that read their messages slowly")
+    parser.add_argument("--slow-read-ms", type=int, default=200, help="stall before each message a slow client reads")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
+# Cold-start reference point, taken before the heavy imports below
+PROCESS_START = time.perf_counter()
+
 import os
 import json
 import asyncio
@@ -31,24 +36,84 @@ from google.genai.types import (
     Blob,
 )
 
-from google.adk.runners import InMemoryRunner, Runner
 from google.adk.agents import LiveRequestQueue
 from google.adk.agents.run_config import RunConfig
 from google.genai import types
 
 from fastapi import FastAPI, WebSocket, File, UploadFile
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from starlette.websockets import WebSocketDisconnect
 import shutil
 from google_search_agent.agent import live_agent
-from rag_agent.agent import rag_agent
+from rag_agent.agent import rag_agent, knowledge_base, cancel_inflight_queries, query_prefetcher
 from rag_agent.knowledge_base import KnowledgeBaseManager
+from rag_agent.ingestion import IngestionQueue
+from session_manager import RunnerRegistry, SessionManager, create_session_service
+from live_pool import DEFAULT_IDLE_SECONDS, LiveConnectionPool
+from metrics import (
+    ACTIVE_SESSIONS,
+    AUDIO_FRAME_MS,
+    DIRECTION_UPLINK,
+    RAG_LATENCY,
+    RAG_PREFETCH,
+    RAG_PREFETCH_SAVED,
+    REGISTRY,
+    SessionStats,
+    instrument_tools,
+    setup_logging,
+)
+from outbound import (
+    DEFAULT_LAG_MESSAGES,
+    DEFAULT_MAX_FRAME_MS,
+    DEFAULT_MAX_HOLD_MS,
+    DEFAULT_MAX_MESSAGES,
+    DEFAULT_MIN_FRAME_MS,
+    DEFAULT_PING_INTERVAL_SECONDS,
+    DEFAULT_SLOW_CLIENT_SECONDS,
+    KIND_CONTROL,
+    KIND_TEXT,
+    KIND_TRANSCRIPT,
+    OutboundQueue,
+    SlowClientError,
+)
+from jitter_buffer import DEFAULT_FRAME_MS as DEFAULT_UPLINK_FRAME_MS, UplinkJitterBuffer
+from vad import (
+    DEFAULT_MIN_SPEECH_RMS,
+    DEFAULT_SILENCE_MS,
+    EVENT_AUDIO,
+    EVENT_END,
+    EVENT_START,
+    SpeechGate,
+    realtime_input_config,
+)
+from audio_protocol import (
+    FRAME_AUDIO,
+    INPUT_SAMPLE_RATE,
+    PROTOCOL_BINARY,
+    PROTOCOL_JSON,
+    decode_frame,
+    next_generation,
+    sample_rate_from_mime_type,
+)
+
+# Seconds spent importing this module, reported by /readyz
+IMPORT_SECONDS = round(time.perf_counter() - PROCESS_START, 3)
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 warnings.filterwarnings("ignore", message="there are non-text parts in the response")
 
+# Leveled logging, written by a background thread rather than on the event loop
+setup_logging(os.environ.get("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+# Per-frame and per-transcript-fragment logs, off unless LOG_FRAMES=1
+LOG_FRAMES = os.environ.get("LOG_FRAMES") == "1"
+frame_logger = logging.getLogger(f"{__name__}.frames")
+if LOG_FRAMES:
+    frame_logger.setLevel(logging.DEBUG)
+
 # Reduce ADK logging verbosity (suppress "non-text parts" warnings)
 logging.getLogger('google.genai').setLevel(logging.ERROR)
 logging.getLogger('google.adk').setLevel(logging.ERROR)
@@ -61,55 +126,127 @@ APP_NAME = "FSM DEMO APP"
 
 root_agent = live_agent
 
+# Scripted stand-in for Gemini Live, for offline load tests (see fake_live.py)
+if os.environ.get("FAKE_LIVE_SCRIPT"):
+    from fake_live import create_fake_agent, load_script
+    root_agent = create_fake_agent(root_agent.name, load_script(os.environ["FAKE_LIVE_SCRIPT"]))
+
+# Tool-call and knowledge-base latency histograms for /metrics
+for agent in (root_agent, rag_agent):
+    instrument_tools(agent)
+knowledge_base.on_query = lambda mode, source, seconds: RAG_LATENCY.observe(seconds, mode=mode, source=source)
+
+# Upstream live connections opened ahead of calls (see live_pool.py); off when LIVE_POOL_SIZE=0
+LIVE_POOL_SIZE = int(os.environ.get("LIVE_POOL_SIZE", 0))
+live_pool = None
+if LIVE_POOL_SIZE > 0:
+    live_pool = LiveConnectionPool(
+        size=LIVE_POOL_SIZE,
+        idle_seconds=float(os.environ.get("LIVE_POOL_IDLE_SECONDS", DEFAULT_IDLE_SECONDS)),
+    )
+    live_pool.wrap(root_agent)
+
+
+def _record_prefetch(outcome, saved_seconds):
+    RAG_PREFETCH.inc(outcome=outcome)
+    if saved_seconds:
+        RAG_PREFETCH_SAVED.observe(saved_seconds)
+
+
+# Speculative lookups from partial transcripts (RAG_PREFETCH=1). Only query_docs
+# takes their answers, so they would be wasted on an agent without it
+if query_prefetcher is not None and not any(
+    getattr(tool, "name", getattr(tool, "__name__", None)) == "query_docs" for tool in root_agent.tools
+):
+    logger.warning(f"RAG_PREFETCH is set, but agent '{root_agent.name}' has no query_docs tool; not prefetching")
+    query_prefetcher = None
+if query_prefetcher is not None:
+    query_prefetcher.on_prefetch = _record_prefetch
+
+# Outbound queue limits per connection (see outbound.py)
+OUTBOUND_MAX_MESSAGES = int(os.environ.get("OUTBOUND_MAX_MESSAGES", DEFAULT_MAX_MESSAGES))
+OUTBOUND_LAG_MESSAGES = int(os.environ.get("OUTBOUND_LAG_MESSAGES", DEFAULT_LAG_MESSAGES))
+SLOW_CLIENT_SECONDS = float(os.environ.get("SLOW_CLIENT_SECONDS", DEFAULT_SLOW_CLIENT_SECONDS))
+
+# Audio framing: downlink frames merge model chunks, the optional uplink jitter buffer paces client audio
+DOWNLINK_MIN_FRAME_MS = int(os.environ.get("DOWNLINK_MIN_FRAME_MS", DEFAULT_MIN_FRAME_MS))
+DOWNLINK_MAX_FRAME_MS = int(os.environ.get("DOWNLINK_MAX_FRAME_MS", DEFAULT_MAX_FRAME_MS))
+DOWNLINK_MAX_HOLD_MS = int(os.environ.get("DOWNLINK_MAX_HOLD_MS", DEFAULT_MAX_HOLD_MS))
+PING_INTERVAL_SECONDS = float(os.environ.get("PING_INTERVAL_SECONDS", DEFAULT_PING_INTERVAL_SECONDS))
+UPLINK_JITTER_MS = int(os.environ.get("UPLINK_JITTER_MS", 0))
+UPLINK_FRAME_MS = int(os.environ.get("UPLINK_FRAME_MS", DEFAULT_UPLINK_FRAME_MS))
+
+# Server-side VAD for uplink audio (see vad.py); UPLINK_VAD=0 leaves it to the Live API
+UPLINK_VAD = os.environ.get("UPLINK_VAD", "1") == "1"
+VAD_SILENCE_MS = int(os.environ.get("VAD_SILENCE_MS", DEFAULT_SILENCE_MS))
+VAD_MIN_SPEECH_RMS = float(os.environ.get("VAD_MIN_SPEECH_RMS", DEFAULT_MIN_SPEECH_RMS))
+
+# Runners and sessions are shared by every connection in this process
+
+# SESSION_DB_URL (e.g. sqlite:///./sessions.db) shares sessions between worker processes
+runner_registry = RunnerRegistry(APP_NAME, create_session_service(os.environ.get("SESSION_DB_URL")))
+session_manager = SessionManager(
+    runner_registry.session_service,
+    APP_NAME,
+    ttl_seconds=int(os.environ.get("SESSION_TTL_SECONDS", 30 * 60)),
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 1000)),
+)
+
 
 async def start_agent_session(user_id, is_audio=False):
     """Starts an agent session"""
 
-    # Create a Runner (we'll reuse this for both live and detail agents)
-    runner = InMemoryRunner(
-        app_name=APP_NAME,
-        agent=root_agent,
-    )
+    # Reuse the process-wide Runner for this agent
+    runner = runner_registry.get_runner(root_agent)
 
-    # Create a Session
-    session = await runner.session_service.create_session(
-        app_name=APP_NAME,
-        user_id=user_id,  # Replace with actual user ID
-    )
+    # Get the user's existing Session back, or create a new one
+    session, resumed = await session_manager.acquire(root_agent.name, user_id)
+    logger.info(f"Session {session.id} for user {user_id} ({'resumed' if resumed else 'new'})")
 
-    # Set response modalities - AUDIO only is sufficient for transcript
-    if is_audio:
-        modalities = ["AUDIO"]  # AUDIO modality with output_audio_transcription provides both audio and transcript
-    else:
-        modalities = ["TEXT"]  # Text only for text mode
-    
-    # Configure RunConfig with audio transcription
-    
-    run_config = RunConfig(
-        response_modalities=modalities,
-        # Enable transcription for agent's speech output
-        output_audio_transcription=types.AudioTranscriptionConfig() if is_audio else None,
-        # Enable transcription for user's speech input
-        input_audio_transcription=types.AudioTranscriptionConfig() if is_audio else None,
-    )
+    try:
+        # Set response modalities - AUDIO only is sufficient for transcript
+        if is_audio:
+            modalities = ["AUDIO"]  # AUDIO modality with output_audio_transcription provides both audio and transcript
+        else:
+            modalities = ["TEXT"]  # Text only for text mode
+
+        # Configure RunConfig with audio transcription
+
+        run_config = RunConfig(
+            response_modalities=modalities,
+            # Enable transcription for agent's speech output
+            output_audio_transcription=types.AudioTranscriptionConfig() if is_audio else None,
+            # Enable transcription for user's speech input
+            input_audio_transcription=types.AudioTranscriptionConfig() if is_audio else None,
+            # Activity is signalled by our VAD instead of the model's
+            realtime_input_config=realtime_input_config() if is_audio and UPLINK_VAD else None,
+        )
 
-    # Create a LiveRequestQueue for this session
-    live_request_queue = LiveRequestQueue()
+        # Create a LiveRequestQueue for this session
+        live_request_queue = LiveRequestQueue()
 
-    # Start agent session
-    live_events = runner.run_live(
-        session=session,
-        live_request_queue=live_request_queue,
-        run_config=run_config,
-    )
+        # Start agent session
+        live_events = runner.run_live(
+            user_id=user_id,
+            session_id=session.id,
+            live_request_queue=live_request_queue,
+            run_config=run_config,
+        )
+    except BaseException:
+        # The caller only releases sessions that started
+        await session_manager.release(root_agent.name, user_id)
+        raise
     return live_events, live_request_queue, session, runner
 
 
-async def agent_to_client_messaging(websocket, live_events, session, is_audio, runner):
-    """Agent to client communication"""
+async def agent_to_client_messaging(outbound, live_events, session, is_audio, runner, stats=None):
+    """Agent to client communication, through the connection's outbound queue"""
+    stats = stats or SessionStats()
     # Accumulators for full transcripts
     full_input_transcript = ""
     full_output_transcript = ""
+    # Audio generation, advanced on every interruption so the client can drop stale audio
+    generation = 0
     
     async for event in live_events:
         # Check for input transcription (transcript of user's audio speech)
@@ -123,15 +260,24 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
             if input_text:
                 # Accumulate full transcript
                 full_input_transcript += input_text
+
+                # Start looking up what the user is asking before they finish
+                if query_prefetcher is not None:
+                    query_prefetcher.observe(session.id, input_text)
                 
+                # Without the VAD, the user has spoken up to here; the next agent audio ends the turn latency
+                if not stats.vad:
+                    stats.user_speech_ended()
+
                 message = {
                     "mime_type": "text/plain",
                     "data": input_text,
                     "partial": event.partial,
                     "is_input_transcript": True
                 }
-                await websocket.send_text(json.dumps(message))
-                print(f"[USER INPUT TRANSCRIPT]: {input_text}")
+                outbound.put(KIND_TRANSCRIPT, message, coalesce_key="input_transcript" if event.partial else None)
+                if LOG_FRAMES:
+                    frame_logger.debug(f"[USER INPUT TRANSCRIPT]: {input_text}")
         
         # Check for output transcription (transcript of agent's audio speech)
         if event.output_transcription:
@@ -151,8 +297,15 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
                     "partial": event.partial,
                     "is_output_transcript": True
                 }
-                await websocket.send_text(json.dumps(message))
-                print(f"[AGENT OUTPUT TRANSCRIPT]: {transcript_text}")
+                outbound.put(KIND_TRANSCRIPT, message, coalesce_key="output_transcript" if event.partial else None)
+                if LOG_FRAMES:
+                    frame_logger.debug(f"[AGENT OUTPUT TRANSCRIPT]: {transcript_text}")
+
+        # Knowledge-base lookups and audio still queued for an interrupted turn are no longer needed
+        if event.interrupted:
+            cancel_inflight_queries(session.id)
+            generation = next_generation(generation)
+            outbound.flush_audio({"flush": True, "generation": generation})
 
         # If the turn complete or interrupted, trigger detail agent
         if event.turn_complete or event.interrupted:
@@ -160,8 +313,11 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
                 "turn_complete": event.turn_complete,
                 "interrupted": event.interrupted,
             }
-            await websocket.send_text(json.dumps(message))
-            print(f"[AGENT TO CLIENT]: {message}")
+            outbound.put(KIND_CONTROL, message)
+            stats.turn_ended()
+            if query_prefetcher is not None:
+                query_prefetcher.end_turn(session.id)
+            logger.debug(f"[AGENT TO CLIENT]: {message}")
             continue
 
         # Read the Content and its first Part
@@ -171,17 +327,16 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
         if not part:
             continue
 
-        # If it's audio, send Base64 encoded audio data
+        # If it's audio, queue the PCM; the writer frames it as binary or Base64 encoded JSON
         is_audio = part.inline_data and part.inline_data.mime_type.startswith("audio/pcm")
         if is_audio:
             audio_data = part.inline_data and part.inline_data.data
             if audio_data:
-                message = {
-                    "mime_type": "audio/pcm",
-                    "data": base64.b64encode(audio_data).decode("ascii")
-                }
-                await websocket.send_text(json.dumps(message))
-                print(f"[AGENT TO CLIENT]: audio/pcm: {len(audio_data)} bytes.")
+                stats.agent_audio()
+                sample_rate = sample_rate_from_mime_type(part.inline_data.mime_type)
+                outbound.put_audio(audio_data, sample_rate, generation)
+                if LOG_FRAMES:
+                    frame_logger.debug(f"[AGENT TO CLIENT]: audio/pcm: {len(audio_data)} bytes.")
                 continue
 
         # If it's text (partial or complete), send it
@@ -192,36 +347,95 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
                 "partial": event.partial,
                 "is_transcript": False  # This is regular text, not transcript
             }
-            await websocket.send_text(json.dumps(message))
-            print(f"[AGENT TO CLIENT]: text/plain: {part.text[:100]}...")
+            outbound.put(KIND_TEXT, message)
+            if LOG_FRAMES:
+                frame_logger.debug(f"[AGENT TO CLIENT]: text/plain: {part.text[:100]}...")
+
+
+def forward_audio(live_request_queue, session, pcm, sample_rate, stats, speech_gate=None):
+    """Sends uplink audio to the agent, through the VAD when there is one"""
+    if speech_gate is None:
+        live_request_queue.send_realtime(Blob(data=pcm, mime_type=f"audio/pcm;rate={sample_rate}"))
+        AUDIO_FRAME_MS.observe(len(pcm) / 2 / sample_rate * 1000, direction=DIRECTION_UPLINK)
+        return
+    speech, silence = speech_gate.speech_seconds, speech_gate.silence_seconds
+    forwarded = 0
+    for event, audio in speech_gate.process(pcm, sample_rate):
+        if event == EVENT_START:
+            # A new user turn supersedes any lookup still running for the last one
+            cancel_inflight_queries(session.id)
+            live_request_queue.send_activity_start()
+        elif event == EVENT_AUDIO:
+            live_request_queue.send_realtime(Blob(data=audio, mime_type=f"audio/pcm;rate={sample_rate}"))
+            AUDIO_FRAME_MS.observe(len(audio) / 2 / sample_rate * 1000, direction=DIRECTION_UPLINK)
+            forwarded += len(audio)
+        elif event == EVENT_END:
+            live_request_queue.send_activity_end()
+            stats.user_speech_ended(time.monotonic() - speech_gate.hangover_seconds)
+    stats.uplink_audio(speech_gate.speech_seconds - speech, speech_gate.silence_seconds - silence, forwarded)
+
+
+async def client_to_agent_messaging(
+    websocket, live_request_queue, session, stats=None, speech_gate=None, jitter_buffer=None, outbound=None
+):
+    """Client to agent communication"""
+    stats = stats or SessionStats()
 
+    def uplink_audio(pcm, sample_rate):
+        if jitter_buffer is not None:
+            jitter_buffer.push(pcm, sample_rate)
+        else:
+            forward_audio(live_request_queue, session, pcm, sample_rate, stats, speech_gate)
 
-async def client_to_agent_messaging(websocket, live_request_queue):
-    """Client to agent communication"""
     try:
         while True:
+            ws_message = await websocket.receive()
+            if ws_message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(ws_message.get("code", 1000))
+
+            # Binary frames carry raw PCM audio with a small header
+            if ws_message.get("bytes") is not None:
+                frame_type, _seq, sample_rate, pcm = decode_frame(ws_message["bytes"])
+                if frame_type != FRAME_AUDIO:
+                    raise ValueError(f"Binary frame type not supported: {frame_type}")
+                uplink_audio(pcm, sample_rate)
+                stats.count(DIRECTION_UPLINK, "audio", len(pcm))
+                continue
+
             # Decode JSON message
-            message_json = await websocket.receive_text()
-            message = json.loads(message_json)
+            message = json.loads(ws_message["text"])
+
+            # Reply to our ping, for the round-trip time
+            if "pong" in message:
+                if outbound is not None:
+                    outbound.pong(message["pong"])
+                continue
+
             mime_type = message["mime_type"]
             data = message["data"]
 
             # Send the message to the agent
             if mime_type == "text/plain":
+                # A new user turn supersedes any lookup still running for the last one
+                cancel_inflight_queries(session.id)
+
                 # Send a text message
                 content = Content(role="user", parts=[Part.from_text(text=data)])
                 live_request_queue.send_content(content=content)
-                print(f"[CLIENT TO AGENT]: {data}")
+                stats.count(DIRECTION_UPLINK, "text", len(data))
+                stats.user_speech_ended()
+                logger.debug(f"[CLIENT TO AGENT]: {data}")
             elif mime_type == "audio/pcm":
                 # Send an audio data
                 decoded_data = base64.b64decode(data)
-                live_request_queue.send_realtime(Blob(data=decoded_data, mime_type=mime_type))
+                uplink_audio(decoded_data, INPUT_SAMPLE_RATE)
+                stats.count(DIRECTION_UPLINK, "audio", len(decoded_data))
             else:
                 raise ValueError(f"Mime type not supported: {mime_type}")
     except WebSocketDisconnect:
-        print("[CLIENT TO AGENT] WebSocket disconnected (normal)")
+        logger.debug("[CLIENT TO AGENT] WebSocket disconnected (normal)")
     except Exception as e:
-        print(f"[CLIENT TO AGENT ERROR]: {e}")
+        logger.error(f"[CLIENT TO AGENT ERROR]: {e}")
 
 
 #
@@ -230,33 +444,123 @@ async def client_to_agent_messaging(websocket, live_request_queue):
 
 app = FastAPI()
 
+# Uploaded documents are parsed, embedded and indexed in the background
+ingestion_queue = IngestionQueue(knowledge_base)
+
+# Seconds from process start until the server accepted requests
+server_ready_seconds = None
+
+
+@app.on_event("startup")
+async def load_knowledge_base():
+    """Starts loading the knowledge base without holding up the server"""
+    global server_ready_seconds
+    knowledge_base.start_background_load()
+    server_ready_seconds = round(time.perf_counter() - PROCESS_START, 3)
+    logger.info(f"Server ready in {server_ready_seconds}s (imports {IMPORT_SECONDS}s), knowledge base loading in the background")
+
+
+@app.on_event("startup")
+async def start_session_eviction():
+    """Expires idle sessions in the background"""
+    asyncio.create_task(session_manager.run_eviction_loop())
+
+
+@app.on_event("startup")
+async def start_live_pool_checks():
+    """Health-checks and refills pre-warmed live connections in the background"""
+    if live_pool is not None:
+        asyncio.create_task(live_pool.run_checks())
+
+
+@app.on_event("startup")
+async def start_ingestion_queue():
+    """Starts the background document ingestion workers"""
+    ingestion_queue.start()
+
+
+@app.on_event("shutdown")
+async def save_answer_cache():
+    """Persists cached knowledge-base answers, if configured"""
+    knowledge_base.answer_cache.save()
+
+
+@app.on_event("shutdown")
+async def close_live_pool():
+    """Closes the idle pre-warmed live connections"""
+    if live_pool is not None:
+        live_pool.close()
+
+
+@app.on_event("shutdown")
+async def stop_ingestion_queue():
+    """Stops the background document ingestion workers"""
+    await ingestion_queue.stop()
+
+
 STATIC_DIR = Path("static")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
-# knowledge_base = KnowledgeBaseManager()
-
-# @app.post("/upload-pdf")
-# async def upload_pdf(file: UploadFile = File(...)):
-#     """Uploads a PDF document to the knowledge base."""
-#     print(f"Received request to upload file: {file.filename}")
-#     if file.content_type != "application/pdf":
-#         print(f"Invalid file type: {file.content_type}")
-#         return {"message": "Only PDF files are allowed."}, 400
-#     try:
-#         # Save the uploaded file to the downloads directory
-#         file_path = os.path.join("app/downloads", file.filename)
-#         with open(file_path, "wb") as buffer:
-#             shutil.copyfileobj(file.file, buffer)
-#         print(f"Saved file to {file_path}")
-
-#         # Rebuild the knowledge base index
-#         knowledge_base.build_index()
-#         print("Knowledge base index rebuilt successfully.")
-
-#         return {"message": f"File '{file.filename}' uploaded and indexed successfully."}
-#     except Exception as e:
-#         print(f"Error uploading file: {e}")
-#         return {"message": f"Error uploading file: {e}"}, 500
+@app.post("/upload-pdf")
+async def upload_pdf(file: UploadFile = File(...)):
+    """Uploads a PDF document to the knowledge base."""
+    logger.info(f"Received request to upload file: {file.filename}")
+    if file.content_type != "application/pdf":
+        logger.warning(f"Invalid file type: {file.content_type}")
+        return JSONResponse({"message": "Only PDF files are allowed."}, status_code=400)
+    try:
+        # Save the uploaded file to the documents directory
+        os.makedirs(knowledge_base.documents_dir, exist_ok=True)
+        file_path = os.path.join(knowledge_base.documents_dir, os.path.basename(file.filename))
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        logger.info(f"Saved file to {file_path}")
+
+        # Index it in the background; queries keep using the current index meanwhile
+        job = ingestion_queue.submit(file_path)
+
+        return JSONResponse(
+            {"message": f"File '{file.filename}' uploaded, indexing started.", **job.to_dict()},
+            status_code=202,
+        )
+    except Exception as e:
+        logger.exception(f"Error uploading file: {e}")
+        return JSONResponse({"message": f"Error uploading file: {e}"}, status_code=500)
+
+@app.get("/ingest/{job_id}")
+async def ingestion_status(job_id: str):
+    """Reports the progress of a document ingestion job."""
+    job = ingestion_queue.get_job(job_id)
+    if job is None:
+        return JSONResponse({"message": f"Unknown job: {job_id}"}, status_code=404)
+    return job.to_dict()
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the server is up, even while the knowledge base loads."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 503 until the knowledge base is loaded, with progress and cold-start timings."""
+    status = knowledge_base.status()
+    status["cold_start"] = {
+        "import_seconds": IMPORT_SECONDS,
+        "server_ready_seconds": server_ready_seconds,
+        "index_load_seconds": status.pop("load_seconds"),
+    }
+    status["prefetch"] = query_prefetcher.stats() if query_prefetcher is not None else None
+    status["live_pool"] = live_pool.stats() if live_pool is not None else None
+    return JSONResponse(status, status_code=200 if knowledge_base.is_ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this process."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 async def root():
@@ -265,29 +569,62 @@ async def root():
 
 
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str):
+async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str, protocol: str = PROTOCOL_JSON):
     """Client websocket endpoint"""
 
     # Wait for client connection
     await websocket.accept()
-    print(f"Client #{user_id} connected, audio mode: {is_audio}")
+    # Clients opt in to binary audio frames; older clients keep the JSON mode
+    use_binary = (protocol == PROTOCOL_BINARY)
+    logger.info(f"Client #{user_id} connected, audio mode: {is_audio}, protocol: {protocol}")
 
-    # Start agent session
+    # Start agent session; nothing is counted or released if this fails
     user_id_str = str(user_id)
     is_audio_mode = (is_audio == "true")
     live_events, live_request_queue, session, runner = await start_agent_session(user_id_str, is_audio_mode)
 
-    # Start tasks
-    agent_to_client_task = asyncio.create_task(
-        agent_to_client_messaging(websocket, live_events, session, is_audio_mode, runner)
-    )
-    client_to_agent_task = asyncio.create_task(
-        client_to_agent_messaging(websocket, live_request_queue)
+    ACTIVE_SESSIONS.inc()
+    stats = SessionStats()
+    outbound = OutboundQueue(
+        websocket,
+        stats,
+        name=f"#{user_id}",
+        binary=use_binary,
+        max_messages=OUTBOUND_MAX_MESSAGES,
+        lag_messages=OUTBOUND_LAG_MESSAGES,
+        slow_client_seconds=SLOW_CLIENT_SECONDS,
+        min_frame_ms=DOWNLINK_MIN_FRAME_MS,
+        max_frame_ms=DOWNLINK_MAX_FRAME_MS,
+        max_hold_ms=DOWNLINK_MAX_HOLD_MS,
     )
+    tasks = []
 
-    # Wait until the websocket is disconnected or an error occurs
     try:
-        tasks = [agent_to_client_task, client_to_agent_task]
+        # Start tasks; only the writer task waits on the client's socket
+        tasks.append(asyncio.create_task(
+            agent_to_client_messaging(outbound, live_events, session, is_audio_mode, runner, stats)
+        ))
+        tasks.append(asyncio.create_task(outbound.run()))
+        tasks.append(asyncio.create_task(outbound.run_pings(PING_INTERVAL_SECONDS)))
+
+        # Uplink audio goes through the jitter buffer (if any), then the VAD (if any), to the model
+        speech_gate = None
+        if is_audio_mode and UPLINK_VAD:
+            speech_gate = SpeechGate(silence_ms=VAD_SILENCE_MS, min_speech_rms=VAD_MIN_SPEECH_RMS)
+            stats.vad = True
+        jitter_buffer = None
+        if is_audio_mode and UPLINK_JITTER_MS > 0:
+            jitter_buffer = UplinkJitterBuffer(
+                lambda pcm, sample_rate: forward_audio(live_request_queue, session, pcm, sample_rate, stats, speech_gate),
+                depth_ms=UPLINK_JITTER_MS,
+                frame_ms=UPLINK_FRAME_MS,
+            )
+            tasks.append(asyncio.create_task(jitter_buffer.run()))
+        tasks.append(asyncio.create_task(
+            client_to_agent_messaging(websocket, live_request_queue, session, stats, speech_gate, jitter_buffer, outbound)
+        ))
+
+        # Wait until the websocket is disconnected or an error occurs
         done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         
         # Cancel pending tasks
@@ -305,11 +642,25 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str):
             except WebSocketDisconnect:
                 # Normal disconnection, not an error
                 pass
+            except SlowClientError as e:
+                await outbound.disconnect_slow_client(e)
             except Exception as e:
-                print(f"[WEBSOCKET ERROR] Task failed: {e}")
+                logger.error(f"[WEBSOCKET ERROR] Task failed: {e}")
     finally:
-        # Close LiveRequestQueue
+        # Only left running if setting up the connection failed
+        for task in tasks:
+            task.cancel()
+
+        # Close LiveRequestQueue and drop lookups nobody is waiting for
         live_request_queue.close()
+        cancel_inflight_queries(session.id)
+        if query_prefetcher is not None:
+            query_prefetcher.end_turn(session.id)
+        outbound.close()
+
+        # Keep the session around so a reconnect can resume it
+        await session_manager.release(root_agent.name, user_id_str)
         
         # Disconnected
-        print(f"Client #{user_id} disconnected")
+        ACTIVE_SESSIONS.dec()
+        logger.info(f"Client #{user_id} disconnected: {stats.summary()}")
@@ -15,7 +15,6 @@ from google.genai.types import (
     Blob,
 )
 
-from google.adk.runners import InMemoryRunner, Runner
 from google.adk.agents import LiveRequestQueue
 from google.adk.agents.run_config import RunConfig
 from google.genai import types
@@ -26,6 +25,15 @@ from fastapi.responses import FileResponse
 from starlette.websockets import WebSocketDisconnect
 
 from google_search_agent.agent import live_agent
+from session_manager import RunnerRegistry, SessionManager
+from audio_protocol import (
+    FRAME_AUDIO,
+    PROTOCOL_BINARY,
+    PROTOCOL_JSON,
+    decode_frame,
+    encode_audio_frame,
+    sample_rate_from_mime_type,
+)
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
@@ -42,17 +50,15 @@ APP_NAME = "ADK STREAMING APP"
 
 root_agent = live_agent
 
+runner_registry = RunnerRegistry(APP_NAME)
+session_manager = SessionManager(runner_registry.session_service, APP_NAME)
+
 async def start_agent_session(user_id, is_audio=False):
     """Starts an agent session"""
-    runner = InMemoryRunner(
-        app_name=APP_NAME,
-        agent=root_agent,
-    )
+    runner = runner_registry.get_runner(root_agent)
 
-    session = await runner.session_service.create_session(
-        app_name=APP_NAME,
-        user_id=user_id,
-    )
+    session, resumed = await session_manager.acquire(root_agent.name, user_id)
+    print(f"Session {session.id} for user {user_id} ({'resumed' if resumed else 'new'})")
 
     if is_audio:
         modalities = ["AUDIO"]
@@ -68,14 +74,16 @@ async def start_agent_session(user_id, is_audio=False):
     live_request_queue = LiveRequestQueue()
 
     live_events = runner.run_live(
-        session=session,
+        user_id=user_id,
+        session_id=session.id,
         live_request_queue=live_request_queue,
         run_config=run_config,
     )
     return live_events, live_request_queue, session, runner
 
-async def agent_to_client_messaging(websocket, live_events, session, is_audio, runner):
+async def agent_to_client_messaging(websocket, live_events, session, is_audio, runner, use_binary=False):
     """Agent to client communication"""
+    audio_seq = 0
     async for event in live_events:
         if event.input_transcription:
             if hasattr(event.input_transcription, 'text'):
@@ -127,6 +135,12 @@ async def agent_to_client_messaging(websocket, live_events, session, is_audio, r
         is_audio = part.inline_data and part.inline_data.mime_type.startswith("audio/pcm")
         if is_audio:
             audio_data = part.inline_data and part.inline_data.data
+            if audio_data and use_binary:
+                sample_rate = sample_rate_from_mime_type(part.inline_data.mime_type)
+                await websocket.send_bytes(encode_audio_frame(audio_seq, sample_rate, audio_data))
+                audio_seq += 1
+                print(f"[AGENT TO CLIENT]: audio/pcm: {len(audio_data)} bytes (binary).")
+                continue
             if audio_data:
                 message = {
                     "mime_type": "audio/pcm",
@@ -150,8 +164,18 @@ async def client_to_agent_messaging(websocket, live_request_queue):
     """Client to agent communication"""
     try:
         while True:
-            message_json = await websocket.receive_text()
-            message = json.loads(message_json)
+            ws_message = await websocket.receive()
+            if ws_message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(ws_message.get("code", 1000))
+
+            if ws_message.get("bytes") is not None:
+                frame_type, _seq, sample_rate, pcm = decode_frame(ws_message["bytes"])
+                if frame_type != FRAME_AUDIO:
+                    raise ValueError(f"Binary frame type not supported: {frame_type}")
+                live_request_queue.send_realtime(Blob(data=pcm, mime_type=f"audio/pcm;rate={sample_rate}"))
+                continue
+
+            message = json.loads(ws_message["text"])
             mime_type = message["mime_type"]
             data = message["data"]
 
@@ -175,23 +199,29 @@ app = FastAPI()
 STATIC_DIR = Path("static")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+@app.on_event("startup")
+async def start_session_eviction():
+    """Expires idle sessions in the background"""
+    asyncio.create_task(session_manager.run_eviction_loop())
+
 @app.get("/")
 async def root():
     """Serves the index.html"""
     return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str):
+async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str, protocol: str = PROTOCOL_JSON):
     """Client websocket endpoint"""
     await websocket.accept()
-    print(f"Client #{user_id} connected, audio mode: {is_audio}")
+    use_binary = (protocol == PROTOCOL_BINARY)
+    print(f"Client #{user_id} connected, audio mode: {is_audio}, protocol: {protocol}")
 
     user_id_str = str(user_id)
     is_audio_mode = (is_audio == "true")
     live_events, live_request_queue, session, runner = await start_agent_session(user_id_str, is_audio_mode)
 
     agent_to_client_task = asyncio.create_task(
-        agent_to_client_messaging(websocket, live_events, session, is_audio_mode, runner)
+        agent_to_client_messaging(websocket, live_events, session, is_audio_mode, runner, use_binary)
     )
     client_to_agent_task = asyncio.create_task(
         client_to_agent_messaging(websocket, live_request_queue)
@@ -217,4 +247,5 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int, is_audio: str):
                 print(f"[WEBSOCKET ERROR] Task failed: {e}")
     finally:
         live_request_queue.close()
+        await session_manager.release(root_agent.name, user_id_str)
         print(f"Client #{user_id} disconnected")
\ No newline at end of file
@@ -0,0 +1,325 @@
+"""Process metrics in the Prometheus text format, and logging setup.
+
+A small dependency-free registry of counters, gauges and histograms, served
+by GET /metrics. SessionStats counts the traffic of one WebSocket connection,
+feeds the process-wide metrics and is logged as a summary on disconnect.
+
+Logging goes through a queue: log calls on the event loop only enqueue the
+record, and a background thread formats and writes it.
+"""
+
+import atexit
+import bisect
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Seconds; covers sub-millisecond cache hits up to slow LLM round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Milliseconds of audio per WebSocket message or model input chunk
+FRAME_MS_BUCKETS = (10, 20, 40, 60, 80, 100, 150, 200, 300, 500, 1000)
+
+DIRECTION_UPLINK = "uplink"      # client -> server
+DIRECTION_DOWNLINK = "downlink"  # server -> client
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _render_value(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "live_active_sessions", "WebSocket sessions currently connected."))
+FRAMES = REGISTRY.register(Counter(
+    "live_frames_total", "WebSocket messages by direction and kind.", ["direction", "kind"]))
+BYTES = REGISTRY.register(Counter(
+    "live_bytes_total", "Payload bytes by direction and kind.", ["direction", "kind"]))
+TURN_LATENCY = REGISTRY.register(Histogram(
+    "live_turn_latency_seconds", "End of user speech to the first agent audio of the turn."))
+UPLINK_AUDIO_SECONDS = REGISTRY.register(Counter(
+    "live_uplink_audio_seconds_total", "Uplink audio classified by the VAD, by state.", ["state"]))
+UPLINK_FORWARDED_BYTES = REGISTRY.register(Counter(
+    "live_uplink_forwarded_bytes_total", "Uplink audio bytes forwarded to the model after silence trimming."))
+AUDIO_FRAME_MS = REGISTRY.register(Histogram(
+    "live_audio_frame_ms", "Audio per downlink WebSocket message and per uplink chunk sent to the model.",
+    ["direction"], buckets=FRAME_MS_BUCKETS))
+ROUND_TRIP_TIME = REGISTRY.register(Histogram(
+    "ws_round_trip_seconds", "WebSocket round-trip time measured by ping/pong."))
+UPLINK_UNDERRUNS = REGISTRY.register(Counter(
+    "live_uplink_jitter_underruns_total", "Times the uplink jitter buffer ran dry and had to refill."))
+UPLINK_JITTER_DROPPED_SECONDS = REGISTRY.register(Counter(
+    "live_uplink_jitter_dropped_seconds_total", "Client audio dropped because the uplink jitter buffer was full."))
+TOOL_LATENCY = REGISTRY.register(Histogram(
+    "live_tool_call_seconds", "Duration of local tool calls.", ["tool"]))
+RAG_LATENCY = REGISTRY.register(Histogram(
+    "rag_query_seconds", "Knowledge-base query duration by mode and how it was answered.", ["mode", "source"]))
+RAG_PREFETCH = REGISTRY.register(Counter(
+    "rag_prefetch_total", "Speculative knowledge-base lookups from partial transcripts, by outcome.", ["outcome"]))
+RAG_PREFETCH_SAVED = REGISTRY.register(Histogram(
+    "rag_prefetch_saved_seconds", "Lookup time already done when query_docs used a prefetched answer."))
+CONNECT_TO_FIRST_AUDIO = REGISTRY.register(Histogram(
+    "live_connect_to_first_audio_seconds", "WebSocket connect to the first agent audio of the call."))
+UPSTREAM_CONNECT_SECONDS = REGISTRY.register(Histogram(
+    "live_upstream_connect_seconds", "Wait for the upstream live connection, warm from the pool or opened cold.",
+    ["agent", "modality", "source"]))
+LIVE_POOL_READY = REGISTRY.register(Gauge(
+    "live_pool_ready_connections", "Idle pre-warmed upstream live connections.", ["agent", "modality"]))
+LIVE_POOL_EVICTIONS = REGISTRY.register(Counter(
+    "live_pool_evictions_total", "Pre-warmed live connections closed unused, by reason.", ["reason"]))
+SEND_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ws_send_queue_depth", "Outbound WebSocket messages queued and not yet written, over all connections."))
+LAGGING_SESSIONS = REGISTRY.register(Gauge(
+    "ws_lagging_sessions", "Connections whose outbound queue is above its lag watermark."))
+OUTBOUND_DROPPED = REGISTRY.register(Counter(
+    "ws_outbound_dropped_total", "Outbound messages dropped or merged before sending, by reason.", ["reason"]))
+OUTBOUND_DROPPED_BYTES = REGISTRY.register(Counter(
+    "ws_outbound_dropped_bytes_total", "Payload bytes of outbound messages dropped before sending, by reason.", ["reason"]))
+SLOW_CLIENT_DISCONNECTS = REGISTRY.register(Counter(
+    "ws_slow_client_disconnects_total", "Connections closed because the client could not keep up."))
+
+
+class SessionStats:
+    """Traffic and turn latency of one WebSocket connection."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.frames = {DIRECTION_UPLINK: 0, DIRECTION_DOWNLINK: 0}
+        self.bytes = {DIRECTION_UPLINK: 0, DIRECTION_DOWNLINK: 0}
+        self.turns = 0
+        self.turn_latencies = []
+        self.max_queue_depth = 0
+        self.dropped = {}
+        self.speech_seconds = 0.0
+        self.silence_seconds = 0.0
+        self.forwarded_bytes = 0
+        # Set when the VAD marks the end of speech; transcripts are then not used as a stand-in
+        self.vad = False
+        # Connect to the first agent audio of the call
+        self.first_audio_seconds = None
+        # Latest end of user speech with no agent audio after it yet
+        self._speech_end = None
+
+    def count(self, direction, kind, size):
+        FRAMES.inc(direction=direction, kind=kind)
+        BYTES.inc(size, direction=direction, kind=kind)
+        self.frames[direction] += 1
+        self.bytes[direction] += size
+
+    def queue_depth(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def drop(self, reason, count=1, size=0):
+        OUTBOUND_DROPPED.inc(count, reason=reason)
+        if size:
+            OUTBOUND_DROPPED_BYTES.inc(size, reason=reason)
+        self.dropped[reason] = self.dropped.get(reason, 0) + count
+
+    def uplink_audio(self, speech_seconds, silence_seconds, forwarded_bytes):
+        """Adds uplink audio classified by the VAD and the bytes of it forwarded to the model."""
+        UPLINK_AUDIO_SECONDS.inc(speech_seconds, state="speech")
+        UPLINK_AUDIO_SECONDS.inc(silence_seconds, state="silence")
+        UPLINK_FORWARDED_BYTES.inc(forwarded_bytes)
+        self.speech_seconds += speech_seconds
+        self.silence_seconds += silence_seconds
+        self.forwarded_bytes += forwarded_bytes
+
+    def user_speech_ended(self, when=None):
+        """Marks the end of user speech; the next agent audio closes the turn latency."""
+        self._speech_end = when if when is not None else time.monotonic()
+
+    def agent_audio(self):
+        if self.first_audio_seconds is None:
+            self.first_audio_seconds = time.monotonic() - self.started
+            CONNECT_TO_FIRST_AUDIO.observe(self.first_audio_seconds)
+        if self._speech_end is None:
+            return
+        latency = time.monotonic() - self._speech_end
+        self._speech_end = None
+        self.turn_latencies.append(latency)
+        TURN_LATENCY.observe(latency)
+
+    def turn_ended(self):
+        self.turns += 1
+        self._speech_end = None
+
+    def summary(self):
+        latencies = sorted(self.turn_latencies)
+        heard = self.speech_seconds + self.silence_seconds
+        return {
+            "seconds": round(time.monotonic() - self.started, 1),
+            "turns": self.turns,
+            "frames_up": self.frames[DIRECTION_UPLINK],
+            "frames_down": self.frames[DIRECTION_DOWNLINK],
+            "bytes_up": self.bytes[DIRECTION_UPLINK],
+            "bytes_down": self.bytes[DIRECTION_DOWNLINK],
+            "turn_latency_p50_ms": round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+            "first_audio_ms": round(self.first_audio_seconds * 1000) if self.first_audio_seconds is not None else None,
+            "speech_ratio": round(self.speech_seconds / heard, 2) if heard else None,
+            "bytes_forwarded": self.forwarded_bytes if self.vad else None,
+            "max_queue_depth": self.max_queue_depth,
+            "dropped": self.dropped,
+        }
+
+
+def instrument_tools(agent):
+    """Records the duration of the agent's local tool calls in TOOL_LATENCY.
+
+    Each tool's run_async is timed in place, so the agent's own tool
+    callbacks are left as they are and calls that raise are recorded too.
+    """
+    from google.adk.tools import BaseTool, FunctionTool
+    from google.adk.tools.base_toolset import BaseToolset
+
+    # Plain functions become FunctionTools here rather than anew on every call
+    agent.tools = [
+        tool if isinstance(tool, (BaseTool, BaseToolset)) else FunctionTool(tool)
+        for tool in agent.tools
+    ]
+    for tool in agent.tools:
+        if isinstance(tool, BaseTool):
+            _time_tool(tool)
+    return agent
+
+
+def _time_tool(tool):
+    # Tools such as google_search are shared between agents; time them once
+    if getattr(tool, "_timed", False):
+        return
+    run_async = tool.run_async
+
+    async def timed_run_async(*, args, tool_context):
+        start = time.perf_counter()
+        try:
+            result = await run_async(args=args, tool_context=tool_context)
+        except Exception:
+            TOOL_LATENCY.observe(time.perf_counter() - start, tool=tool.name)
+            raise
+        TOOL_LATENCY.observe(time.perf_counter() - start, tool=tool.name)
+        return result
+
+    tool.run_async = timed_run_async
+    tool._timed = True
+
+
+def setup_logging(level="INFO"):
+    """Routes all logging through a queue drained by a background thread."""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    return listener
@@ -0,0 +1,351 @@
+"""Bounded outbound queue for one WebSocket connection.
+
+The handler that consumes the agent's live events only enqueues messages; a
+writer task per connection drains the queue onto the socket. A client on a bad
+link therefore slows down only its own writer, never the event consumer or any
+other connection, and what piles up for it is bounded:
+
+- partial transcript fragments still waiting in the queue are merged into one
+  message (the browser appends fragments anyway);
+- audio still waiting when the model is interrupted is dropped, it would only
+  be played over the user, and the flush message telling the client to stop
+  playing jumps the queue;
+- when the queue is full the oldest queued audio is dropped;
+- a client whose queue stays above the lag watermark for longer than
+  `slow_client_seconds`, or that fills the queue with nothing left to drop,
+  is disconnected.
+
+Audio is queued as raw PCM and framed by the writer, which merges
+consecutive queued chunks into one WebSocket message of up to the target
+frame duration. The model often emits parts of a few milliseconds; sending
+each as its own message costs a header, a syscall and a client-side wakeup.
+The target adapts: it starts at `min_frame_ms`, grows with the round-trip
+time measured by ping/pong (a client that far away gains nothing from tiny
+frames) and jumps to `max_frame_ms` while the client is lagging. A chunk
+shorter than the target waits at most `max_hold_ms` for more audio.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import deque
+
+from audio_protocol import encode_audio_frame
+from metrics import (
+    AUDIO_FRAME_MS,
+    DIRECTION_DOWNLINK,
+    LAGGING_SESSIONS,
+    ROUND_TRIP_TIME,
+    SEND_QUEUE_DEPTH,
+    SLOW_CLIENT_DISCONNECTS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 500 messages is about 20 s of 40 ms audio chunks
+DEFAULT_MAX_MESSAGES = 500
+DEFAULT_LAG_MESSAGES = 50
+DEFAULT_SLOW_CLIENT_SECONDS = 10.0
+
+# Downlink audio frame sizing
+DEFAULT_MIN_FRAME_MS = 40
+DEFAULT_MAX_FRAME_MS = 200
+DEFAULT_MAX_HOLD_MS = 20
+# Share of the measured round-trip time used as the target frame duration
+RTT_FRAME_SHARE = 0.5
+# Weight of a new round-trip sample in the moving average
+RTT_ALPHA = 0.2
+
+DEFAULT_PING_INTERVAL_SECONDS = 5.0
+
+# Close code for clients disconnected for being too slow ("try again later")
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+KIND_AUDIO = "audio"
+KIND_TRANSCRIPT = "transcript"
+KIND_TEXT = "text"
+KIND_CONTROL = "control"
+
+DROP_COALESCED = "coalesced"
+DROP_INTERRUPTED = "interrupted"
+DROP_OVERFLOW = "overflow"
+
+
+class SlowClientError(Exception):
+    """The client cannot keep up with the messages queued for it."""
+
+
+def _payload_size(payload):
+    return len(payload) if isinstance(payload, bytes) else len(payload.get("data") or "")
+
+
+class _Message:
+    __slots__ = ("kind", "payload", "coalesce_key", "sample_rate", "generation", "enqueued")
+
+    def __init__(self, kind, payload, coalesce_key=None, sample_rate=None, generation=0):
+        self.kind = kind
+        # Raw PCM for audio, else a dict sent as JSON text
+        self.payload = payload
+        self.coalesce_key = coalesce_key
+        self.sample_rate = sample_rate
+        self.generation = generation
+        self.enqueued = time.monotonic()
+
+    @property
+    def seconds(self):
+        return len(self.payload) / 2 / self.sample_rate
+
+
+class OutboundQueue:
+    """Queue of messages to one client, written by `run()` in its own task."""
+
+    def __init__(
+        self,
+        websocket,
+        stats,
+        name="",
+        binary=True,
+        max_messages=DEFAULT_MAX_MESSAGES,
+        lag_messages=DEFAULT_LAG_MESSAGES,
+        slow_client_seconds=DEFAULT_SLOW_CLIENT_SECONDS,
+        min_frame_ms=DEFAULT_MIN_FRAME_MS,
+        max_frame_ms=DEFAULT_MAX_FRAME_MS,
+        max_hold_ms=DEFAULT_MAX_HOLD_MS,
+    ):
+        self.websocket = websocket
+        self.stats = stats
+        self.name = name
+        # Binary audio frames, or base64 audio in JSON messages
+        self.binary = binary
+        self.max_messages = max_messages
+        self.lag_messages = lag_messages
+        self.slow_client_seconds = slow_client_seconds
+        self.min_frame_seconds = min_frame_ms / 1000
+        self.max_frame_seconds = max(max_frame_ms, min_frame_ms) / 1000
+        self.max_hold_seconds = max_hold_ms / 1000
+        # Smoothed round-trip time in seconds, None until the first pong
+        self.rtt = None
+        self._audio_seq = 0
+        self._messages = deque()
+        self._ready = asyncio.Event()
+        # When the queue went above lag_messages, None while below it
+        self._lagging_since = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, kind, payload, coalesce_key=None):
+        """Queues a message without waiting; raises SlowClientError when the client is too slow."""
+        if self._closed:
+            return
+        if coalesce_key is not None and self._coalesce(coalesce_key, payload):
+            return
+        self._append(_Message(kind, payload, coalesce_key))
+
+    def put_audio(self, pcm, sample_rate, generation=0):
+        """Queues a chunk of 16-bit PCM; the writer frames it, merged with its neighbours."""
+        if self._closed:
+            return
+        self._append(_Message(KIND_AUDIO, pcm, sample_rate=sample_rate, generation=generation))
+
+    def _append(self, message):
+        if len(self._messages) >= self.max_messages and not self._drop_oldest_audio():
+            raise SlowClientError(f"outbound queue full ({len(self._messages)} messages)")
+        self._messages.append(message)
+        SEND_QUEUE_DEPTH.inc()
+        self.stats.queue_depth(len(self._messages))
+        self._ready.set()
+        self._check_lag()
+
+    def flush_audio(self, message):
+        """Drops all queued audio and queues `message` ahead of everything else.
+
+        Used when the model was interrupted: the audio is stale, and the
+        message telling the client to stop playing should not wait behind
+        transcripts.
+        """
+        if self._closed:
+            return 0
+        kept = deque(queued for queued in self._messages if queued.kind != KIND_AUDIO)
+        dropped = len(self._messages) - len(kept)
+        if dropped:
+            size = sum(_payload_size(queued.payload) for queued in self._messages if queued.kind == KIND_AUDIO)
+            self.stats.drop(DROP_INTERRUPTED, dropped, size)
+        self._messages = kept
+        self._messages.appendleft(_Message(KIND_CONTROL, message))
+        SEND_QUEUE_DEPTH.inc(1 - dropped)
+        self._ready.set()
+        self._check_lag()
+        return dropped
+
+    def _coalesce(self, key, message):
+        """Appends a transcript fragment to a queued one of the same kind, if any."""
+        for queued in reversed(self._messages):
+            if queued.kind == KIND_CONTROL:
+                # Never merge across a turn boundary
+                return False
+            if queued.coalesce_key == key:
+                queued.payload = dict(queued.payload, data=queued.payload["data"] + message["data"])
+                self.stats.drop(DROP_COALESCED)
+                return True
+        return False
+
+    def _drop_oldest_audio(self):
+        for i, queued in enumerate(self._messages):
+            if queued.kind == KIND_AUDIO:
+                del self._messages[i]
+                SEND_QUEUE_DEPTH.dec()
+                self.stats.drop(DROP_OVERFLOW, size=_payload_size(queued.payload))
+                return True
+        return False
+
+    def _check_lag(self):
+        lagging = len(self._messages) > self.lag_messages
+        if lagging and self._lagging_since is None:
+            self._lagging_since = time.monotonic()
+            LAGGING_SESSIONS.inc()
+            logger.warning(f"Client {self.name} is lagging: {len(self._messages)} messages queued")
+        elif not lagging and self._lagging_since is not None:
+            logger.info(f"Client {self.name} caught up after {time.monotonic() - self._lagging_since:.1f}s")
+            self._lagging_since = None
+            LAGGING_SESSIONS.dec()
+        elif lagging and time.monotonic() - self._lagging_since > self.slow_client_seconds:
+            raise SlowClientError(
+                f"{len(self._messages)} messages queued for more than {self.slow_client_seconds:g}s"
+            )
+
+    @property
+    def target_frame_seconds(self):
+        """Downlink audio frame duration the writer currently merges chunks up to."""
+        if self._lagging_since is not None:
+            return self.max_frame_seconds
+        target = self.min_frame_seconds
+        if self.rtt is not None:
+            target = max(target, self.rtt * RTT_FRAME_SHARE)
+        return min(target, self.max_frame_seconds)
+
+    def ping(self):
+        """Queues a ping ahead of everything else; the client echoes it back as a pong."""
+        if self._closed:
+            return
+        self._messages.appendleft(_Message(KIND_CONTROL, {"ping": time.monotonic()}))
+        SEND_QUEUE_DEPTH.inc()
+        self._ready.set()
+
+    def pong(self, sent):
+        """Records the round-trip time of a ping from the time it carried."""
+        rtt = time.monotonic() - float(sent)
+        if rtt < 0:
+            return
+        ROUND_TRIP_TIME.observe(rtt)
+        self.rtt = rtt if self.rtt is None else self.rtt + RTT_ALPHA * (rtt - self.rtt)
+
+    async def run_pings(self, interval=DEFAULT_PING_INTERVAL_SECONDS):
+        while not self._closed:
+            self.ping()
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        """Writes queued messages to the socket until it fails or the queue is closed."""
+        while not self._closed:
+            if not self._messages:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            head = self._messages[0]
+            if head.kind == KIND_AUDIO and await self._hold_for_audio(head):
+                # More audio arrived or the head changed; look again
+                continue
+            if head.kind == KIND_AUDIO:
+                await self._send_audio()
+            else:
+                self._messages.popleft()
+                SEND_QUEUE_DEPTH.dec()
+                data = json.dumps(head.payload)
+                await self.websocket.send_text(data)
+                self.stats.count(DIRECTION_DOWNLINK, head.kind, len(data))
+            if self._lagging_since is not None:
+                self._check_lag()
+
+    def _queued_audio(self):
+        """The run of audio chunks at the head of the queue that can share one frame."""
+        head = self._messages[0]
+        run = []
+        seconds = 0.0
+        target = self.target_frame_seconds
+        for message in self._messages:
+            if (
+                message.kind != KIND_AUDIO
+                or message.generation != head.generation
+                or message.sample_rate != head.sample_rate
+                or (run and seconds + message.seconds > target)
+            ):
+                break
+            run.append(message)
+            seconds += message.seconds
+        return run, seconds
+
+    async def _hold_for_audio(self, head):
+        """Waits briefly for more audio when the head is short of a frame; True if it waited."""
+        run, seconds = self._queued_audio()
+        if len(run) < len(self._messages) or seconds >= self.target_frame_seconds:
+            # Something else is queued behind the audio, or the frame is full
+            return False
+        remaining = head.enqueued + self.max_hold_seconds - time.monotonic()
+        if remaining <= 0:
+            return False
+        self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+        return True
+
+    async def _send_audio(self):
+        run, seconds = self._queued_audio()
+        for _ in run:
+            self._messages.popleft()
+        SEND_QUEUE_DEPTH.dec(len(run))
+        pcm = b"".join(message.payload for message in run)
+        head = run[0]
+        if self.binary:
+            data = encode_audio_frame(self._audio_seq, head.sample_rate, pcm, head.generation)
+            self._audio_seq += 1
+            await self.websocket.send_bytes(data)
+        else:
+            data = json.dumps({
+                "mime_type": "audio/pcm",
+                "data": base64.b64encode(pcm).decode("ascii"),
+                "generation": head.generation,
+            })
+            await self.websocket.send_text(data)
+        AUDIO_FRAME_MS.observe(seconds * 1000, direction=DIRECTION_DOWNLINK)
+        self.stats.count(DIRECTION_DOWNLINK, KIND_AUDIO, len(data))
+
+    async def disconnect_slow_client(self, reason):
+        """Closes the connection of a client that could not keep up."""
+        SLOW_CLIENT_DISCONNECTS.inc()
+        logger.warning(f"Disconnecting slow client {self.name}: {reason}")
+        self.close()
+        try:
+            # The socket may be the thing that is stuck; do not wait on it for long
+            await asyncio.wait_for(
+                self.websocket.close(code=SLOW_CLIENT_CLOSE_CODE, reason="client too slow"), timeout=1.0
+            )
+        except Exception:
+            pass
+
+    def close(self):
+        """Discards everything still queued and stops the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        SEND_QUEUE_DEPTH.dec(len(self._messages))
+        self._messages.clear()
+        if self._lagging_since is not None:
+            self._lagging_since = None
+            LAGGING_SESSIONS.dec()
+        self._ready.set()
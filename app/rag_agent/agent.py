@@ -1,27 +1,101 @@
+import os
+import asyncio
+import time
+from collections import defaultdict
+
 from dotenv import load_dotenv
 load_dotenv()
 
 from google.adk.agents import Agent
-from google.adk.tools import google_search, FunctionTool
-from .knowledge_base import KnowledgeBaseManager
+from google.adk.tools import google_search, FunctionTool, ToolContext
+from .knowledge_base import (
+    KnowledgeBaseManager,
+    QUERY_MODE_RETRIEVE,
+    QUERY_MODE_SYNTHESIZE,
+    QUERY_MODES,
+    VECTOR_STORE_MMAP,
+    EMBEDDING_BACKEND_GEMINI,
+    DEFAULT_EMBEDDING_BATCH_WINDOW_MS,
+)
+from .answer_cache import AnswerCache, DEFAULT_SIMILARITY_THRESHOLD
+from .prefetch import QueryPrefetcher
 
-# Initialize the knowledge base
-knowledge_base = KnowledgeBaseManager()
-knowledge_base.build_index()
+# Initialize the knowledge base. Set ANSWER_CACHE_PATH to keep cached answers
+# across restarts.
+knowledge_base = KnowledgeBaseManager(
+    answer_cache=AnswerCache(
+        similarity_threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)),
+        persist_path=os.environ.get("ANSWER_CACHE_PATH") or None,
+    ),
+    vector_store_backend=os.environ.get("VECTOR_STORE_BACKEND", VECTOR_STORE_MMAP),
+    embedding_backend=os.environ.get("EMBEDDING_BACKEND", EMBEDDING_BACKEND_GEMINI),
+    embedding_batch_window_ms=float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", DEFAULT_EMBEDDING_BATCH_WINDOW_MS)),
+)
+# The index is not built here: the web app loads it in the background at
+# startup, and the first query builds it if nothing else has
 
-# Define the query_docs tool
-def query_docs(query: str) -> str:
-    """Queries the custom knowledge base to get information about FSM Armenian company."""
-    return knowledge_base.query(query)
+# Longest a query_docs call may take before the model is told the knowledge
+# base did not respond; ADK runs the calls of one turn concurrently, so a slow
+# query does not hold up a google_search issued alongside it
+DEFAULT_QUERY_DOCS_TIMEOUT_SECONDS = 10.0
 
-query_docs_tool = FunctionTool(query_docs)
+# Knowledge-base queries in flight per ADK session, so they can be cancelled
+# when the user interrupts the turn or disconnects
+_inflight_queries = defaultdict(set)
 
-# Create the RAG agent
-rag_agent = Agent(
-    name="rag_agent",
-    model="gemini-2.5-flash-native-audio-preview-09-2025",
-    description="A voice agent that answers questions about FSM Armenian company using a custom knowledge base, with Armenian language support.",
-    instruction="""You are a helpful voice assistant for FSM Armenian company.
+def cancel_inflight_queries(session_id):
+    """Cancels the knowledge-base queries started by a session."""
+    tasks = _inflight_queries.pop(session_id, set())
+    for task in tasks:
+        task.cancel()
+    return len(tasks)
+
+def make_query_docs_tool(mode=QUERY_MODE_SYNTHESIZE, timeout=DEFAULT_QUERY_DOCS_TIMEOUT_SECONDS, prefetcher=None):
+    """Builds a query_docs tool that queries the knowledge base in the given mode.
+
+    With a QueryPrefetcher, a lookup already started from the user's words is
+    used when it matches the query.
+    """
+    if mode not in QUERY_MODES:
+        raise ValueError(f"Unknown query mode: {mode}")
+
+    async def answer(session_id, query):
+        if prefetcher is None:
+            return await knowledge_base.aquery(query, timeout=timeout, mode=mode)
+        deadline = time.monotonic() + timeout
+        prefetched = await asyncio.wait_for(prefetcher.take(session_id, query), timeout)
+        if prefetched is not None:
+            return prefetched
+        # One budget for the call: the fallback query gets what the prefetch left
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        return await knowledge_base.aquery(query, timeout=remaining, mode=mode)
+
+    async def query_docs(query: str, tool_context: ToolContext) -> str:
+        """Queries the custom knowledge base to get information about FSM Armenian company."""
+        session_id = tool_context.session.id
+        task = asyncio.ensure_future(answer(session_id, query))
+        _inflight_queries[session_id].add(task)
+        try:
+            return await task
+        except asyncio.TimeoutError:
+            return f"The knowledge base did not respond within {timeout:g} seconds."
+        except asyncio.CancelledError:
+            # Only swallow our own cancellation, not the cancellation of the tool call
+            if asyncio.current_task().cancelling():
+                raise
+            return "The knowledge base query was cancelled because the user interrupted."
+        finally:
+            tasks = _inflight_queries.get(session_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del _inflight_queries[session_id]
+
+    return FunctionTool(query_docs)
+
+_INSTRUCTION = """You are a helpful voice assistant for FSM Armenian company.
 Your primary language is Armenian.
 
 IMPORTANT RULES:
@@ -30,6 +104,31 @@ IMPORTANT RULES:
 - When an answer is provided from an internet search, you must explicitly inform the user that the information was obtained from the internet.
 - If you cannot find an answer in either the custom knowledge base or through internet search, state that you cannot find an answer.
 - Keep responses brief and conversational.
-""",
-    tools=[query_docs_tool, google_search]
+"""
+
+_RETRIEVE_INSTRUCTION = """- The `query_docs` tool returns numbered excerpts from the knowledge base, best match first. Answer only from the excerpts that are relevant to the question.
+"""
+
+def create_rag_agent(query_mode=QUERY_MODE_SYNTHESIZE, query_timeout=DEFAULT_QUERY_DOCS_TIMEOUT_SECONDS, prefetcher=None):
+    """Creates the RAG agent; query_mode selects "retrieve" or "synthesize" for query_docs."""
+    instruction = _INSTRUCTION
+    if query_mode == QUERY_MODE_RETRIEVE:
+        instruction += _RETRIEVE_INSTRUCTION
+    return Agent(
+        name="rag_agent",
+        model="gemini-2.5-flash-native-audio-preview-09-2025",
+        description="A voice agent that answers questions about FSM Armenian company using a custom knowledge base, with Armenian language support.",
+        instruction=instruction,
+        tools=[make_query_docs_tool(query_mode, query_timeout, prefetcher), google_search]
+    )
+
+# Create the RAG agent
+rag_query_mode = os.environ.get("RAG_QUERY_MODE", QUERY_MODE_SYNTHESIZE)
+# Set RAG_PREFETCH=1 to start lookups from the user's partial transcript
+# (fed by the web app); None when off
+query_prefetcher = QueryPrefetcher(knowledge_base, rag_query_mode) if os.environ.get("RAG_PREFETCH") == "1" else None
+rag_agent = create_rag_agent(
+    rag_query_mode,
+    float(os.environ.get("QUERY_DOCS_TIMEOUT_SECONDS", DEFAULT_QUERY_DOCS_TIMEOUT_SECONDS)),
+    query_prefetcher,
 )
@@ -0,0 +1,224 @@
+"""Two-tier answer cache in front of KnowledgeBaseManager.query.
+
+The exact tier matches queries by their normalized text (see armenian.py). The
+semantic tier reuses an answer when the new query embedding is within a cosine
+similarity threshold of a cached query embedding. Entries are evicted least
+recently used first and expire after a TTL. The cache is tied to an index
+fingerprint and is cleared when the index changes.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .armenian import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_SIMILARITY_THRESHOLD = 0.93
+# Minimum interval between automatic saves of a persistent cache
+SAVE_INTERVAL_SECONDS = 30
+
+
+class _CacheEntry:
+    def __init__(self, mode, answer, embedding, created):
+        self.mode = mode
+        self.answer = answer
+        self.embedding = embedding
+        self.created = created
+
+
+class AnswerCache:
+    """LRU/TTL cache of knowledge-base answers with exact and semantic lookup."""
+
+    def __init__(
+        self,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+        persist_path=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # None disables the semantic tier
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path
+
+        # (mode, normalized query) -> _CacheEntry, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # Bumped by every invalidation that clears the cache, see put()
+        self._generation = 0
+        self._last_save = 0.0
+        self._dirty = False
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        if persist_path:
+            self._load()
+
+    @property
+    def semantic_enabled(self):
+        return self.similarity_threshold is not None
+
+    @property
+    def generation(self):
+        """Changes whenever the cache is cleared for a new index; pass it to put()."""
+        return self._generation
+
+    def get_exact(self, query_text, mode):
+        """Returns the cached answer for an equivalent query text, or None."""
+        key = (mode, normalize_text(query_text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, time.time()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def get_semantic(self, embedding, mode):
+        """Returns the answer of the closest cached query above the threshold, or None."""
+        if not self.semantic_enabled or embedding is None:
+            self._count_miss()
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.mode == mode and entry.embedding is not None and not self._expired(entry, now)
+            ]
+            if not candidates or query_norm == 0:
+                self.misses += 1
+                return None
+            matrix = np.stack([entry.embedding for _, entry in candidates])
+            norms = np.linalg.norm(matrix, axis=1) * query_norm
+            similarities = matrix @ query / np.where(norms == 0, 1, norms)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            logger.info(f"Semantic cache hit (similarity {similarities[best]:.3f})")
+            return entry.answer
+
+    def put(self, query_text, mode, answer, embedding=None, generation=None):
+        """Caches an answer under the normalized query text.
+
+        `generation` is the cache's generation from before the answer's index
+        snapshot was taken; an answer computed on an index that has been
+        replaced since is not cached.
+        """
+        key = (mode, normalize_text(query_text))
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                logger.info(f"Not caching the answer to '{query_text}': the index changed while it was computed")
+                return
+            self._entries[key] = _CacheEntry(mode, answer, embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        if self.persist_path and time.monotonic() - self._last_save > SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def invalidate(self, fingerprint):
+        """Clears the cache unless it already belongs to the given index fingerprint."""
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return
+            if self._entries:
+                logger.info(f"Index changed, dropping {len(self._entries)} cached answers")
+            self._entries.clear()
+            self._fingerprint = fingerprint
+            self._generation += 1
+            self._dirty = True
+
+    def stats(self):
+        """Returns hit/miss counters and the overall hit rate."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+    def save(self):
+        """Writes the cache to persist_path, if one is configured."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "fingerprint": self._fingerprint,
+                "entries": [
+                    {
+                        "mode": mode,
+                        "query": normalized,
+                        "answer": entry.answer,
+                        "embedding": entry.embedding.tolist() if entry.embedding is not None else None,
+                        "created": entry.created,
+                    }
+                    for (mode, normalized), entry in self._entries.items()
+                ],
+            }
+            self._dirty = False
+            self._last_save = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable answer cache {self.persist_path}: {e}")
+            return
+        now = time.time()
+        self._fingerprint = data.get("fingerprint")
+        for item in data.get("entries", []):
+            embedding = item.get("embedding")
+            entry = _CacheEntry(
+                item["mode"],
+                item["answer"],
+                np.asarray(embedding, dtype=np.float32) if embedding is not None else None,
+                item["created"],
+            )
+            if not self._expired(entry, now):
+                self._entries[(item["mode"], item["query"])] = entry
+        logger.info(f"Loaded {len(self._entries)} cached answers from {self.persist_path}")
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.created > self.ttl_seconds
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
@@ -0,0 +1,85 @@
+"""Text normalization and tokenization for Armenian (and mixed Armenian/Latin) text."""
+
+import re
+import unicodedata
+
+# Armenian marks written inside a word (ի՞նչ, բա՛ց, ո՜վ) and the abbreviation
+# mark: dropped so the bare word matches
+_INTRAWORD_MARKS = dict.fromkeys(map(ord, "՛՜՞՟"))
+
+# The ligature "և" is spelled "ԵՎ" in capitals under the reformed orthography,
+# so fold it to "եվ" rather than to its Unicode decomposition "եւ"
+_LIGATURES = str.maketrans({"և": "եվ"})
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Folds case, ligatures and punctuation so equivalent queries compare equal.
+
+    - the ligature "և" spelled out as "եվ", then NFKC
+    - case folding, which covers the Armenian alphabet
+    - Armenian emphasis, exclamation and question marks removed in place
+    - any other punctuation (։ ՝ « » , . ? etc.) replaced by a space
+    - whitespace collapsed
+    """
+    text = unicodedata.normalize("NFKC", text.translate(_LIGATURES)).casefold()
+    text = text.translate(_INTRAWORD_MARKS)
+    text = "".join(
+        " " if unicodedata.category(ch).startswith(("P", "S")) else ch
+        for ch in text
+    )
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+# Plural, case and article endings, longest first. Only one is stripped, and
+# only if at least MIN_STEM_LENGTH letters remain, so "հաշտարարին" and
+# "հաշտարարի" both index as "հաշտարար"
+_SUFFIXES = (
+    "ներից", "ներով", "ներում", "ներին", "ների", "ները", "ներն",
+    "երից", "երով", "երում", "երին", "երի", "երը", "երն",
+    "ներ", "եր", "ում", "ից", "ով", "ին", "ը", "ն", "ի",
+)
+MIN_STEM_LENGTH = 3
+
+# Function words that carry no meaning for retrieval
+STOPWORDS = frozenset({
+    "եվ", "ու", "է", "են", "եմ", "ես", "ենք", "եք", "էր", "որ", "թե", "կամ",
+    "այս", "այդ", "այն", "մի", "համար", "հետ", "մասին", "իսկ", "բայց", "նաեվ",
+    "a", "an", "and", "are", "for", "in", "is", "of", "on", "or", "the", "to",
+})
+
+# Digits and letters are split apart, so "10մլն" matches "10 մլն"
+_TOKEN = re.compile(r"\d+|[^\W\d_]+")
+
+
+def stem(word):
+    """Strips one Armenian inflectional ending from a normalized word."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """Splits text into normalized, stemmed terms for lexical search.
+
+    Numbers are kept as they are. Runs of consecutive numbers are also joined
+    into one term, so a phone number written as "060 70-11-11" also matches
+    "060701111".
+    """
+    tokens = []
+    digit_run = []
+    for token in _TOKEN.findall(normalize_text(text)):
+        if token.isdigit():
+            tokens.append(token)
+            digit_run.append(token)
+            continue
+        if len(digit_run) > 1:
+            tokens.append("".join(digit_run))
+        digit_run = []
+        if token not in STOPWORDS:
+            tokens.append(stem(token))
+    if len(digit_run) > 1:
+        tokens.append("".join(digit_run))
+    return tokens
@@ -0,0 +1,260 @@
+"""Micro-batching of embedding requests across sessions.
+
+Every query_docs call embeds its question, and ingestion embeds document
+chunks. EmbeddingBatcher collects these requests from all threads for a few
+milliseconds, embeds the distinct texts of the window in one backend call
+and hands each waiter its vector, so a burst of concurrent questions costs
+one round-trip instead of one each. Identical texts in the same window are
+embedded once. Questions and document chunks are batched separately, so a
+large upload does not delay the questions asked meanwhile.
+
+Backends are callables that take a list of texts and return one vector per
+text. GeminiBatchBackend uses the Gemini batch endpoint; HashEmbeddingBackend
+is a deterministic offline stand-in for tests and load runs.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# How long a window stays open after its first request
+DEFAULT_WINDOW_MS = 5.0
+# Texts per backend call; the Gemini batch endpoint takes at most 100
+DEFAULT_MAX_BATCH_SIZE = 100
+# Document batches in flight at once
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+# Query batches in flight at once; they have their own executor
+DEFAULT_MAX_CONCURRENT_QUERY_BATCHES = 2
+
+# Lanes: question embeddings are never queued behind document chunks
+LANE_QUERY = "query"
+LANE_DOCUMENT = "document"
+
+
+class GeminiBatchBackend:
+    """Embeds a list of texts with one batchEmbedContents request per 100 texts.
+
+    Uses the same model and task type as llama_index's GeminiEmbedding, so
+    vectors match those already in the index and the embedding cache.
+    """
+
+    def __init__(self, model_name, api_key=None, task_type="retrieval_document"):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model_name = model_name
+        self.task_type = task_type
+
+    def __call__(self, texts):
+        return self._genai.embed_content(model=self.model_name, content=list(texts), task_type=self.task_type)["embedding"]
+
+
+class HashEmbeddingBackend:
+    """Deterministic unit vectors derived from the SHA-256 of each text; no network.
+
+    Equal texts get equal vectors and different texts unrelated ones, which is
+    enough to exercise batching, caching and the index offline. `latency`
+    simulates the round-trip of a real backend.
+    """
+
+    def __init__(self, dim=64, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_name = f"hash-{dim}"
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+class _Lane:
+    """Requests of one kind waiting for their window, and the executor their batches run on."""
+
+    __slots__ = ("name", "pending", "window_start", "executor")
+
+    def __init__(self, name, max_concurrent_batches):
+        self.name = name
+        # text -> Future of its vector, for the window being collected
+        self.pending = {}
+        self.window_start = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_batches,
+            thread_name_prefix=f"embed-{name}",
+        )
+
+
+class EmbeddingBatcher:
+    """Collects embedding requests from all threads and sends them to the backend in batches.
+
+    Query and document texts are batched in separate lanes with their own
+    executors, so the batches of a large upload never queue in front of a
+    question's embedding.
+    """
+
+    def __init__(
+        self,
+        backend,
+        window_ms=DEFAULT_WINDOW_MS,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        max_concurrent_batches=DEFAULT_MAX_CONCURRENT_BATCHES,
+        max_concurrent_query_batches=DEFAULT_MAX_CONCURRENT_QUERY_BATCHES,
+    ):
+        self.backend = backend
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Texts requested, texts served from another request in the same window,
+        # backend calls and texts sent to the backend
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.embedded = 0
+        self._lanes = {
+            LANE_QUERY: _Lane(LANE_QUERY, max_concurrent_query_batches),
+            LANE_DOCUMENT: _Lane(LANE_DOCUMENT, max_concurrent_batches),
+        }
+        self._condition = threading.Condition()
+        self._dispatcher = None
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "batches": self.batches,
+            "embedded": self.embedded,
+        }
+
+    def submit(self, texts, lane=LANE_DOCUMENT):
+        """Queues texts for the lane's current window and returns a Future per text."""
+        futures = []
+        with self._condition:
+            lane = self._lanes[lane]
+            for text in texts:
+                self.requests += 1
+                future = lane.pending.get(text)
+                if future is None:
+                    future = lane.pending[text] = Future()
+                else:
+                    self.deduplicated += 1
+                futures.append(future)
+            if lane.window_start is None:
+                lane.window_start = time.monotonic()
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return futures
+
+    def embed(self, texts, lane=LANE_DOCUMENT):
+        """Blocks until every text has been embedded and returns the vectors in order."""
+        return [future.result() for future in self.submit(texts, lane)]
+
+    async def aembed(self, texts, lane=LANE_DOCUMENT):
+        futures = [asyncio.wrap_future(future) for future in self.submit(texts, lane)]
+        return list(await asyncio.gather(*futures))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    lane, remaining = self._next_due()
+                    if lane is not None and remaining <= 0:
+                        break
+                    # Sleep until the earliest window closes or a request arrives
+                    self._condition.wait(remaining)
+                texts = list(lane.pending)[:self.max_batch_size]
+                batch = {text: lane.pending.pop(text) for text in texts}
+                lane.window_start = time.monotonic() if lane.pending else None
+                self.batches += 1
+                self.embedded += len(batch)
+            lane.executor.submit(self._embed_batch, batch)
+
+    def _next_due(self):
+        """The lane whose batch is due first, queries first, and the seconds until it is."""
+        due, due_in = None, None
+        for lane in self._lanes.values():
+            if not lane.pending:
+                continue
+            if len(lane.pending) >= self.max_batch_size:
+                # A full window is sent without waiting out the rest of it
+                return lane, 0.0
+            remaining = lane.window_start + self.window_seconds - time.monotonic()
+            if due_in is None or remaining < due_in:
+                due, due_in = lane, remaining
+        return due, due_in
+
+    def _embed_batch(self, batch):
+        try:
+            vectors = self.backend(list(batch))
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(batch)} texts")
+        except Exception as e:
+            logger.warning(f"Embedding batch of {len(batch)} texts failed: {e}")
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        for future, vector in zip(batch.values(), vectors):
+            future.set_result(vector)
+
+
+class BatchedEmbedding(BaseEmbedding):
+    """A LlamaIndex embedding model whose requests all go through one EmbeddingBatcher.
+
+    Queries and documents are embedded the same way, as GeminiEmbedding does
+    with its single task type, so both share the batches.
+    """
+
+    _batcher: Any = PrivateAttr()
+
+    def __init__(self, batcher, **kwargs):
+        super().__init__(
+            model_name=batcher.backend.model_name,
+            embed_batch_size=batcher.max_batch_size,
+            **kwargs,
+        )
+        self._batcher = batcher
+
+    @classmethod
+    def class_name(cls):
+        return "BatchedEmbedding"
+
+    @property
+    def batcher(self):
+        return self._batcher
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._batcher.embed([query], LANE_QUERY)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._batcher.aembed([query], LANE_QUERY))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._batcher.embed([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._batcher.aembed([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._batcher.embed(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._batcher.aembed(texts)
@@ -0,0 +1,243 @@
+"""Content-addressed on-disk cache of document embeddings.
+
+Vectors are keyed by the SHA-256 of the exact text that was embedded, one cache
+per embedding model. Each model gets two files in the cache directory:
+
+    <model>.f32         float32 matrix, one row per cached text, append-only
+    <model>.index.json  {"dim": D, "rows": {sha256: row}}
+
+The matrix is memory-mapped for lookups. Rebuilding an unchanged corpus reads
+every vector from the cache and makes no embedding calls; re-chunking only
+pays for the chunks whose text changed.
+
+Worker processes may share the cache directory. Appends take an exclusive
+file lock (`<model>.lock`) and re-read the index from disk first, so each
+writer appends after the rows the others have written; readers pick up
+another writer's index when its file changes.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: the cache is not shared between processes there
+    fcntl = None
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Append-only float32 vector store keyed by content hash."""
+
+    def __init__(self, cache_dir, model_name):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.vectors_path = os.path.join(cache_dir, f"{safe_name}.f32")
+        self.index_path = os.path.join(cache_dir, f"{safe_name}.index.json")
+        self.lock_path = os.path.join(cache_dir, f"{safe_name}.lock")
+
+        self.dim = None
+        self._rows = {}
+        self._matrix = None
+        # (mtime_ns, size) of the index file self._rows was read from or written to
+        self._index_stamp = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, keys):
+        """Returns a list with the cached vector for each key, or None."""
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                # Another worker may have embedded them since
+                self._refresh()
+            if not self._rows:
+                return [None] * len(keys)
+            matrix = self._map()
+            return [
+                np.array(matrix[self._rows[key]]) if key in self._rows else None
+                for key in keys
+            ]
+
+    def put_many(self, keys, vectors):
+        """Appends new vectors to the cache and records their rows."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock, self._file_lock():
+            # Rows appended by other workers since this one last read the index
+            self._refresh()
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = np.asarray(vector, dtype=np.float32)
+            if not new:
+                return
+            dim = len(next(iter(new.values())))
+            if self.dim is None:
+                self.dim = dim
+            elif dim != self.dim:
+                raise ValueError(f"Embedding dimension changed from {self.dim} to {dim} for {self.model_name}")
+
+            # Vectors first, then the index: a crash in between only leaves
+            # unreferenced rows at the end of the matrix
+            first_row = len(self._rows)
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                f.seek(first_row * self.dim * 4)
+                f.write(np.stack(list(new.values())).astype(np.float32).tobytes())
+                f.truncate()
+            for offset, key in enumerate(new):
+                self._rows[key] = first_row + offset
+            self._matrix = None
+            self._save_index()
+
+    def _map(self):
+        # Caller holds self._lock
+        if self._matrix is None:
+            self._matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self._rows), self.dim)
+            )
+        return self._matrix
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Serializes appends between processes that share cache_dir."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stat_index(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        # Caller holds self._lock
+        if self._stat_index() != self._index_stamp:
+            self._load()
+
+    def _load(self):
+        # Caller holds self._lock, or is the constructor
+        self._matrix = None
+        self._index_stamp = self._stat_index()
+        if not (os.path.exists(self.index_path) and os.path.exists(self.vectors_path)):
+            return
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable embedding cache index {self.index_path}: {e}")
+            return
+        dim = data.get("dim")
+        rows = data.get("rows", {})
+        available = os.path.getsize(self.vectors_path) // (4 * dim) if dim else 0
+        # Keep only rows that are fully written
+        self.dim = dim
+        self._rows = {key: row for key, row in rows.items() if row < available}
+        if len(self._rows) != len(rows) or sorted(self._rows.values()) != list(range(len(self._rows))):
+            logger.warning(f"Embedding cache {self.index_path} is inconsistent, starting empty")
+            self._rows = {}
+        logger.info(f"Loaded {len(self._rows)} cached embeddings for {self.model_name}")
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "rows": self._rows}, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_stamp = self._stat_index()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embedding model and serves document embeddings from an EmbeddingCache.
+
+    Query embeddings are passed through to the wrapped model uncached.
+    """
+
+    _inner: Any = PrivateAttr()
+    _cache: Any = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, inner, cache, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def inner(self):
+        return self._inner
+
+    def cache_stats(self):
+        return {"hits": self._hits, "misses": self._misses, "entries": len(self._cache)}
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._inner._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._inner._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup(texts)
+        if missing:
+            computed = self._inner._get_text_embeddings([texts[i] for i in missing])
+            self._store(keys, embeddings, missing, computed)
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, embeddings, missing = self._lookup(texts)
+        if missing:
+            computed = await self._inner._aget_text_embeddings([texts[i] for i in missing])
+            self._store(keys, embeddings, missing, computed)
+        return embeddings
+
+    def _lookup(self, texts):
+        keys = [content_hash(text) for text in texts]
+        cached = self._cache.get_many(keys)
+        embeddings = [vector.tolist() if vector is not None else None for vector in cached]
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        self._hits += len(texts) - len(missing)
+        self._misses += len(missing)
+        return keys, embeddings, missing
+
+    def _store(self, keys, embeddings, missing, computed):
+        for i, vector in zip(missing, computed):
+            embeddings[i] = vector
+        self._cache.put_many([keys[i] for i in missing], computed)
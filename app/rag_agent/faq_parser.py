@@ -0,0 +1,133 @@
+"""Node parser for the FAQ markdown format of fsm-faq.md.
+
+The FAQ is a list of numbered entries under bold section headings:
+
+    **ԱՊԱՀՈՎԱԳՐՈՒԹՅՈՒՆ**
+
+    **ԱՊՊԱ**
+
+    1. ***question***
+
+    answer...
+
+Each entry becomes one answer node holding the whole question and answer, so
+one retrieved node covers one answer. The question is also indexed as a node
+of its own that points to the answer node, so a query is matched against the
+question text alone as well as against the full entry. Documents without any
+***question*** lines are split by the fallback parser instead.
+"""
+
+import re
+from typing import Any, List, Sequence
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser, SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode
+
+# Node metadata set by this parser
+SECTION_KEY = "section"
+QUESTION_NUMBER_KEY = "question_number"
+QUESTION_KEY = "question"
+FAQ_ROLE_KEY = "faq_role"
+ANSWER_NODE_ID_KEY = "answer_node_id"
+FAQ_ROLE_ANSWER = "answer"
+FAQ_ROLE_QUESTION = "question"
+
+# Bookkeeping keys kept out of the embedded and LLM-visible text
+_HIDDEN_KEYS = [QUESTION_NUMBER_KEY, QUESTION_KEY, FAQ_ROLE_KEY, ANSWER_NODE_ID_KEY]
+
+# "1. ***question***" or "***12․ question***", with "." or the Armenian "․"
+_QUESTION = re.compile(r"^\s*(?:(\d+)[.․]\s*)?\*\*\*\s*(?:(\d+)[.․]\s*)?(.+?)\s*\*\*\*\s*$")
+# "**SECTION**" on a line of its own
+_SECTION = re.compile(r"^\s*\*\*([^*].*?)\*\*\s*$")
+
+
+class _Entry:
+    def __init__(self, section, number, question, line):
+        self.section = section
+        self.number = number
+        self.question = question
+        self.lines = [line]
+        self.has_answer = False
+
+
+def split_faq(text):
+    """Splits FAQ markdown into entries; returns an empty list for other text."""
+    entries = []
+    headings = []
+    section = None
+    entry = None
+    for line in text.splitlines():
+        question = _QUESTION.match(line)
+        if question:
+            number, inner_number, question_text = question.groups()
+            number = number or inner_number
+            if entry is not None and not entry.has_answer and number is None:
+                # A question that continues on a second ***...*** line
+                entry.question += " " + question_text
+                entry.lines.append(line)
+                continue
+            if headings:
+                # Consecutive headings are nested: "ԱՊԱՀՈՎԱԳՐՈՒԹՅՈՒՆ / ԱՊՊԱ"
+                section = " / ".join(headings)
+                headings = []
+            entry = _Entry(section, int(number) if number else None, question_text, line)
+            entries.append(entry)
+            continue
+
+        heading = _SECTION.match(line)
+        if heading:
+            headings.append(heading.group(1).strip())
+            entry = None
+            continue
+
+        if entry is not None:
+            entry.lines.append(line)
+            if line.strip():
+                entry.has_answer = True
+    return entries
+
+
+class FAQNodeParser(NodeParser):
+    """Emits one answer node and one question node per FAQ entry."""
+
+    fallback: NodeParser = Field(
+        default_factory=SentenceSplitter,
+        description="Parser for documents that are not in the FAQ format.",
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FAQNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        parsed = []
+        for node in nodes:
+            entries = split_faq(node.get_content())
+            if not entries:
+                parsed.extend(self.fallback.get_nodes_from_documents([node], show_progress=show_progress))
+                continue
+            parsed.extend(self._entry_nodes(node, entries))
+        return parsed
+
+    def _entry_nodes(self, document, entries):
+        # Stable ids, so re-ingesting an unchanged entry yields the same node
+        answer_ids = [f"{document.node_id}-faq-{ordinal}" for ordinal in range(len(entries))]
+        ids = answer_ids + [f"{answer_id}-question" for answer_id in answer_ids]
+        texts = ["\n".join(entry.lines).strip() for entry in entries] + [entry.question for entry in entries]
+        nodes = build_nodes_from_splits(texts, document, id_func=lambda i, _: ids[i])
+
+        for i, node in enumerate(nodes):
+            entry = entries[i % len(entries)]
+            node.metadata.update({
+                SECTION_KEY: entry.section or "",
+                QUESTION_NUMBER_KEY: entry.number,
+                QUESTION_KEY: entry.question,
+                FAQ_ROLE_KEY: FAQ_ROLE_ANSWER if i < len(entries) else FAQ_ROLE_QUESTION,
+            })
+            if i >= len(entries):
+                node.metadata[ANSWER_NODE_ID_KEY] = answer_ids[i - len(entries)]
+            node.excluded_embed_metadata_keys = list(node.excluded_embed_metadata_keys) + _HIDDEN_KEYS
+            node.excluded_llm_metadata_keys = list(node.excluded_llm_metadata_keys) + _HIDDEN_KEYS
+        return nodes
@@ -0,0 +1,200 @@
+"""Background document ingestion with a job queue.
+
+Uploads are queued and return a job id right away. A worker task takes each
+job through three stages without ever blocking the event loop:
+
+    parsing    SimpleDirectoryReader + chunking, in a process pool
+    embedding  chunk embeddings in batches, a bounded number in flight
+    indexing   KnowledgeBaseManager.add_parsed_document on a thread
+
+Up to `parse_workers` jobs are parsed and embedded at the same time; the
+indexing stage takes one job at a time so index updates never race.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARSE_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_MAX_CONCURRENT_EMBED_BATCHES = 4
+# Finished jobs kept for status lookups
+MAX_FINISHED_JOBS = 200
+
+JOB_QUEUED = "queued"
+JOB_PARSING = "parsing"
+JOB_EMBEDDING = "embedding"
+JOB_INDEXING = "indexing"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def parse_and_chunk(path):
+    """Reads a file and splits it into nodes. Runs in a worker process."""
+    from llama_index.core import SimpleDirectoryReader
+    from .faq_parser import FAQNodeParser
+
+    documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+    # Same parser as KnowledgeBaseManager.configure_settings(); a spawned worker
+    # does not share the parent's Settings
+    nodes = FAQNodeParser().get_nodes_from_documents(documents)
+    return documents, nodes
+
+
+class IngestionJob:
+    """Status of one queued document."""
+
+    def __init__(self, path):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.status = JOB_QUEUED
+        self.error = None
+        self.num_documents = 0
+        self.num_nodes = 0
+        self.embedded_nodes = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "file": os.path.basename(self.path),
+            "status": self.status,
+            "error": self.error,
+            "documents": self.num_documents,
+            "nodes": self.num_nodes,
+            "embedded_nodes": self.embedded_nodes,
+            "queued_seconds": round((self.started or time.time()) - self.created, 3),
+            "run_seconds": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+        }
+
+
+class IngestionQueue:
+    """Job queue that parses, embeds and indexes documents in the background."""
+
+    def __init__(
+        self,
+        knowledge_base,
+        parse_workers=DEFAULT_PARSE_WORKERS,
+        embed_batch_size=DEFAULT_EMBED_BATCH_SIZE,
+        max_concurrent_embed_batches=DEFAULT_MAX_CONCURRENT_EMBED_BATCHES,
+    ):
+        self.knowledge_base = knowledge_base
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.max_concurrent_embed_batches = max_concurrent_embed_batches
+
+        self._jobs = {}
+        self._queue = None
+        self._workers = []
+        self._index_lock = None
+        self._process_pool = None
+
+    def start(self):
+        """Starts the worker tasks on the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._index_lock = asyncio.Lock()
+        # spawn: the parent holds gRPC/HTTP client threads that must not be forked
+        self._process_pool = ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.parse_workers)]
+
+    async def stop(self):
+        """Stops the workers; queued jobs are abandoned."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    def submit(self, path):
+        """Queues a file for ingestion and returns its job."""
+        if not self._workers:
+            raise RuntimeError("IngestionQueue.start() has not been called")
+        job = IngestionJob(os.path.abspath(path))
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        self._forget_old_jobs()
+        logger.info(f"Queued ingestion job {job.id} for {path}")
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._ingest(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                logger.exception(f"Ingestion job {job.id} failed")
+            finally:
+                job.finished = time.time()
+                self._queue.task_done()
+
+    async def _ingest(self, job):
+        loop = asyncio.get_running_loop()
+        job.started = time.time()
+
+        job.status = JOB_PARSING
+        documents, nodes = await loop.run_in_executor(self._process_pool, parse_and_chunk, job.path)
+        job.num_documents = len(documents)
+        job.num_nodes = len(nodes)
+
+        job.status = JOB_EMBEDDING
+        await asyncio.to_thread(self.knowledge_base.configure_settings)
+        await self._embed_nodes(job, nodes)
+
+        async with self._index_lock:
+            job.status = JOB_INDEXING
+            await asyncio.to_thread(self.knowledge_base.add_parsed_document, job.path, documents, nodes)
+
+        job.status = JOB_DONE
+        logger.info(f"Ingestion job {job.id} done: {job.to_dict()}")
+
+    async def _embed_nodes(self, job, nodes):
+        """Embeds nodes in batches with a bounded number of batches in flight."""
+        from llama_index.core import Settings
+        from llama_index.core.schema import MetadataMode
+
+        embed_model = Settings.embed_model
+        semaphore = asyncio.Semaphore(self.max_concurrent_embed_batches)
+
+        async def embed_batch(batch):
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+            async with semaphore:
+                embeddings = await embed_model.aget_text_embedding_batch(texts)
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+            job.embedded_nodes += len(batch)
+
+        batches = [
+            nodes[start:start + self.embed_batch_size]
+            for start in range(0, len(nodes), self.embed_batch_size)
+        ]
+        await asyncio.gather(*(embed_batch(batch) for batch in batches))
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self._jobs.values() if job.finished is not None]
+        for job in sorted(finished, key=lambda j: j.finished)[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job.id]
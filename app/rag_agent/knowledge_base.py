@@ -1,69 +1,817 @@
 import os
+import asyncio
+import contextlib
+import hashlib
+import json
+import shutil
 import logging
-from llama_index.core import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
-    StorageContext,
-    load_index_from_storage,
-    Settings,
-)
-from llama_index.embeddings.gemini import GeminiEmbedding
-from llama_index.llms.gemini import Gemini
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: storage is not shared between processes there
+    fcntl = None
+
+# llama_index and the Gemini clients are imported on first use, not here, so
+# that importing this module (and the web app) stays fast
+from .answer_cache import AnswerCache
+from .lexical_index import LexicalIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bounds for queries issued from the event loop through aquery()
+DEFAULT_MAX_CONCURRENT_QUERIES = 4
+DEFAULT_QUERY_TIMEOUT_SECONDS = 20.0
+
+# "retrieve" returns the ranked chunks as text for the live model to ground on;
+# "synthesize" has the LlamaIndex LLM write an answer from them first
+QUERY_MODE_RETRIEVE = "retrieve"
+QUERY_MODE_SYNTHESIZE = "synthesize"
+QUERY_MODES = (QUERY_MODE_RETRIEVE, QUERY_MODE_SYNTHESIZE)
+
+# How a query was answered, reported to KnowledgeBaseManager.on_query
+QUERY_SOURCE_EXACT_CACHE = "exact_cache"
+QUERY_SOURCE_SEMANTIC_CACHE = "semantic_cache"
+QUERY_SOURCE_LEXICAL = "lexical"
+QUERY_SOURCE_HYBRID = "hybrid"
+
+# FAQ entries are indexed whole (see faq_parser.py), so one or two nodes
+# usually hold the full answer
+DEFAULT_SIMILARITY_TOP_K = 2
+
+# Hybrid retrieval: candidates taken from each of the BM25 and vector
+# retrievers, fused by reciprocal rank 1 / (RRF_K + rank)
+DEFAULT_HYBRID_CANDIDATES = 10
+RRF_K = 60
+# A BM25 result is trusted on its own, with no embedding call, when the top
+# node contains this share of the query terms, one of them at least this
+# rare (IDF 3 is about 1 node in 20), and outscores the runner-up by this factor
+DEFAULT_LEXICAL_MIN_COVERAGE = 0.75
+DEFAULT_LEXICAL_MIN_IDF = 3.0
+DEFAULT_LEXICAL_MIN_MARGIN = 1.5
+
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+
+# Who computes embeddings: "gemini" is the Gemini API, "hash" a deterministic
+# offline stand-in for tests and load runs (see embedding_batcher.py), which
+# also synthesizes with a MockLLM instead of Gemini. Either
+# way requests from all sessions are batched over a window of a few ms.
+EMBEDDING_BACKEND_GEMINI = "gemini"
+EMBEDDING_BACKEND_HASH = "hash"
+EMBEDDING_BACKENDS = (EMBEDDING_BACKEND_GEMINI, EMBEDDING_BACKEND_HASH)
+DEFAULT_EMBEDDING_BATCH_WINDOW_MS = 5.0
+
+# Where vectors are kept: "mmap" is a memory-mapped float32 matrix (see
+# mmap_vector_store.py), "simple" is LlamaIndex's JSON SimpleVectorStore.
+# Existing storage is always loaded in the format it was written in.
+VECTOR_STORE_MMAP = "mmap"
+VECTOR_STORE_SIMPLE = "simple"
+VECTOR_STORE_BACKENDS = (VECTOR_STORE_MMAP, VECTOR_STORE_SIMPLE)
+
+# Per-file hashes, mtimes and document ids, stored next to the index
+MANIFEST_FILENAME = "manifest.json"
+# Written into storage each time it is replaced; workers that see a value
+# other than the one they loaded reload the index
+STORAGE_VERSION_FILENAME = "storage_version"
+
+# Lifecycle of the index, reported by status()
+STATE_NOT_LOADED = "not_loaded"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# Per-chunk character budget in retrieval-only results; fits the longest FAQ entry
+MAX_CHUNK_CHARS = 1600
+
+
+def format_chunks(nodes, max_chars=MAX_CHUNK_CHARS):
+    """Formats retrieved chunks as compact text with scores and sources."""
+    if not nodes:
+        return "No relevant information found in the knowledge base."
+    lines = []
+    for rank, node_with_score in enumerate(nodes, start=1):
+        metadata = node_with_score.node.metadata or {}
+        source = metadata.get("file_name", "unknown")
+        if metadata.get("page_label"):
+            source += f" p.{metadata['page_label']}"
+        if metadata.get("section"):
+            # FAQ entries, see faq_parser.py
+            source += f" [{metadata['section']}]"
+        score = node_with_score.score
+        score_text = f"{score:.3f}" if score is not None else "n/a"
+        text = " ".join(node_with_score.node.get_content().split())
+        if len(text) > max_chars:
+            text = text[:max_chars].rstrip() + "..."
+        lines.append(f"[{rank}] score={score_text} source={source}\n{text}")
+    return "\n\n".join(lines)
+
+
 class KnowledgeBaseManager:
-    def __init__(self, storage_dir="./storage", documents_dir="./downloads"):
+    def __init__(
+        self,
+        storage_dir="./storage",
+        documents_dir="./downloads",
+        max_concurrent_queries=DEFAULT_MAX_CONCURRENT_QUERIES,
+        query_timeout=DEFAULT_QUERY_TIMEOUT_SECONDS,
+        similarity_top_k=DEFAULT_SIMILARITY_TOP_K,
+        answer_cache=None,
+        embedding_cache_dir="./embedding_cache",
+        hybrid_candidates=DEFAULT_HYBRID_CANDIDATES,
+        lexical_min_coverage=DEFAULT_LEXICAL_MIN_COVERAGE,
+        lexical_min_idf=DEFAULT_LEXICAL_MIN_IDF,
+        lexical_min_margin=DEFAULT_LEXICAL_MIN_MARGIN,
+        vector_store_backend=VECTOR_STORE_MMAP,
+        embedding_backend=EMBEDDING_BACKEND_GEMINI,
+        embedding_batch_window_ms=DEFAULT_EMBEDDING_BATCH_WINDOW_MS,
+    ):
+        if vector_store_backend not in VECTOR_STORE_BACKENDS:
+            raise ValueError(f"Unknown vector store backend: {vector_store_backend}")
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {embedding_backend}")
         self.storage_dir = storage_dir
         self.documents_dir = documents_dir
+        self.initial_doc_path = None
         self.index = None
+        # BM25 over the same nodes, swapped together with self.index
+        self.lexical_index = None
+        # path -> {"hash", "mtime", "size", "doc_ids"} for every indexed file;
+        # None for storage built before the manifest existed
+        self._manifest = None
+        # STORAGE_VERSION_FILENAME contents of the storage self.index came from
+        self._storage_version = None
+        self.query_timeout = query_timeout
+        self.similarity_top_k = similarity_top_k
+        self.hybrid_candidates = max(hybrid_candidates, similarity_top_k)
+        # None answers every query through hybrid retrieval
+        self.lexical_min_coverage = lexical_min_coverage
+        self.lexical_min_idf = lexical_min_idf
+        self.lexical_min_margin = lexical_min_margin
+        # Queries answered from BM25 alone vs. through hybrid retrieval
+        self.lexical_answers = 0
+        self.hybrid_answers = 0
+        # Optional callback on_query(mode, source, seconds), called after each query
+        self.on_query = None
+        self.embedding_cache_dir = embedding_cache_dir
+        self.vector_store_backend = vector_store_backend
+        self.embedding_backend = embedding_backend
+        self.embedding_batch_window_ms = embedding_batch_window_ms
+        # Shared by all query and ingestion threads, created with the settings
+        self.embedding_batcher = None
+        self._settings_configured = False
+        self._settings_lock = threading.Lock()
+        # Answers to repeated questions; cleared whenever the index changes
+        self.answer_cache = answer_cache if answer_cache is not None else AnswerCache()
+
+        # Bumped every time self.index is replaced; the cached retriever is
+        # rebuilt lazily when it lags behind it
+        self.index_version = 0
+        self._retriever = None
+        self._engine_version = -1
+        self._response_synthesizer = None
+        self._engine_lock = threading.Lock()
+        # Reentrant: updates load the index first if nothing has yet
+        self._build_lock = threading.RLock()
 
-        # Configure LlamaIndex settings
-        Settings.llm = Gemini(api_key=os.environ.get("GOOGLE_API_KEY"))
-        Settings.embed_model = GeminiEmbedding(api_key=os.environ.get("GOOGLE_API_KEY"), model_name="models/text-embedding-004")
+        # Blocking LlamaIndex calls run here, never on the event loop. The pool
+        # size is the concurrency limit for knowledge-base queries.
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_queries,
+            thread_name_prefix="kb-query",
+        )
+
+        # Startup progress, see status()
+        self.state = STATE_NOT_LOADED
+        self.progress = None
+        self.error = None
+        self.load_seconds = None
+        self._load_thread = None
+
+    def configure_settings(self):
+        """Configures LlamaIndex settings, importing the heavy libraries on first use."""
+        with self._settings_lock:
+            if self._settings_configured:
+                return
+            from llama_index.core import Settings
+            from .embedding_batcher import BatchedEmbedding, EmbeddingBatcher, GeminiBatchBackend, HashEmbeddingBackend
+            from .embedding_cache import CachedEmbedding, EmbeddingCache
+            from .faq_parser import FAQNodeParser
+
+            # One node per FAQ entry; other documents use the default splitter
+            Settings.node_parser = FAQNodeParser()
+            # The LLM is created on the first synthesize query, see _synthesizer();
+            # building, retrieval and retrieve mode never need it
+            if self.embedding_backend == EMBEDDING_BACKEND_HASH:
+                backend = HashEmbeddingBackend()
+            else:
+                backend = GeminiBatchBackend(EMBEDDING_MODEL_NAME, api_key=os.environ.get("GOOGLE_API_KEY"))
+            self.embedding_batcher = EmbeddingBatcher(backend, window_ms=self.embedding_batch_window_ms)
+            embed_model = BatchedEmbedding(self.embedding_batcher)
+            if self.embedding_cache_dir:
+                # Document vectors are reused across rebuilds; only new or changed chunks are embedded
+                embed_model = CachedEmbedding(embed_model, EmbeddingCache(self.embedding_cache_dir, backend.model_name))
+            Settings.embed_model = embed_model
+            self._settings_configured = True
+
+    @property
+    def is_ready(self):
+        return self.state == STATE_READY
+
+    def status(self):
+        """Reports the load state of the index for readiness probes."""
+        return {
+            "state": self.state,
+            "progress": self.progress if self.state == STATE_LOADING else None,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "index_version": self.index_version,
+            "lexical_answers": self.lexical_answers,
+            "hybrid_answers": self.hybrid_answers,
+            "embedding_batches": self.embedding_batcher.stats() if self.embedding_batcher else None,
+            "answer_cache": self.answer_cache.stats(),
+        }
+
+    def start_background_load(self, initial_doc_path="fsm-faq.md"):
+        """Loads or builds the index on a background thread and returns immediately."""
+        if self._load_thread is not None:
+            return
+        self.state = STATE_LOADING
+        self._load_thread = threading.Thread(
+            target=self._background_load,
+            args=(initial_doc_path,),
+            name="kb-load",
+            daemon=True,
+        )
+        self._load_thread.start()
+
+    def _background_load(self, initial_doc_path):
+        try:
+            self.build_index(initial_doc_path)
+        except Exception:
+            logger.exception("Knowledge base failed to load")
 
     def build_index(self, initial_doc_path="fsm-faq.md"):
         """Builds the vector store index from documents."""
+        with self._build_lock:
+            self.initial_doc_path = initial_doc_path
+            self.state = STATE_LOADING
+            start = time.perf_counter()
+            try:
+                self.configure_settings()
+                self._build_index(initial_doc_path)
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                raise
+            self.load_seconds = round(time.perf_counter() - start, 3)
+            self.state = STATE_READY
+            self.progress = None
+            self.error = None
+            logger.info(f"Knowledge base ready in {self.load_seconds}s")
+
+    def _ensure_index(self):
+        """Builds or loads the index if no thread has done it yet.
+
+        Once loaded, picks up storage that another worker has replaced since.
+        """
+        if self.index is not None:
+            self._reload_if_changed()
+            return
+        with self._build_lock:
+            if self.index is None:
+                self.build_index(self.initial_doc_path or "fsm-faq.md")
+
+    @contextlib.contextmanager
+    def _storage_lock(self):
+        """Serializes storage writes between worker processes that share storage_dir.
+
+        Without it every worker of a fresh deployment would build the index
+        itself; with it one builds and the others wait and load the result.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.storage_dir.rstrip("/\\") + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _build_index(self, initial_doc_path):
         logger.info("Building knowledge base index...")
+        with self._storage_lock():
+            self._build_or_load_index(initial_doc_path)
+
+    def _build_or_load_index(self, initial_doc_path):
         if not os.path.exists(self.storage_dir):
             logger.info("No existing storage found. Creating new index.")
-            # Load documents and create the index
-            # For initial build, we use the provided FAQ file
-            if os.path.exists(initial_doc_path):
-                documents = SimpleDirectoryReader(input_files=[initial_doc_path]).load_data()
-                logger.info(f"Loaded initial document: {initial_doc_path}")
-            else:
-                documents = []
-            
-            # Also load any documents already in the downloads directory
-            if os.path.exists(self.documents_dir):
-                documents.extend(SimpleDirectoryReader(self.documents_dir).load_data())
-                logger.info(f"Loaded documents from {self.documents_dir}")
-
-            if documents:
-                self.index = VectorStoreIndex.from_documents(documents)
-                self.index.storage_context.persist(persist_dir=self.storage_dir)
-                logger.info(f"Created and persisted index with {len(documents)} documents.")
-            else:
-                # Create an empty index if no documents are available
-                self.index = VectorStoreIndex.from_documents([])
-                self.index.storage_context.persist(persist_dir=self.storage_dir)
-                logger.info("Created and persisted an empty index.")
+            # Built aside and moved into place, so other processes never load a partial index
+            staging_dir = self.storage_dir.rstrip("/\\") + ".staging"
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self._create_index(staging_dir, self._source_paths(initial_doc_path))
+            self._replace_storage(staging_dir)
         else:
             # Load the existing index
             logger.info("Loading existing index from storage.")
-            storage_context = StorageContext.from_defaults(persist_dir=self.storage_dir)
-            self.index = load_index_from_storage(storage_context)
+            self.progress = "loading index from storage"
+            version = self._read_storage_version(self.storage_dir)
+            index = self._load_index(self.storage_dir)
+            lexical_index = LexicalIndex.load(self.storage_dir)
+            if lexical_index is None:
+                # Storage written before the lexical index existed
+                lexical_index = self._build_lexical_index(index)
+                lexical_index.save(self.storage_dir)
+            self._set_index(index, lexical_index)
+            self._manifest = self._load_manifest(self.storage_dir)
+            self._storage_version = version
             logger.info("Index loaded successfully.")
 
-    def query(self, query_text):
-        """Queries the knowledge base."""
-        if self.index is None:
-            self.build_index()
-        
-        logger.info(f"Querying knowledge base for: '{query_text}'")
-        query_engine = self.index.as_query_engine()
-        response = query_engine.query(query_text)
-        logger.info(f"Received response from knowledge base.")
-        return str(response)
+    def _reload_if_changed(self):
+        """Loads the storage again if another worker has replaced it.
+
+        Nothing blocks on the reload's behalf: the current index keeps serving
+        while storage is being written, and a load that overlapped a
+        replacement is discarded and retried by a later query.
+        """
+        version = self._read_storage_version(self.storage_dir)
+        if version is None or version == self._storage_version:
+            return
+        # A thread updating the index here loads the newer storage itself
+        if not self._build_lock.acquire(blocking=False):
+            return
+        try:
+            if version == self._storage_version:
+                return
+            try:
+                index = self._load_index(self.storage_dir)
+                lexical_index = LexicalIndex.load(self.storage_dir)
+                manifest = self._load_manifest(self.storage_dir)
+            except Exception as e:
+                logger.info(f"Storage changed while reloading the index, retrying later: {e}")
+                return
+            if self._read_storage_version(self.storage_dir) != version:
+                return
+            if lexical_index is None:
+                lexical_index = self._build_lexical_index(index)
+            # Also drops answers cached from the previous index
+            self._set_index(index, lexical_index)
+            self._manifest = manifest
+            self._storage_version = version
+            logger.info(f"Reloaded the index updated by another worker (storage version {version})")
+        finally:
+            self._build_lock.release()
+
+    @staticmethod
+    def _read_storage_version(persist_dir):
+        try:
+            with open(os.path.join(persist_dir, STORAGE_VERSION_FILENAME), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            # Storage written before versions existed, or being swapped right now
+            return None
+
+    def _source_paths(self, initial_doc_path):
+        """Lists the files that make up the knowledge base."""
+        # For initial build, we use the provided FAQ file
+        paths = []
+        if initial_doc_path and os.path.exists(initial_doc_path):
+            paths.append(os.path.abspath(initial_doc_path))
+
+        # Also use any documents in the downloads directory, which may be empty;
+        # top-level, non-hidden files, as SimpleDirectoryReader would pick
+        if os.path.isdir(self.documents_dir):
+            with os.scandir(self.documents_dir) as entries:
+                paths.extend(sorted(
+                    os.path.abspath(entry.path)
+                    for entry in entries
+                    if entry.is_file() and not entry.name.startswith(".")
+                ))
+        return paths
+
+    def _create_index(self, persist_dir, paths):
+        """Builds a fresh index from files, persists it and makes it current."""
+        from llama_index.core import Settings, VectorStoreIndex
+
+        documents = []
+        manifest = {}
+        for number, path in enumerate(paths, start=1):
+            self.progress = f"reading document {number}/{len(paths)}"
+            file_documents = self._read_file(path)
+            documents.extend(file_documents)
+            manifest[path] = self._manifest_entry(path, file_documents)
+            logger.info(f"Loaded document: {path}")
+
+        # An empty index is created if no documents are available
+        self.progress = f"embedding and indexing {len(documents)} documents"
+        index = VectorStoreIndex.from_documents(documents, storage_context=self._new_storage_context())
+        self.progress = "persisting index"
+        index.storage_context.persist(persist_dir=persist_dir)
+        lexical_index = self._build_lexical_index(index)
+        lexical_index.save(persist_dir)
+        self._save_manifest(persist_dir, manifest)
+        self._set_index(index, lexical_index)
+        self._manifest = manifest
+        logger.info(f"Created and persisted index with {len(documents)} documents.")
+        if hasattr(Settings.embed_model, "cache_stats"):
+            logger.info(f"Embedding cache: {Settings.embed_model.cache_stats()}")
+
+    def _new_storage_context(self):
+        from llama_index.core import StorageContext
+
+        if self.vector_store_backend == VECTOR_STORE_MMAP:
+            from .mmap_vector_store import MmapVectorStore
+            return StorageContext.from_defaults(vector_store=MmapVectorStore())
+        return StorageContext.from_defaults()
+
+    @staticmethod
+    def _load_index(persist_dir):
+        from llama_index.core import StorageContext, load_index_from_storage
+        from .mmap_vector_store import MmapVectorStore, is_persisted
+
+        vector_store = MmapVectorStore.from_persist_dir(persist_dir) if is_persisted(persist_dir) else None
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir, vector_store=vector_store)
+        return load_index_from_storage(storage_context)
+
+    @staticmethod
+    def _read_file(path):
+        # filename_as_id gives every document a stable id derived from its path,
+        # so the file's nodes can be found again when it changes
+        from llama_index.core import SimpleDirectoryReader
+
+        return SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+
+    @staticmethod
+    def _file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _manifest_entry(self, path, documents):
+        stat = os.stat(path)
+        return {
+            "hash": self._file_hash(path),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "doc_ids": [document.id_ for document in documents],
+        }
+
+    def _file_changed(self, path):
+        """Checks mtime and size first and only hashes the file if they differ."""
+        entry = self._manifest.get(path)
+        if entry is None:
+            return True
+        stat = os.stat(path)
+        if stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]:
+            return False
+        return self._file_hash(path) != entry["hash"]
+
+    @staticmethod
+    def _load_manifest(persist_dir):
+        manifest_path = os.path.join(persist_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            logger.info("Index has no document manifest; the next document change rebuilds it.")
+            return None
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_manifest(persist_dir, manifest):
+        with open(os.path.join(persist_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    #
+    # Incremental ingestion
+    #
+
+    def add_document(self, path):
+        """Indexes a new file, or re-indexes it if its content changed.
+
+        Returns "added", "updated" or "unchanged".
+        """
+        path = os.path.abspath(path)
+        with self._build_lock:
+            self._ensure_index()
+            if self._manifest is not None and not self._file_changed(path):
+                return "unchanged"
+            status = "updated" if self._manifest and path in self._manifest else "added"
+            self._apply_changes(upserts=[path])
+            return status
+
+    def add_parsed_document(self, path, documents, nodes):
+        """Indexes a file that was already read, chunked and embedded elsewhere.
+
+        Used by the background ingestion queue; nodes that carry an embedding
+        are inserted without another embedding call.
+        """
+        path = os.path.abspath(path)
+        with self._build_lock:
+            self._apply_changes(upserts=[path], parsed={path: (documents, nodes)})
+
+    def remove_document(self, path):
+        """Removes a file's nodes from the index. Returns False if it was not indexed."""
+        path = os.path.abspath(path)
+        with self._build_lock:
+            self._ensure_index()
+            if self._manifest is not None and path not in self._manifest:
+                return False
+            self._apply_changes(deletes=[path])
+            return True
+
+    def sync_documents(self):
+        """Brings the index in line with the files on disk, touching only what changed."""
+        with self._build_lock:
+            self._ensure_index()
+            paths = self._source_paths(self.initial_doc_path)
+            if self._manifest is None:
+                upserts, deletes = paths, []
+            else:
+                upserts = [path for path in paths if self._file_changed(path)]
+                deletes = [path for path in self._manifest if path not in paths]
+            if upserts or deletes:
+                self._apply_changes(upserts=upserts, deletes=deletes)
+            return {"upserted": len(upserts), "deleted": len(deletes)}
+
+    def _apply_changes(self, upserts=(), deletes=(), parsed=None):
+        """Applies document changes to a copy of the index and swaps it in.
+
+        Queries keep using the current index until the updated copy has been
+        persisted. Caller holds self._build_lock.
+        """
+        self._ensure_index()
+        with self._storage_lock():
+            self._apply_changes_locked(upserts, deletes, parsed)
+
+    def _apply_changes_locked(self, upserts, deletes, parsed):
+        staging_dir = self.storage_dir.rstrip("/\\") + ".staging"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+        # Read back from storage: another worker may have changed it since this one loaded it
+        manifest = self._load_manifest(self.storage_dir) if self.index is not None else None
+        if manifest is None:
+            # No usable manifest: rebuild everything once, then go incremental
+            paths = self._source_paths(self.initial_doc_path)
+            paths.extend(path for path in upserts if path not in paths)
+            paths = [path for path in paths if path not in deletes]
+            self._create_index(staging_dir, paths)
+            self._replace_storage(staging_dir)
+            return
+
+        index = self._load_index(self.storage_dir)
+        for path in list(deletes) + list(upserts):
+            for doc_id in manifest.pop(path, {}).get("doc_ids", []):
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        for path in upserts:
+            if parsed and path in parsed:
+                documents, nodes = parsed[path]
+                index.insert_nodes(nodes)
+                for document in documents:
+                    index.docstore.set_document_hash(document.id_, document.hash)
+            else:
+                documents = self._read_file(path)
+                for document in documents:
+                    index.insert(document)
+            manifest[path] = self._manifest_entry(path, documents)
+            logger.info(f"Indexed {len(documents)} documents from {path}")
+
+        index.storage_context.persist(persist_dir=staging_dir)
+        lexical_index = self._build_lexical_index(index)
+        lexical_index.save(staging_dir)
+        self._save_manifest(staging_dir, manifest)
+        self._replace_storage(staging_dir)
+        self._set_index(index, lexical_index)
+        self._manifest = manifest
+        logger.info(f"Applied {len(upserts)} upserts and {len(deletes)} deletes to the index.")
+
+    def _replace_storage(self, staging_dir):
+        """Moves a fully written staging directory into place of the storage directory.
+
+        Stamps it with a new storage version, which tells the other workers to reload.
+        """
+        version = str(time.time_ns())
+        with open(os.path.join(staging_dir, STORAGE_VERSION_FILENAME), "w", encoding="utf-8") as f:
+            f.write(version)
+        old_dir = self.storage_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.storage_dir):
+            os.replace(self.storage_dir, old_dir)
+        os.replace(staging_dir, self.storage_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self._storage_version = version
+
+    @staticmethod
+    def _build_lexical_index(index):
+        """Builds the BM25 index over the text nodes of a vector index.
+
+        FAQ question nodes are left out: their text is part of the answer node.
+        """
+        from .faq_parser import FAQ_ROLE_KEY, FAQ_ROLE_QUESTION
+
+        return LexicalIndex.build(
+            (node_id, node.get_content())
+            for node_id, node in index.docstore.docs.items()
+            if hasattr(node, "text") and node.metadata.get(FAQ_ROLE_KEY) != FAQ_ROLE_QUESTION
+        )
+
+    def _set_index(self, index, lexical_index):
+        """Swaps in a new index and invalidates the cached retriever."""
+        with self._engine_lock:
+            self.index = index
+            self.lexical_index = lexical_index
+            self.index_version += 1
+        self.answer_cache.invalidate(self._fingerprint(index))
+
+    @staticmethod
+    def _fingerprint(index):
+        """Identifies the indexed content, so persisted answers survive restarts only if it is unchanged."""
+        doc_hashes = index.docstore.get_all_document_hashes()
+        digest = hashlib.sha1()
+        for doc_hash, doc_id in sorted(doc_hashes.items()):
+            digest.update(f"{doc_id}:{doc_hash}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _snapshot(self):
+        """Returns the index, lexical index and retriever as one consistent set.
+
+        The retriever holds no per-query state, so one instance is shared by
+        all query threads; it is rebuilt only when the index changes.
+        """
+        with self._engine_lock:
+            self._refresh_engine()
+            return self.index, self.lexical_index, self._retriever
+
+    def _refresh_engine(self):
+        # Caller holds self._engine_lock
+        if self._retriever is None or self._engine_version != self.index_version:
+            # The vector side of hybrid retrieval; results are fused before synthesis
+            self._retriever = self.index.as_retriever(similarity_top_k=self.hybrid_candidates)
+            self._engine_version = self.index_version
+            logger.info(f"Built retriever for index version {self.index_version}")
+
+    def _synthesizer(self):
+        """Returns the response synthesizer, creating it and its LLM on first use.
+
+        Gemini() looks the model up over the network, so it is only created
+        once a synthesize query needs it; the offline hash backend gets a
+        MockLLM instead.
+        """
+        with self._settings_lock:
+            if self._response_synthesizer is None:
+                from llama_index.core import get_response_synthesizer
+
+                if self.embedding_backend == EMBEDDING_BACKEND_HASH:
+                    from llama_index.core.llms import MockLLM
+
+                    # A fixed-size answer; by default MockLLM echoes the prompt,
+                    # which grows past its context window over refine steps
+                    llm = MockLLM(max_tokens=256)
+                else:
+                    from llama_index.llms.gemini import Gemini
+
+                    llm = Gemini(api_key=os.environ.get("GOOGLE_API_KEY"))
+                self._response_synthesizer = get_response_synthesizer(llm=llm)
+            return self._response_synthesizer
+
+    def _lexical_confident(self, hits):
+        """True if the best BM25 hit is strong enough to answer without vector search."""
+        if self.lexical_min_coverage is None or not hits:
+            return False
+        best = hits[0]
+        if best.coverage < self.lexical_min_coverage:
+            return False
+        # Generic words ("complaint", "how to apply") match many nodes about
+        # equally well; only a rare term can single out the answer
+        if best.max_idf < self.lexical_min_idf:
+            return False
+        # A near-tie, even between nodes that all contain every term (such as
+        # a hotline number quoted in many entries), is left to vector search
+        return len(hits) == 1 or best.score >= self.lexical_min_margin * hits[1].score
+
+    def _fuse(self, index, lexical_hits, vector_nodes):
+        """Merges BM25 hits and vector results by reciprocal rank and returns the top-k."""
+        from llama_index.core.schema import NodeWithScore
+        from .faq_parser import ANSWER_NODE_ID_KEY, FAQ_ROLE_KEY, FAQ_ROLE_QUESTION
+
+        scores = {}
+        nodes = {}
+        for rank, hit in enumerate(lexical_hits, start=1):
+            scores[hit.node_id] = scores.get(hit.node_id, 0.0) + 1 / (RRF_K + rank)
+        for rank, node_with_score in enumerate(vector_nodes, start=1):
+            node = node_with_score.node
+            if node.metadata.get(FAQ_ROLE_KEY) == FAQ_ROLE_QUESTION:
+                # A matching FAQ question stands for its whole entry
+                node = index.docstore.get_node(node.metadata[ANSWER_NODE_ID_KEY])
+            node_id = node.node_id
+            nodes[node_id] = node
+            scores[node_id] = scores.get(node_id, 0.0) + 1 / (RRF_K + rank)
+        best = sorted(scores, key=scores.get, reverse=True)[:self.similarity_top_k]
+        return [
+            NodeWithScore(node=nodes.get(node_id) or index.docstore.get_node(node_id), score=scores[node_id])
+            for node_id in best
+        ]
+
+    def _lexical_search(self, snapshot, query_text):
+        lexical_index = snapshot[1]
+        if lexical_index is None:
+            return []
+        return lexical_index.search(query_text, self.hybrid_candidates)
+
+    def _retrieve(self, snapshot, query_text, lexical_hits, embedding=None):
+        """Hybrid retrieval over one snapshot; returns (nodes, embedding).
+
+        A confident BM25 result is returned as is and the query is never
+        embedded (embedding stays None); otherwise the query is embedded, if
+        it was not already, and vector results are fused with the BM25 hits.
+        """
+        from llama_index.core import Settings
+        from llama_index.core.schema import NodeWithScore, QueryBundle
+
+        index, _, retriever = snapshot
+        if embedding is None and self._lexical_confident(lexical_hits):
+            self.lexical_answers += 1
+            logger.info(f"Lexical match for: '{query_text}'")
+            return [
+                NodeWithScore(node=index.docstore.get_node(hit.node_id), score=hit.score)
+                for hit in lexical_hits[:self.similarity_top_k]
+            ], None
+
+        if embedding is None:
+            embedding = Settings.embed_model.get_query_embedding(query_text)
+        vector_nodes = retriever.retrieve(QueryBundle(query_text, embedding=embedding))
+        self.hybrid_answers += 1
+        return self._fuse(index, lexical_hits, vector_nodes), embedding
+
+    def retrieve(self, query_text, embedding=None):
+        """Returns the top-k chunks for a query, without any LLM call."""
+        self._ensure_index()
+
+        logger.info(f"Retrieving chunks for: '{query_text}'")
+        snapshot = self._snapshot()
+        lexical_hits = self._lexical_search(snapshot, query_text)
+        return self._retrieve(snapshot, query_text, lexical_hits, embedding)[0]
+
+    def query(self, query_text, mode=QUERY_MODE_SYNTHESIZE):
+        """Queries the knowledge base, answering repeated questions from the cache."""
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode: {mode}")
+        start = time.perf_counter()
+        answer, source = self._query(query_text, mode)
+        if self.on_query is not None:
+            self.on_query(mode, source, time.perf_counter() - start)
+        return answer
+
+    def _query(self, query_text, mode):
+        """Returns the answer and the QUERY_SOURCE_* that produced it."""
+        from llama_index.core import Settings
+        from llama_index.core.schema import QueryBundle
+
+        self._ensure_index()
+
+        cached = self.answer_cache.get_exact(query_text, mode)
+        if cached is not None:
+            logger.info(f"Answer cache hit for: '{query_text}'")
+            return cached, QUERY_SOURCE_EXACT_CACHE
+
+        # Taken before the snapshot: if the index is replaced after this, the
+        # answer below is not cached
+        generation = self.answer_cache.generation
+        # Exact-term questions are answered from BM25 before anything is embedded
+        snapshot = self._snapshot()
+        lexical_hits = self._lexical_search(snapshot, query_text)
+        embedding = None
+        if not self._lexical_confident(lexical_hits):
+            # The query embedding serves both the semantic cache lookup and retrieval
+            embedding = Settings.embed_model.get_query_embedding(query_text)
+        # Counts a miss when there is no embedding to compare
+        cached = self.answer_cache.get_semantic(embedding, mode)
+        if cached is not None:
+            return cached, QUERY_SOURCE_SEMANTIC_CACHE
+
+        nodes, embedding = self._retrieve(snapshot, query_text, lexical_hits, embedding)
+        source = QUERY_SOURCE_LEXICAL if embedding is None else QUERY_SOURCE_HYBRID
+        if mode == QUERY_MODE_RETRIEVE:
+            answer = format_chunks(nodes)
+        else:
+            logger.info(f"Querying knowledge base for: '{query_text}'")
+            response = self._synthesizer().synthesize(QueryBundle(query_text, embedding=embedding), nodes)
+            logger.info(f"Received response from knowledge base.")
+            answer = str(response)
+
+        self.answer_cache.put(query_text, mode, answer, embedding, generation)
+        return answer, source
+
+    async def aquery(self, query_text, timeout=None, mode=QUERY_MODE_SYNTHESIZE):
+        """Queries the knowledge base without blocking the event loop.
+
+        The query runs on a bounded thread pool. Raises asyncio.TimeoutError if
+        it takes longer than `timeout` seconds (default: self.query_timeout).
+        Cancelling the awaiting task abandons the query; a query that has not
+        started yet is dropped from the pool queue.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._query_executor, self.query, query_text, mode)
+        return await asyncio.wait_for(future, timeout or self.query_timeout)
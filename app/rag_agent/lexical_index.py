@@ -0,0 +1,133 @@
+"""In-process BM25 index over the knowledge-base nodes.
+
+Exact terms such as phone numbers, amounts ("10 մլն") and organization types
+are often missed by embedding search. This index scores nodes by Okapi BM25
+over the Armenian-aware terms from armenian.tokenize(); KnowledgeBaseManager
+fuses it with vector search by reciprocal rank. It is saved as one JSON file
+in the index storage directory and replaced together with the vector index.
+"""
+
+import json
+import logging
+import math
+import os
+from collections import Counter
+
+import numpy as np
+
+from .armenian import tokenize
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+FORMAT_VERSION = 1
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+class LexicalHit:
+    """A node id with its BM25 score, the share of query terms it contains and
+    the IDF of the rarest of them."""
+
+    def __init__(self, node_id, score, coverage, max_idf=0.0):
+        self.node_id = node_id
+        self.score = score
+        self.coverage = coverage
+        self.max_idf = max_idf
+
+
+class LexicalIndex:
+    """Okapi BM25 over (node id, text) pairs."""
+
+    def __init__(self, node_ids, term_frequencies, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.k1 = k1
+        self.b = b
+        self.node_ids = list(node_ids)
+        # One Counter of term -> count per node, aligned with node_ids
+        self._term_frequencies = term_frequencies
+
+        self._lengths = np.array([sum(tf.values()) for tf in term_frequencies], dtype=np.float32)
+        self._avg_length = float(self._lengths.mean()) if len(self._lengths) else 0.0
+        # term -> (rows, counts)
+        postings = {}
+        for row, tf in enumerate(term_frequencies):
+            for term, count in tf.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(row)
+                postings[term][1].append(count)
+        n = len(self.node_ids)
+        self._postings = {}
+        for term, (rows, counts) in postings.items():
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            self._postings[term] = (np.array(rows), np.array(counts, dtype=np.float32), idf)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @classmethod
+    def build(cls, items, **kwargs):
+        """Builds an index from (node id, text) pairs."""
+        node_ids = []
+        term_frequencies = []
+        for node_id, text in items:
+            node_ids.append(node_id)
+            term_frequencies.append(Counter(tokenize(text)))
+        return cls(node_ids, term_frequencies, **kwargs)
+
+    def search(self, query_text, top_k):
+        """Returns up to top_k LexicalHits, best first; nodes sharing no term are left out."""
+        terms = set(tokenize(query_text))
+        if not terms or not self.node_ids:
+            return []
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        matched = np.zeros(len(self.node_ids), dtype=np.int32)
+        max_idf = np.zeros(len(self.node_ids), dtype=np.float32)
+        norms = self.k1 * (1 - self.b + self.b * self._lengths / (self._avg_length or 1))
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, counts, idf = posting
+            scores[rows] += idf * counts * (self.k1 + 1) / (counts + norms[rows])
+            matched[rows] += 1
+            max_idf[rows] = np.maximum(max_idf[rows], idf)
+        candidates = np.flatnonzero(scores)
+        best = candidates[np.argsort(-scores[candidates], kind="stable")[:top_k]]
+        return [
+            LexicalHit(self.node_ids[row], float(scores[row]), matched[row] / len(terms), float(max_idf[row]))
+            for row in best
+        ]
+
+    def save(self, persist_dir):
+        data = {
+            "version": FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "node_ids": self.node_ids,
+            "term_frequencies": [dict(tf) for tf in self._term_frequencies],
+        }
+        path = os.path.join(persist_dir, LEXICAL_INDEX_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, persist_dir):
+        """Loads a saved index, or returns None if there is none usable."""
+        path = os.path.join(persist_dir, LEXICAL_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable lexical index {path}: {e}")
+            return None
+        if data.get("version") != FORMAT_VERSION:
+            return None
+        return cls(
+            data["node_ids"],
+            [Counter(tf) for tf in data["term_frequencies"]],
+            k1=data["k1"],
+            b=data["b"],
+        )
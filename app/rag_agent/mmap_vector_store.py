@@ -0,0 +1,252 @@
+"""LlamaIndex vector store backed by a memory-mapped float32 matrix.
+
+The default SimpleVectorStore persists every embedding as JSON text, parses
+all of it on startup, keeps it as Python lists and scores queries in a Python
+loop. This store keeps unit-normalized vectors in one raw float32 file that is
+memory-mapped read-only, so loading costs almost nothing, memory grows only
+with the pages actually touched, and uvicorn workers on one host share a
+single copy through the OS page cache. Cosine similarity is one matrix-vector
+product.
+
+Files, next to the other files of the storage directory:
+
+    default__vector_store.f32        float32 matrix, one unit-length row per node
+    default__vector_store.meta.json  dim, node ids, ref doc ids, node metadata
+    default__vector_store.ivf.npz    optional approximate index (see below)
+
+Past `ann_threshold` rows, persist() also clusters the rows with k-means and
+stores them grouped by cluster; a query then scores only the rows of the
+`ann_nprobe` clusters nearest to it (an IVF index). Below the threshold every
+query is exact.
+
+Text lives in the docstore, as with SimpleVectorStore (stores_text=False).
+Vectors added after loading are held in memory until the next persist().
+"""
+
+import json
+import logging
+import os
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import build_metadata_filter_fn, node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+DEFAULT_PERSIST_FNAME = "default__vector_store"
+VECTORS_SUFFIX = ".f32"
+META_SUFFIX = ".meta.json"
+IVF_SUFFIX = ".ivf.npz"
+
+# Rows from which persist() builds the approximate index; None disables it
+DEFAULT_ANN_THRESHOLD = 20000
+DEFAULT_ANN_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 50000
+
+
+def _base_path(persist_path):
+    # StorageContext.persist passes ".../default__vector_store.json"
+    return persist_path[:-len(".json")] if persist_path.endswith(".json") else persist_path
+
+
+def is_persisted(persist_dir):
+    """True if persist_dir holds a vector store written by this class."""
+    return os.path.exists(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME + META_SUFFIX))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _kmeans(matrix, clusters, seed=0):
+    """Spherical k-means on (a sample of) unit rows; returns the centroids."""
+    rng = np.random.default_rng(seed)
+    sample = matrix
+    if len(matrix) > KMEANS_SAMPLE_SIZE:
+        sample = matrix[np.sort(rng.choice(len(matrix), KMEANS_SAMPLE_SIZE, replace=False))]
+    centroids = np.array(sample[rng.choice(len(sample), clusters, replace=False)])
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store over a memory-mapped float32 matrix with a JSON sidecar."""
+
+    stores_text: bool = False
+    ann_threshold: Optional[int] = DEFAULT_ANN_THRESHOLD
+    ann_nprobe: int = DEFAULT_ANN_NPROBE
+
+    _matrix: Any = PrivateAttr(default=None)
+    _node_ids: Any = PrivateAttr(default_factory=list)
+    _ref_doc_ids: Any = PrivateAttr(default_factory=list)
+    _metadata: Any = PrivateAttr(default_factory=list)
+    _row_of: Any = PrivateAttr(default_factory=dict)
+    # IVF index: centroids and, per cluster, the [start, end) rows it covers
+    _centroids: Any = PrivateAttr(default=None)
+    _offsets: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def num_vectors(self):
+        # Not __len__: StorageContext tests the store for truthiness
+        return len(self._node_ids)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, **kwargs):
+        """Maps a persisted store; returns an empty store if there is none."""
+        store = cls(**kwargs)
+        store._load(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+        return store
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = _normalize(np.array([node.get_embedding() for node in nodes], dtype=np.float32))
+        # Replacing a node keeps one row for it
+        self._remove_rows([self._row_of[node.node_id] for node in nodes if node.node_id in self._row_of])
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            metadata.pop("_node_content", None)
+            self._row_of[node.node_id] = len(self._node_ids)
+            self._node_ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "None")
+            self._metadata.append(metadata)
+        # Leaves the read-only mapping for an in-memory copy
+        self._matrix = vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+        self._centroids = self._offsets = None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._remove_rows([row for row, ref in enumerate(self._ref_doc_ids) if ref == ref_doc_id])
+
+    def _remove_rows(self, rows):
+        if not rows:
+            return
+        keep = np.ones(len(self._node_ids), dtype=bool)
+        keep[rows] = False
+        self._matrix = np.array(self._matrix[keep])
+        self._node_ids = [v for v, k in zip(self._node_ids, keep) if k]
+        self._ref_doc_ids = [v for v, k in zip(self._ref_doc_ids, keep) if k]
+        self._metadata = [v for v, k in zip(self._metadata, keep) if k]
+        self._row_of = {node_id: row for row, node_id in enumerate(self._node_ids)}
+        self._centroids = self._offsets = None
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+        if not self._node_ids or query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        rows = self._candidate_rows(vector)
+        if query.filters is not None or query.node_ids is not None:
+            allowed = set(query.node_ids) if query.node_ids is not None else None
+            filter_fn = build_metadata_filter_fn(lambda node_id: self._metadata[self._row_of[node_id]], query.filters)
+            rows = np.array([
+                row for row in (rows if rows is not None else range(len(self._node_ids)))
+                if (allowed is None or self._node_ids[row] in allowed) and filter_fn(self._node_ids[row])
+            ], dtype=np.int64)
+
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        similarities = matrix @ vector
+        top_k = min(query.similarity_top_k, len(similarities))
+        if top_k == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        best = np.argpartition(-similarities, top_k - 1)[:top_k]
+        best = best[np.argsort(-similarities[best])]
+        best_rows = best if rows is None else rows[best]
+        return VectorStoreQueryResult(
+            similarities=[float(similarities[i]) for i in best],
+            ids=[self._node_ids[row] for row in best_rows],
+        )
+
+    def _candidate_rows(self, vector):
+        """Rows of the nearest IVF clusters, or None to score every row."""
+        if self._centroids is None:
+            return None
+        nprobe = min(self.ann_nprobe, len(self._centroids))
+        nearest = np.argpartition(-(self._centroids @ vector), nprobe - 1)[:nprobe]
+        return np.concatenate([
+            np.arange(self._offsets[cluster], self._offsets[cluster + 1]) for cluster in nearest
+        ])
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        base = _base_path(persist_path)
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        matrix = np.zeros((0, 0), dtype=np.float32) if self._matrix is None else np.asarray(self._matrix)
+        order = np.arange(len(self._node_ids))
+        centroids = offsets = None
+        if self.ann_threshold is not None and len(order) >= self.ann_threshold:
+            clusters = max(1, int(np.sqrt(len(order))))
+            centroids = _kmeans(matrix, clusters)
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            # Group rows by cluster so each cluster is one contiguous slice
+            order = np.argsort(assignment, kind="stable")
+            offsets = np.searchsorted(assignment[order], np.arange(clusters + 1))
+
+        with open(base + VECTORS_SUFFIX, "wb") as f:
+            f.write(np.ascontiguousarray(matrix[order], dtype=np.float32).tobytes())
+        with open(base + META_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "dim": int(matrix.shape[1]) if len(order) else None,
+                "node_ids": [self._node_ids[row] for row in order],
+                "ref_doc_ids": [self._ref_doc_ids[row] for row in order],
+                "metadata": [self._metadata[row] for row in order],
+            }, f, ensure_ascii=False)
+        if centroids is not None:
+            np.savez(base + IVF_SUFFIX, centroids=centroids, offsets=offsets)
+        elif os.path.exists(base + IVF_SUFFIX):
+            os.remove(base + IVF_SUFFIX)
+
+    def _load(self, base):
+        if not os.path.exists(base + META_SUFFIX):
+            return
+        with open(base + META_SUFFIX, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format in {base + META_SUFFIX}")
+        self._node_ids = meta["node_ids"]
+        self._ref_doc_ids = meta["ref_doc_ids"]
+        self._metadata = meta["metadata"]
+        self._row_of = {node_id: row for row, node_id in enumerate(self._node_ids)}
+        if self._node_ids:
+            self._matrix = np.memmap(
+                base + VECTORS_SUFFIX, dtype=np.float32, mode="r", shape=(len(self._node_ids), meta["dim"])
+            )
+        if os.path.exists(base + IVF_SUFFIX):
+            with np.load(base + IVF_SUFFIX) as ivf:
+                self._centroids = ivf["centroids"]
+                self._offsets = ivf["offsets"]
+        logger.info(
+            f"Mapped {len(self._node_ids)} vectors from {base + VECTORS_SUFFIX}"
+            + (f" with {len(self._centroids)} IVF clusters" if self._centroids is not None else "")
+        )
@@ -0,0 +1,167 @@
+"""Speculative knowledge-base lookups from partial input transcripts.
+
+While the user is still talking the Live API streams transcript fragments.
+QueryPrefetcher waits until a session's transcript has held still for a
+short moment, then queries the knowledge base with it. When the model calls
+query_docs with a query that matches those words, the tool returns the
+prefetched answer (or waits for the rest of it) instead of starting from
+scratch. A prefetch whose transcript grew before it finished is cancelled
+and restarted on the newer text; one that was never asked for is dropped at
+the end of the turn. Prefetch answers also land in the answer cache, so a
+rephrased query_docs call can still hit it semantically.
+"""
+
+import asyncio
+import logging
+import time
+
+from .armenian import tokenize
+
+logger = logging.getLogger(__name__)
+
+# The transcript must hold still this long before it is looked up
+DEFAULT_STABLE_MS = 300
+# Transcripts with fewer content terms than this are not worth a lookup
+DEFAULT_MIN_TERMS = 2
+# Share of the query's terms that must appear in the prefetched transcript
+DEFAULT_MIN_MATCH = 0.6
+
+# Outcomes reported to QueryPrefetcher.on_prefetch
+PREFETCH_STARTED = "started"
+PREFETCH_HIT = "hit"
+PREFETCH_MISS = "miss"
+PREFETCH_CANCELLED = "cancelled"
+PREFETCH_UNUSED = "unused"
+
+
+class _Prefetch:
+    __slots__ = ("text", "terms", "task", "started", "finished")
+
+    def __init__(self, text, terms):
+        self.text = text
+        self.terms = terms
+        self.task = None
+        # perf_counter times of the knowledge-base query, not of the debounce
+        self.started = None
+        self.finished = None
+
+
+class QueryPrefetcher:
+    """Prefetches knowledge-base answers for the utterance each session is speaking."""
+
+    def __init__(
+        self,
+        knowledge_base,
+        mode,
+        stable_ms=DEFAULT_STABLE_MS,
+        min_terms=DEFAULT_MIN_TERMS,
+        min_match=DEFAULT_MIN_MATCH,
+    ):
+        self.knowledge_base = knowledge_base
+        self.mode = mode
+        self.stable_seconds = stable_ms / 1000
+        self.min_terms = min_terms
+        self.min_match = min_match
+        self.counts = dict.fromkeys(
+            (PREFETCH_STARTED, PREFETCH_HIT, PREFETCH_MISS, PREFETCH_CANCELLED, PREFETCH_UNUSED), 0
+        )
+        self.saved_seconds = 0.0
+        # Optional callback on_prefetch(outcome, saved_seconds)
+        self.on_prefetch = None
+        # session_id -> transcript of the current utterance so far
+        self._transcripts = {}
+        # session_id -> _Prefetch for the latest stable transcript
+        self._prefetches = {}
+
+    def stats(self):
+        answered = self.counts[PREFETCH_HIT] + self.counts[PREFETCH_MISS]
+        return {
+            **self.counts,
+            "hit_rate": round(self.counts[PREFETCH_HIT] / answered, 2) if answered else None,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def observe(self, session_id, fragment):
+        """Adds an input transcript fragment and reschedules the session's prefetch."""
+        text = self._transcripts.get(session_id, "") + fragment
+        self._transcripts[session_id] = text
+        terms = set(tokenize(text))
+        current = self._prefetches.get(session_id)
+        if current is not None and current.terms == terms:
+            return
+        if current is not None:
+            # Stale: the user has said more since
+            self._cancel(current, PREFETCH_CANCELLED)
+        if len(terms) < self.min_terms:
+            self._prefetches.pop(session_id, None)
+            return
+        prefetch = _Prefetch(text, terms)
+        prefetch.task = asyncio.ensure_future(self._run(prefetch))
+        self._prefetches[session_id] = prefetch
+
+    async def _run(self, prefetch):
+        await asyncio.sleep(self.stable_seconds)
+        self._report(PREFETCH_STARTED)
+        logger.info(f"Prefetching knowledge base for: '{prefetch.text}'")
+        prefetch.started = time.perf_counter()
+        try:
+            return await self.knowledge_base.aquery(prefetch.text, mode=self.mode)
+        finally:
+            prefetch.finished = time.perf_counter()
+
+    async def take(self, session_id, query):
+        """Returns the prefetched answer if it matches the query, else None.
+
+        Waits for a matching prefetch that is still running. A failed
+        prefetch counts as a miss; the caller then queries as usual.
+        """
+        prefetch = self._prefetches.pop(session_id, None)
+        if prefetch is None:
+            return None
+        query_terms = set(tokenize(query))
+        matched = len(query_terms & prefetch.terms)
+        if not query_terms or matched / len(query_terms) < self.min_match or prefetch.started is None:
+            # Different words, or the transcript was still settling: query as usual
+            self._cancel(prefetch)
+            self._report(PREFETCH_MISS)
+            return None
+        asked = time.perf_counter()
+        try:
+            answer = await asyncio.shield(prefetch.task)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                prefetch.task.cancel()
+                raise
+            self._report(PREFETCH_MISS)
+            return None
+        except Exception as e:
+            logger.info(f"Prefetch for '{prefetch.text}' failed: {e}")
+            self._report(PREFETCH_MISS)
+            return None
+        saved = min(asked, prefetch.finished) - prefetch.started
+        logger.info(f"Prefetch hit for '{query}', {saved * 1000:.0f} ms saved")
+        self._report(PREFETCH_HIT, saved)
+        return answer
+
+    def end_turn(self, session_id):
+        """Forgets the utterance and drops its prefetch if query_docs never asked for it."""
+        self._transcripts.pop(session_id, None)
+        prefetch = self._prefetches.pop(session_id, None)
+        if prefetch is not None:
+            self._cancel(prefetch, PREFETCH_UNUSED)
+
+    def _cancel(self, prefetch, outcome=None):
+        """Stops a prefetch; outcome is reported if its lookup had started."""
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+        elif not prefetch.task.cancelled():
+            # Retrieve the exception, if any, so it is not logged as never retrieved
+            prefetch.task.exception()
+        if outcome is not None and prefetch.started is not None:
+            self._report(outcome)
+
+    def _report(self, outcome, saved_seconds=0.0):
+        self.counts[outcome] += 1
+        self.saved_seconds += saved_seconds
+        if self.on_prefetch is not None:
+            self.on_prefetch(outcome, saved_seconds)
@@ -0,0 +1,316 @@
+"""Process-wide ADK runners and session reuse for the WebSocket endpoint.
+
+A Runner is built once per agent and every Runner shares one session service,
+so a user who reconnects gets their existing ADK session back instead of a
+cold one. Idle sessions expire after a TTL and the number of tracked sessions
+is bounded; least recently used idle sessions are evicted first.
+
+Sessions are kept in memory by default. With a database URL (see
+create_session_service) they live in a store shared by every worker process,
+and a user who reconnects to a different worker resumes their latest session
+from it.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.memory import InMemoryMemoryService
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.adk.sessions.base_session_service import GetSessionConfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TTL_SECONDS = 30 * 60
+DEFAULT_MAX_SESSIONS = 1000
+
+
+def create_session_service(db_url=None):
+    """Returns an in-memory session service, or a database-backed one for a SQLAlchemy URL.
+
+    "sqlite:///./sessions.db" shares sessions between the workers of one
+    host; a server database such as PostgreSQL shares them between hosts.
+    """
+    if not db_url or db_url == "memory":
+        return InMemorySessionService()
+    # Needs sqlalchemy (and the driver for the URL); only imported when used
+    from google.adk.sessions import DatabaseSessionService
+    from sqlalchemy.exc import OperationalError
+
+    logger.info(f"Using database session service at {db_url.split('@')[-1]}")
+    try:
+        return DatabaseSessionService(db_url)
+    except OperationalError:
+        # Workers started together race to create the tables; the tables exist now
+        logger.info("Session tables were created by another worker; connecting again")
+        return DatabaseSessionService(db_url)
+
+
+class RunnerRegistry:
+    """Builds one Runner per agent and shares the services between them."""
+
+    def __init__(self, app_name, session_service=None):
+        self.app_name = app_name
+        self.session_service = session_service or InMemorySessionService()
+        self.artifact_service = InMemoryArtifactService()
+        self.memory_service = InMemoryMemoryService()
+        self._runners = {}
+
+    def get_runner(self, agent):
+        """Returns the shared Runner for an agent, creating it on first use."""
+        runner = self._runners.get(agent.name)
+        if runner is None:
+            runner = Runner(
+                app_name=self.app_name,
+                agent=agent,
+                session_service=self.session_service,
+                artifact_service=self.artifact_service,
+                memory_service=self.memory_service,
+            )
+            self._runners[agent.name] = runner
+            logger.info(f"Created runner for agent '{agent.name}'")
+        return runner
+
+
+class _SessionEntry:
+    """Bookkeeping for one tracked ADK session."""
+
+    def __init__(self, user_id, session_id):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.last_used = time.monotonic()
+        # Wall-clock time of last use, comparable with Session.last_update_time
+        self.last_used_wall = time.time()
+        self.connections = 0
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        self.last_used_wall = time.time()
+
+
+class SessionManager:
+    """Creates, looks up, reuses and expires ADK sessions per (agent, user)."""
+
+    def __init__(
+        self,
+        session_service,
+        app_name,
+        ttl_seconds=DEFAULT_SESSION_TTL_SECONDS,
+        max_sessions=DEFAULT_MAX_SESSIONS,
+    ):
+        self.session_service = session_service
+        self.app_name = app_name
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # Other processes may use the same sessions; see _delete
+        self.shared = not isinstance(session_service, InMemorySessionService)
+        # (agent_name, user_id) -> _SessionEntry, least recently used first
+        self._entries = OrderedDict()
+        # Guards _entries only; store calls are made without it
+        self._lock = asyncio.Lock()
+        # (agent_name, user_id) -> [lock, users], while an acquire for the key runs
+        self._user_locks = {}
+        # Ids of evicted sessions whose store delete is still running
+        self._deleting = set()
+        # Store writes run one at a time: the database service inserts the
+        # app and user state rows on first use and concurrent inserts collide
+        self._write_lock = asyncio.Lock()
+
+    async def acquire(self, agent_name, user_id):
+        """Returns (session, resumed) for a user, reusing a live session if any.
+
+        Acquires for the same user run one at a time, so they share a session;
+        other users are not held up by their store lookups.
+        """
+        key = (agent_name, user_id)
+        async with self._user_lock(key):
+            async with self._lock:
+                expired = self._pop_expired(time.monotonic())
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Claimed before the store is read, so eviction leaves it alone
+                    entry.connections += 1
+                    entry.touch()
+                    self._entries.move_to_end(key)
+            await self._delete_all(expired)
+
+            if entry is not None:
+                try:
+                    session = await self._store(
+                        self.session_service.get_session,
+                        app_name=self.app_name,
+                        user_id=entry.user_id,
+                        session_id=entry.session_id,
+                    )
+                except BaseException:
+                    await self.release(agent_name, user_id)
+                    raise
+                if session is not None:
+                    return session, True
+                # Deleted from the store; forget it and look again
+                async with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+
+            session = None
+            if self.shared:
+                # The user may have been connected to another worker
+                session = await self._latest_stored_session(user_id)
+            resumed = session is not None
+            if session is None:
+                async with self._write_lock:
+                    session = await self._store(
+                        self.session_service.create_session,
+                        app_name=self.app_name,
+                        user_id=user_id,
+                    )
+
+            async with self._lock:
+                entry = _SessionEntry(user_id, session.id)
+                entry.connections = 1
+                self._entries[key] = entry
+            return session, resumed
+
+    @contextlib.asynccontextmanager
+    async def _user_lock(self, key):
+        holder = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        holder[1] += 1
+        try:
+            async with holder[0]:
+                yield
+        finally:
+            holder[1] -= 1
+            if holder[1] == 0:
+                del self._user_locks[key]
+
+    async def _store(self, method, **kwargs):
+        """Calls a session service method.
+
+        The database service's async methods do blocking SQLAlchemy I/O, so
+        they run to completion on a worker thread instead of the event loop.
+        """
+        if not self.shared:
+            return await method(**kwargs)
+        return await asyncio.to_thread(asyncio.run, method(**kwargs))
+
+    async def _latest_stored_session(self, user_id):
+        """The user's most recently updated session in the store, if it has not expired."""
+        response = await self._store(self.session_service.list_sessions, app_name=self.app_name, user_id=user_id)
+        listed = [session for session in response.sessions if session.id not in self._deleting]
+        if not listed:
+            return None
+        # Listed sessions carry no events, so only the most recently updated
+        # one is read in full to check its activity against the TTL
+        latest = max(listed, key=lambda session: session.last_update_time)
+        session = await self._store(
+            self.session_service.get_session,
+            app_name=self.app_name,
+            user_id=user_id,
+            session_id=latest.id,
+        )
+        if session is None or _last_activity(session) < time.time() - self.ttl_seconds:
+            return None
+        return session
+
+    async def release(self, agent_name, user_id):
+        """Marks a connection as finished; the session stays until it expires."""
+        async with self._lock:
+            entry = self._entries.get((agent_name, user_id))
+            if entry is not None:
+                entry.connections = max(0, entry.connections - 1)
+                entry.touch()
+
+    async def evict_expired(self):
+        """Drops idle sessions that outlived the TTL or the size bound."""
+        async with self._lock:
+            expired = self._pop_expired(time.monotonic())
+        await self._delete_all(expired)
+
+    async def run_eviction_loop(self, interval_seconds=60):
+        """Periodically evicts expired sessions until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                logger.warning(f"Session eviction failed: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop_expired(self, now):
+        """Untracks idle sessions past the TTL or the size bound and returns their entries.
+
+        Caller holds self._lock; the entries are then deleted from the store
+        with _delete_all, outside it.
+        """
+        idle = [(key, entry) for key, entry in self._entries.items() if entry.connections == 0]
+
+        expired = []
+        for key, entry in idle:
+            if now - entry.last_used > self.ttl_seconds:
+                del self._entries[key]
+                expired.append(entry)
+
+        # Enforce the size bound on the remaining idle sessions, oldest first
+        overflow = len(self._entries) - self.max_sessions
+        for key, entry in idle:
+            if overflow <= 0:
+                break
+            if key in self._entries:
+                del self._entries[key]
+                expired.append(entry)
+                overflow -= 1
+        return expired
+
+    async def _delete_all(self, entries):
+        for entry in entries:
+            await self._delete(entry)
+
+    async def _delete(self, entry):
+        self._deleting.add(entry.session_id)
+        try:
+            if self.shared and await self._used_elsewhere(entry):
+                logger.info(f"Session {entry.session_id} was resumed by another worker; no longer tracked here")
+                return
+            try:
+                async with self._write_lock:
+                    await self._store(
+                        self.session_service.delete_session,
+                        app_name=self.app_name,
+                        user_id=entry.user_id,
+                        session_id=entry.session_id,
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to delete session {entry.session_id}: {e}")
+            logger.info(f"Evicted session {entry.session_id} for user {entry.user_id}")
+        finally:
+            self._deleting.discard(entry.session_id)
+
+    async def _used_elsewhere(self, entry):
+        """True if the stored session changed after this process last used it."""
+        try:
+            session = await self._store(
+                self.session_service.get_session,
+                app_name=self.app_name,
+                user_id=entry.user_id,
+                session_id=entry.session_id,
+                config=GetSessionConfig(num_recent_events=1),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to look up session {entry.session_id}: {e}")
+            return False
+        return session is not None and _last_activity(session) > entry.last_used_wall
+
+
+def _last_activity(session):
+    """Wall-clock time of the session's latest event or state change.
+
+    Session.last_update_time alone is not enough: database stores only
+    advance it when an event changes state.
+    """
+    return max([session.last_update_time] + [event.timestamp for event in session.events])
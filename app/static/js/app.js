@@ -29,6 +29,16 @@ const ws_url =
 let websocket = null;
 let is_audio = false;
 
+// Binary audio framing (see audio_protocol.py): 12-byte little-endian header
+// [version u8][type u8][generation u16][seq u32][sample rate u32] + PCM16 payload
+const PROTOCOL_VERSION = 1;
+const FRAME_AUDIO = 1;
+const FRAME_HEADER_SIZE = 12;
+const INPUT_SAMPLE_RATE = 16000;
+let uplinkSeq = 0;
+// Audio generation of the agent's current speech; older frames were interrupted
+let audioGeneration = 0;
+
 // Get DOM elements
 const messagesDiv = document.getElementById("messages");
 const statusBar = document.getElementById("statusBar");
@@ -125,7 +135,10 @@ function hideLoadingIndicator() {
 // WebSocket handlers
 function connectWebsocket() {
   // Connect websocket
-  websocket = new WebSocket(ws_url + "?is_audio=" + is_audio);
+  websocket = new WebSocket(ws_url + "?is_audio=" + is_audio + "&protocol=binary");
+  websocket.binaryType = "arraybuffer";
+  uplinkSeq = 0;
+  audioGeneration = 0;
 
   // Handle connection open
   websocket.onopen = function () {
@@ -135,6 +148,12 @@ function connectWebsocket() {
 
   // Handle incoming messages
   websocket.onmessage = function (event) {
+    // Binary frames carry raw PCM audio
+    if (event.data instanceof ArrayBuffer) {
+      handleBinaryFrame(event.data);
+      return;
+    }
+
     // Parse the incoming message
     const message_from_server = JSON.parse(event.data);
     console.log("[AGENT TO CLIENT] ", message_from_server);
@@ -155,6 +174,21 @@ function connectWebsocket() {
       return;
     }
 
+    // Echo pings so the server can measure the round-trip time
+    if (message_from_server.ping !== undefined) {
+      sendMessage({ pong: message_from_server.ping });
+      return;
+    }
+
+    // Flush: the model was interrupted, stop playing its queued speech now
+    if (message_from_server.flush) {
+      audioGeneration = message_from_server.generation;
+      if (audioPlayerNode) {
+        audioPlayerNode.port.postMessage({ command: "endOfAudio" });
+      }
+      return;
+    }
+
     // Check for interrupt message
     if (
       message_from_server.interrupted &&
@@ -167,11 +201,6 @@ function connectWebsocket() {
       return;
     }
 
-    // If it's audio, play it
-    if (message_from_server.mime_type == "audio/pcm" && audioPlayerNode) {
-      audioPlayerNode.port.postMessage(base64ToArray(message_from_server.data));
-    }
-
     // If it's detailed analysis with chart data (JSON)
     if (message_from_server.mime_type == "application/json" && message_from_server.is_detailed_analysis) {
       try {
@@ -454,15 +483,43 @@ function sendMessage(message) {
   }
 }
 
-// Decode Base64 data to Array
-function base64ToArray(base64) {
-  const binaryString = window.atob(base64);
-  const len = binaryString.length;
-  const bytes = new Uint8Array(len);
-  for (let i = 0; i < len; i++) {
-    bytes[i] = binaryString.charCodeAt(i);
+// Send PCM audio as a binary frame
+function sendAudioFrame(pcmBytes) {
+  if (websocket && websocket.readyState == WebSocket.OPEN) {
+    websocket.send(encodeAudioFrame(pcmBytes));
+  }
+}
+
+// Prepend the binary frame header to a chunk of PCM audio
+function encodeAudioFrame(pcmBytes) {
+  const frame = new ArrayBuffer(FRAME_HEADER_SIZE + pcmBytes.byteLength);
+  const view = new DataView(frame);
+  view.setUint8(0, PROTOCOL_VERSION);
+  view.setUint8(1, FRAME_AUDIO);
+  view.setUint16(2, 0, true);
+  view.setUint32(4, uplinkSeq, true);
+  view.setUint32(8, INPUT_SAMPLE_RATE, true);
+  uplinkSeq = (uplinkSeq + 1) >>> 0;
+  new Uint8Array(frame, FRAME_HEADER_SIZE).set(pcmBytes);
+  return frame;
+}
+
+// Play the PCM payload of a binary frame from the server
+function handleBinaryFrame(buffer) {
+  const view = new DataView(buffer);
+  if (buffer.byteLength < FRAME_HEADER_SIZE || view.getUint8(0) !== PROTOCOL_VERSION) {
+    console.warn("[AGENT TO CLIENT] Ignoring malformed binary frame");
+    return;
+  }
+  if (view.getUint8(1) === FRAME_AUDIO && audioPlayerNode) {
+    // Drop audio of a generation that was already interrupted (16-bit wraparound)
+    const behind = (audioGeneration - view.getUint16(2, true)) & 0xffff;
+    if (behind > 0 && behind < 0x8000) {
+      return;
+    }
+    const pcm = buffer.slice(FRAME_HEADER_SIZE);
+    audioPlayerNode.port.postMessage(pcm, [pcm]);
   }
-  return bytes.buffer;
 }
 
 // Simple markdown renderer with mermaid support
@@ -653,11 +710,8 @@ function sendBufferedAudio() {
     offset += chunk.length;
   }
   
-  // Send the combined audio data
-  sendMessage({
-    mime_type: "audio/pcm",
-    data: arrayBufferToBase64(combinedBuffer.buffer),
-  });
+  // Send the combined audio data as a binary frame
+  sendAudioFrame(combinedBuffer);
   console.log("[CLIENT TO AGENT] sent %s bytes", combinedBuffer.byteLength);
   
   // Clear the buffer
@@ -677,17 +731,6 @@ function stopAudioRecording() {
   }
 }
 
-// Encode an array buffer with Base64
-function arrayBufferToBase64(buffer) {
-  let binary = "";
-  const bytes = new Uint8Array(buffer);
-  const len = bytes.byteLength;
-  for (let i = 0; i < len; i++) {
-    binary += String.fromCharCode(bytes[i]);
-  }
-  return window.btoa(binary);
-}
-
 const pdfUpload = document.getElementById("pdfUpload");
 
 pdfUpload.addEventListener("change", (event) => {
@@ -706,10 +749,37 @@ pdfUpload.addEventListener("change", (event) => {
     .then(response => response.json())
     .then(data => {
         console.log(data.message);
-        alert(data.message);
+        if (!data.job_id) {
+            alert(data.message);
+            return;
+        }
+        showStatus("📄 Indexing " + file.name + "...", "processing");
+        pollIngestionJob(data.job_id, file.name);
     })
     .catch(error => {
         console.error("Error uploading file:", error);
         alert("Error uploading file.");
     });
-});
\ No newline at end of file
+});
+
+// Poll an ingestion job until the document is indexed or fails
+function pollIngestionJob(jobId, fileName) {
+    fetch("/ingest/" + jobId)
+    .then(response => response.json())
+    .then(job => {
+        console.log("[INGEST]", job);
+        if (job.status === "done") {
+            hideStatus();
+            alert("File '" + fileName + "' indexed successfully.");
+        } else if (job.status === "failed" || !job.status) {
+            hideStatus();
+            alert("Error indexing file: " + (job.error || job.message));
+        } else {
+            setTimeout(() => pollIngestionJob(jobId, fileName), 1000);
+        }
+    })
+    .catch(error => {
+        console.error("Error checking ingestion job:", error);
+        hideStatus();
+    });
+}
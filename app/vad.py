@@ -0,0 +1,161 @@
+"""Energy-based voice activity detection for uplink audio.
+
+The browser streams microphone PCM for the whole call, silence included.
+SpeechGate sits between the WebSocket and the LiveRequestQueue: it measures
+the energy of every 20 ms of audio against an adaptive noise floor, forwards
+only speech (plus a short pre-roll before it and a hangover after it), and
+brackets each utterance with explicit activity start and end signals. The
+Live API's own activity detection is switched off in that mode (see
+`realtime_input_config`), so the end of an utterance is signalled as soon as
+the hangover has passed instead of after the model's own silence timeout.
+"""
+
+from collections import deque
+
+import numpy as np
+from google.genai import types
+
+from audio_protocol import INPUT_SAMPLE_RATE
+
+FRAME_MS = 20
+
+# Speech must last START_MS to open an utterance and silence SILENCE_MS to close it
+DEFAULT_START_MS = 60
+DEFAULT_SILENCE_MS = 500
+# Audio before the detected start that is forwarded too, so onsets are not clipped
+DEFAULT_PREROLL_MS = 200
+
+# Frame RMS (of int16 samples) above max(MIN_SPEECH_RMS, noise floor * SPEECH_RATIO) is speech
+DEFAULT_MIN_SPEECH_RMS = 300.0
+SPEECH_RATIO = 3.0
+# Per-frame smoothing of the noise floor: it drops quickly and rises slowly,
+# so a caller who talks from the first frame does not become the floor
+NOISE_FLOOR_FALL = 0.3
+NOISE_FLOOR_RISE = 0.01
+
+EVENT_START = "start"
+EVENT_AUDIO = "audio"
+EVENT_END = "end"
+
+
+def realtime_input_config():
+    """Live API input config for sessions whose activity is signalled by SpeechGate."""
+    return types.RealtimeInputConfig(
+        automatic_activity_detection=types.AutomaticActivityDetection(disabled=True),
+    )
+
+
+def frame_rms(pcm):
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+
+
+class SpeechGate:
+    """Turns a stream of 16-bit mono PCM into utterances with activity signals."""
+
+    def __init__(
+        self,
+        sample_rate=INPUT_SAMPLE_RATE,
+        start_ms=DEFAULT_START_MS,
+        silence_ms=DEFAULT_SILENCE_MS,
+        preroll_ms=DEFAULT_PREROLL_MS,
+        min_speech_rms=DEFAULT_MIN_SPEECH_RMS,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+        self.start_frames = max(1, start_ms // FRAME_MS)
+        self.silence_frames = max(1, silence_ms // FRAME_MS)
+        self.min_speech_rms = min_speech_rms
+        self.noise_floor = 0.0
+        self.speaking = False
+        # Seconds of audio classified as speech and as silence
+        self.speech_seconds = 0.0
+        self.silence_seconds = 0.0
+        self.forwarded_bytes = 0
+        self.trimmed_bytes = 0
+        self._pending = b""
+        self._preroll = deque(maxlen=max(1, preroll_ms // FRAME_MS))
+        self._speech_run = 0
+        self._silence_run = 0
+
+    @property
+    def hangover_seconds(self):
+        """How long after the last speech frame EVENT_END is emitted."""
+        return self.silence_frames * FRAME_MS / 1000
+
+    @property
+    def speech_ratio(self):
+        total = self.speech_seconds + self.silence_seconds
+        return self.speech_seconds / total if total else None
+
+    def process(self, pcm, sample_rate=None):
+        """Returns the (event, audio) pairs to forward for a chunk of PCM.
+
+        Events are EVENT_START, EVENT_AUDIO with the audio to forward, and
+        EVENT_END; audio is None for the start and end events. `sample_rate`
+        is the rate the client declared for this chunk, if it sent one.
+        """
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            self._set_sample_rate(sample_rate)
+        events = []
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        for offset in range(0, usable, self.frame_bytes):
+            self._frame(data[offset:offset + self.frame_bytes], events)
+        return events
+
+    def _set_sample_rate(self, sample_rate):
+        """Re-frames for audio at another rate.
+
+        Partial and pre-roll audio at the old rate is dropped rather than
+        forwarded under the new rate.
+        """
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+        self.trimmed_bytes += len(self._pending) + sum(len(frame) for frame in self._preroll)
+        self._pending = b""
+        self._preroll.clear()
+
+    def _frame(self, frame, events):
+        rms = frame_rms(frame)
+        is_speech = rms > max(self.min_speech_rms, self.noise_floor * SPEECH_RATIO)
+        if not is_speech:
+            # Track the background level only while nobody speaks
+            alpha = NOISE_FLOOR_FALL if rms < self.noise_floor else NOISE_FLOOR_RISE
+            self.noise_floor += alpha * (rms - self.noise_floor)
+
+        seconds = FRAME_MS / 1000
+        if is_speech:
+            self.speech_seconds += seconds
+        else:
+            self.silence_seconds += seconds
+
+        if not self.speaking:
+            self._speech_run = self._speech_run + 1 if is_speech else 0
+            if self._speech_run < self.start_frames:
+                if len(self._preroll) == self._preroll.maxlen:
+                    self.trimmed_bytes += len(self._preroll[0])
+                self._preroll.append(frame)
+                return
+            self.speaking = True
+            self._silence_run = 0
+            events.append((EVENT_START, None))
+            self._forward(b"".join(self._preroll) + frame, events)
+            self._preroll.clear()
+            return
+
+        self._forward(frame, events)
+        self._silence_run = 0 if is_speech else self._silence_run + 1
+        if self._silence_run >= self.silence_frames:
+            self.speaking = False
+            self._speech_run = 0
+            events.append((EVENT_END, None))
+
+    def _forward(self, audio, events):
+        self.forwarded_bytes += len(audio)
+        # One chunk in, at most one audio event out per utterance part
+        if events and events[-1][0] == EVENT_AUDIO:
+            events[-1] = (EVENT_AUDIO, events[-1][1] + audio)
+        else:
+            events.append((EVENT_AUDIO, audio))
@@ -2,11 +2,22 @@
 ## pip install -u google-genai==0.5.0 llama-index==0.12.11 llama-index-llms-gemini==0.4.3 llama-index-embeddings-gemini==0.3.1 websockets
 ##
 import asyncio
+import contextlib
+import copy
 import json
 import os
+import shutil
 import websockets
 from google import genai
 import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: run a single process there, writes are not locked
+    fcntl = None
 
 from llama_index.core import (
     VectorStoreIndex,
@@ -15,6 +26,7 @@ from llama_index.core import (
     load_index_from_storage,
     Settings,
 )
+from llama_index.core.ingestion import run_transformations
 
 from llama_index.embeddings.gemini import GeminiEmbedding
 from llama_index.llms.gemini import Gemini
@@ -35,30 +47,191 @@ client = genai.Client(
 gemini_embedding_model = GeminiEmbedding(api_key=gemini_api_key, model_name="models/text-embedding-004")
 
 llm = Gemini(api_key=gemini_api_key, model_name="models/gemini-2.0-flash-exp")
-     
-   
+
+Settings.llm = llm
+Settings.embed_model = gemini_embedding_model
+
+PERSIST_DIR = "./storage"
+# Every persist writes a complete new storage directory next to ./storage and
+# renames it into place; this file inside it names the version. Any other
+# process sharing ./storage reloads its index when the version changes.
+VERSION_FILE = os.path.join(PERSIST_DIR, "index_version")
+STAGING_DIR = PERSIST_DIR + ".staging"
+OLD_DIR = PERSIST_DIR + ".old"
+# Held by the process that builds or updates the index, so writes from
+# processes sharing ./storage never interleave
+LOCK_FILE = PERSIST_DIR + ".lock"
+
+# The index shared by every session, the query engine over it and the storage
+# version they were loaded from; replaced together, never modified in place
+_current = None
+_current_lock = threading.Lock()
+
+
+def read_index_version():
+    try:
+        with open(VERSION_FILE) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        # No storage yet, or it is being swapped right now
+        return None
+
+
+def persist_index(index):
+    """Writes the index to a staging directory and swaps it in for ./storage.
+
+    Readers find either the old storage or the new one, never a partial
+    write. Called with storage_lock() held; returns the new version.
+    """
+    version = str(time.time_ns())
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    index.storage_context.persist(persist_dir=STAGING_DIR)
+    with open(os.path.join(STAGING_DIR, os.path.basename(VERSION_FILE)), "w") as f:
+        f.write(version)
+    shutil.rmtree(OLD_DIR, ignore_errors=True)
+    if os.path.exists(PERSIST_DIR):
+        os.replace(PERSIST_DIR, OLD_DIR)
+    os.replace(STAGING_DIR, PERSIST_DIR)
+    shutil.rmtree(OLD_DIR, ignore_errors=True)
+    return version
+
+
+@contextlib.contextmanager
+def storage_lock():
+    """Serializes index writes between processes that share ./storage."""
+    if fcntl is None:
+        yield
+        return
+    with open(LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def build_index(doc_path="./downloads"):
-    # check if storage already exists
-    Settings.llm = llm
-    Settings.embed_model = gemini_embedding_model
-    PERSIST_DIR = "./storage"
+    """Creates and persists the index if there is no storage yet, else loads it from storage."""
     if not os.path.exists(PERSIST_DIR):
-        # load the documents and create the index
-        documents = SimpleDirectoryReader(doc_path).load_data()
-        
-        index = VectorStoreIndex.from_documents(documents)
-        # store it for later
-        index.storage_context.persist(persist_dir=PERSIST_DIR)
-    else:
-        # load the existing index
-        storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-        index = load_index_from_storage(storage_context)
-    return index
+        with storage_lock():
+            # Another process may have created it, or finished swapping it
+            # in, while this one waited
+            if not os.path.exists(PERSIST_DIR):
+                # load the documents and create the index
+                documents = SimpleDirectoryReader(doc_path).load_data()
+
+                index = VectorStoreIndex.from_documents(documents)
+                # store it for later
+                persist_index(index)
+                return index
+    # load the existing index
+    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
+    return load_index_from_storage(storage_context)
+
+
+def set_current_index(index, version):
+    global _current
+    # One assignment: a reader gets either the old index or the new one
+    _current = (index, index.as_query_engine(), version)
+
+
+def get_query_engine():
+    """Returns the query engine over the shared index, reloading it if storage has changed.
+
+    A load that fails or overlaps a swap is thrown away; the previous index
+    keeps serving and a later call tries again.
+    """
+    current = _current
+    version = read_index_version()
+    if current is not None and (version is None or version == current[2]):
+        return current[1]
+
+    with _current_lock:
+        while True:
+            current = _current
+            version = read_index_version()
+            if current is not None and (version is None or version == current[2]):
+                return current[1]
+            start = time.perf_counter()
+            try:
+                index = build_index()
+            except Exception as e:
+                if current is None:
+                    raise
+                print(f"Reloading the index failed, still serving version {current[2]}: {e}")
+                return current[1]
+            loaded_version = read_index_version()
+            if version is not None and loaded_version != version:
+                # Storage was replaced while it was loading
+                if current is not None:
+                    return current[1]
+                continue
+            set_current_index(index, loaded_version)
+            print(f"Loaded index version {_current[2]} in {time.perf_counter() - start:.2f}s")
+            return _current[1]
+
+
+def copy_latest_index():
+    """Returns a private copy of the latest stored index, for an update to modify.
+
+    Copied in memory when the current index is the stored version; loaded
+    from storage only if another process has replaced it since. Called with
+    storage_lock() held.
+    """
+    current = _current
+    if current is None or read_index_version() != current[2]:
+        return build_index()
+    # The stores' dicts are shared by to_dict(), hence the deep copy
+    storage_context = StorageContext.from_dict(copy.deepcopy(current[0].storage_context.to_dict()))
+    return load_index_from_storage(storage_context)
+
+
+def add_document_to_index(file_path):
+    """Indexes one file into a copy of the index and swaps the copy in once persisted."""
+    # Creates the storage first if there is none yet
+    get_query_engine()
+    # Stable ids derived from the file name let a re-upload replace the old nodes
+    documents = SimpleDirectoryReader(input_files=[file_path], filename_as_id=True).load_data()
+    # Only the new file is parsed and embedded, before taking the lock
+    nodes = run_transformations(documents, [*Settings.transformations, Settings.embed_model])
+    # Copy, insert and persist under the lock: an upload indexed by another
+    # process in between would otherwise be overwritten and lost
+    with storage_lock():
+        # Modify a private copy: queries keep using the current index meanwhile
+        index = copy_latest_index()
+        for document in documents:
+            index.delete_ref_doc(document.id_, delete_from_docstore=True)
+        index.insert_nodes(nodes)
+        for document in documents:
+            index.docstore.set_document_hash(document.id_, document.hash)
+        with _current_lock:
+            set_current_index(index, persist_index(index))
+    return len(documents)
+
+
+# One worker: uploads are indexed in the background, one at a time
+ingestion_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+# Keeps running ingestion tasks referenced until they finish
+ingestion_tasks = set()
+
+
+async def ingest_pdf(client_websocket, file_path, filename):
+    """Indexes an uploaded PDF off the event loop and reports back when done."""
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(ingestion_executor, add_document_to_index, file_path)
+        message = f"PDF file {filename} has been uploaded and indexed successfully."
+    except Exception as e:
+        message = f"Error indexing PDF file {filename}: {e}"
+    print(message)
+    try:
+        await client_websocket.send(json.dumps({"text": message}))
+    except websockets.exceptions.ConnectionClosed:
+        pass
 
 
 def query_docs(query):
-    index = build_index()
-    query_engine = index.as_query_engine()
+    query_engine = get_query_engine()
     response = query_engine.query(query)
     
     # Convert the response to a string
@@ -66,6 +239,56 @@ def query_docs(query):
     print(f"RAG response: {response_text}")
     return response_text
 
+# Local tools the model may call, by name
+TOOLS = {"query_docs": query_docs}
+# Longest a tool may run before the model gets an error response for it instead
+TOOL_TIMEOUT_SECONDS = {"query_docs": 10.0}
+DEFAULT_TOOL_TIMEOUT_SECONDS = 10.0
+
+# Blocking tools run here, never on the event loop
+tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tool")
+# name -> [calls, total seconds, timeouts, errors]
+tool_stats = {}
+
+
+async def run_tool_call(function_call):
+    """Runs one function call with its tool's timeout and returns the function response."""
+    name = function_call.name
+    timeout = TOOL_TIMEOUT_SECONDS.get(name, DEFAULT_TOOL_TIMEOUT_SECONDS)
+    stats = tool_stats.setdefault(name, [0, 0.0, 0, 0])
+    start = time.perf_counter()
+    tool = TOOLS.get(name)
+    if tool is None:
+        response = {"error": f"Unknown function {name}"}
+        stats[3] += 1
+    else:
+        loop = asyncio.get_running_loop()
+        args = function_call.args or {}
+        try:
+            # The worker thread is not interrupted on timeout; its result is discarded
+            result = await asyncio.wait_for(
+                loop.run_in_executor(tool_executor, lambda: tool(**args)), timeout
+            )
+            response = {"result": result}
+        except asyncio.TimeoutError:
+            response = {"error": f"{name} did not respond within {timeout:g} seconds."}
+            stats[2] += 1
+        except Exception as e:
+            response = {"error": f"{name} failed: {e}"}
+            stats[3] += 1
+    elapsed = time.perf_counter() - start
+    stats[0] += 1
+    stats[1] += elapsed
+    print(f"Tool {name} took {elapsed:.2f}s (average {stats[1] / stats[0]:.2f}s over {stats[0]} calls, "
+          f"{stats[2]} timeouts, {stats[3]} errors)")
+    return {"name": name, "response": response, "id": function_call.id}
+
+
+async def dispatch_tool_calls(function_calls):
+    """Runs independent function calls concurrently; a slow one only costs its own timeout."""
+    return list(await asyncio.gather(*(run_tool_call(function_call) for function_call in function_calls)))
+
+
 # Define the tool (function)
 tool_query_docs = {
     "function_declarations": [
@@ -132,14 +355,13 @@ async def gemini_session_handler(client_websocket: websockets.WebSocketServerPro
                                         
                                         print(f"Saved PDF file to {file_path}")
                                         
-                                        # Rebuild the index with the new PDF
-                                        if os.path.exists("./storage"):
-                                            import shutil
-                                            shutil.rmtree("./storage")
-                                        build_index()
+                                        # Index the new PDF in the background so audio keeps flowing
+                                        task = asyncio.create_task(ingest_pdf(client_websocket, file_path, filename))
+                                        ingestion_tasks.add(task)
+                                        task.add_done_callback(ingestion_tasks.discard)
                                         
                                         await client_websocket.send(json.dumps({
-                                            "text": f"PDF file {filename} has been uploaded and indexed successfully."
+                                            "text": f"PDF file {filename} has been uploaded, indexing started."
                                         }))
                                         
                         except Exception as e:
@@ -166,31 +388,9 @@ async def gemini_session_handler(client_websocket: websockets.WebSocketServerPro
                                           #handle the tool call
                                            print(f"Tool call received: {response.tool_call}")
 
-                                           function_calls = response.tool_call.function_calls
-                                           function_responses = []
-
-                                           for function_call in function_calls:
-                                                 name = function_call.name
-                                                 args = function_call.args
-                                                 # Extract the numeric part from Gemini's function call ID
-                                                 call_id = function_call.id
-
-                                                 # Validate function name
-                                                 if name == "query_docs":
-                                                      try:
-                                                          result = query_docs(args["query"])
-                                                          function_responses.append(
-                                                             {
-                                                                 "name": name,
-                                                                 "response": {"result": result},
-                                                                 "id": call_id  
-                                                             }
-                                                          ) 
-                                                          await client_websocket.send(json.dumps({"text": json.dumps(function_responses)}))
-                                                          print("Function executed")
-                                                      except Exception as e:
-                                                          print(f"Error executing function: {e}")
-                                                          continue
+                                           # Every call gets a response: a result, or an error if it failed or timed out
+                                           function_responses = await dispatch_tool_calls(response.tool_call.function_calls)
+                                           await client_websocket.send(json.dumps({"text": json.dumps(function_responses)}))
 
 
                                            # Send function response back to Gemini